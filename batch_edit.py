@@ -0,0 +1,181 @@
+"""
+批量编辑 raw 图的命令行入口，不依赖界面。
+
+按 JSON 编辑配方对目录下每个 raw 文件执行同样的编辑，多进程并行处理，每个文件输出一行结果。
+
+配方格式:
+    {
+        "mode": "GRAY",    # 可选，"GRAY" 写入灰度值，"RGB" 按拜耳位置写入对应通道值
+        "edits": [
+            {"type": "point", "x": 100, "y": 200, "size": 5, "value": 1023},
+            {"type": "stroke", "points": [[0, 0], [50, 80]], "size": 3, "value": [1023, 0, 0]},
+            {"type": "rect", "x": 10, "y": 10, "w": 4, "h": 4, "value": 0, "mode": "RGB"},
+            {"type": "defects", "file": "defects.csv"}
+        ]
+    }
+顶层也可以直接是编辑列表。value 为原始位深下的数值，单个数值等同于 [v, v, v]。
+defects 从缺陷列表或缺陷图写入缺陷像素 (格式见 widgets/defect_import.py)，相对路径相对于配方文件所在目录。
+
+用法:
+    python batch_edit.py recipe.json input_dir -o output_dir -j 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from widgets.raw_core import read_raw, save_raw, stroke_mask, apply_mask_on_raw
+from widgets.defect_import import load_defects, apply_defects
+
+edit_types = ("point", "stroke", "rect", "defects")
+
+
+def load_recipe(recipe_path):
+    """读取并检查编辑配方，返回 {"mode": ..., "edits": [...]}，格式错误时抛出 ValueError"""
+    with open(recipe_path, "r", encoding="utf-8") as f:
+        recipe = json.load(f)
+    if isinstance(recipe, list):
+        recipe = {"edits": recipe}
+    mode = recipe.get("mode", "GRAY")
+    edits = recipe.get("edits")
+    if mode not in ("GRAY", "RGB"):
+        raise ValueError(f"不支持的模式: {mode}")
+    if not isinstance(edits, list) or not edits:
+        raise ValueError("配方中没有编辑")
+    for i, edit in enumerate(edits):
+        edit_type = edit.get("type")
+        if edit_type not in edit_types:
+            raise ValueError(f"第 {i} 个编辑类型不支持: {edit_type}")
+        if edit_type == "defects":
+            if "file" not in edit:
+                raise ValueError(f"第 {i} 个编辑缺少 file")
+            edit["file"] = os.path.join(os.path.dirname(os.path.abspath(recipe_path)), edit["file"])
+            continue
+        if "value" not in edit:
+            raise ValueError(f"第 {i} 个编辑缺少 value")
+        if edit.get("mode", mode) not in ("GRAY", "RGB"):
+            raise ValueError(f"第 {i} 个编辑模式不支持: {edit['mode']}")
+        required = {"point": ("x", "y"), "stroke": ("points",), "rect": ("x", "y", "w", "h")}[edit_type]
+        missing = [key for key in required if key not in edit]
+        if missing:
+            raise ValueError(f"第 {i} 个编辑缺少 {', '.join(missing)}")
+    return {"mode": mode, "edits": edits}
+
+
+def edit_mask(edit, shape):
+    """把一条编辑转换为 (x0, y0, mask)，完全在图像外时返回 None"""
+    edit_type = edit["type"]
+    if edit_type == "rect":
+        x0, y0 = max(int(edit["x"]), 0), max(int(edit["y"]), 0)
+        x1 = min(int(edit["x"]) + int(edit["w"]), shape[1])
+        y1 = min(int(edit["y"]) + int(edit["h"]), shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, np.ones((y1 - y0, x1 - x0), dtype=bool)
+    points = [(edit["x"], edit["y"])] if edit_type == "point" else edit["points"]
+    return stroke_mask(points, int(edit.get("size", 1)), shape)
+
+
+def apply_recipe(raw_info, recipe):
+    """在 raw_info 的原始数据上依次执行配方中的编辑，返回被修改的像素数"""
+    raw_array = raw_info["raw_data"]
+    max_value = (1 << raw_info["bit_depth"]) - 1
+    changed = 0
+    for edit in recipe["edits"]:
+        if edit["type"] == "defects":
+            xs, ys, values = load_defects(edit["file"], raw_array.shape, raw_info["pattern"], raw_info["bit_depth"])
+            apply_defects(raw_array, xs, ys, values)
+            changed += len(xs)
+            continue
+        stroke = edit_mask(edit, raw_array.shape)
+        if stroke is None:
+            continue
+        x0, y0, mask = stroke
+        value = edit["value"]
+        color = tuple(value) if isinstance(value, (list, tuple)) else (value, value, value)
+        rect = apply_mask_on_raw(raw_array, x0, y0, mask, color, raw_info["pattern"],
+                                 edit.get("mode", recipe["mode"]), max_value)
+        if rect is not None:
+            changed += int(mask.sum())
+    return changed
+
+
+def process_file(raw_path, recipe, output_dir):
+    """处理单个文件，在子进程中运行，返回结果摘要"""
+    start = time.perf_counter()
+    result = {"file": raw_path, "ok": False, "pixels": 0, "output": "", "error": ""}
+    try:
+        raw_info = read_raw(raw_path)
+        if not raw_info:
+            result["error"] = "不支持的raw图类型"
+            return result
+        result["pixels"] = apply_recipe(raw_info, recipe)
+        output_path = os.path.join(output_dir, os.path.basename(raw_path))
+        save_raw(output_path, raw_info["raw_data"], raw_info["origin_type"], raw_info["row_stride"])
+        result["output"] = output_path
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def collect_raw_files(inputs):
+    """展开输入的文件和目录，返回所有 .raw 文件"""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(".raw"))
+        elif path.lower().endswith(".raw"):
+            files.append(path)
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按 JSON 配方批量编辑 raw 图")
+    parser.add_argument("recipe", help="编辑配方 JSON 文件")
+    parser.add_argument("inputs", nargs="+", help="raw 文件或包含 raw 文件的目录")
+    parser.add_argument("-o", "--output", required=True, help="输出目录，文件名与输入相同")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="并行进程数，默认为 CPU 核数")
+    parser.add_argument("--summary", help="把每个文件的结果写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    try:
+        recipe = load_recipe(args.recipe)
+    except (OSError, ValueError) as e:
+        print(f"配方无效: {e}", file=sys.stderr)
+        return 2
+    files = collect_raw_files(args.inputs)
+    if not files:
+        print("没有找到 raw 文件", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(files)))) as executor:
+        futures = [executor.submit(process_file, path, recipe, args.output) for path in files]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["ok"]:
+                print(f"OK    {result['file']}  像素 {result['pixels']}  {result['seconds']}s")
+            else:
+                print(f"FAIL  {result['file']}  {result['error']}")
+
+    failed = sum(1 for result in results if not result["ok"])
+    print(f"完成 {len(results) - failed}/{len(results)}，失败 {failed}")
+    if args.summary:
+        results.sort(key=lambda result: result["file"])
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+raw_process_util 转换函数的基准测试。
+
+生成 12/50/100MP 的合成拜耳帧，覆盖 pattern_list 中的所有拜耳模式和各 raw 类型，
+测量读取、显示转换、往返转换和保存的吞吐量 (MPix/s) 与峰值内存，结果写为 JSON。
+指定基准文件时与之比较，吞吐量下降或峰值内存上升超过容差即视为退化，返回非零退出码。
+
+峰值内存由 tracemalloc 统计，包含 NumPy 数组的分配，不包含 Qt 内部 (QImage) 的分配。
+
+用法:
+    python bench/bench_raw_process.py -o results.json
+    python bench/bench_raw_process.py --sizes 12 --types unpack10 mipi10 --baseline bench/baseline.json
+    python bench/bench_raw_process.py --quick --save-baseline bench/baseline.json
+    python bench/bench_raw_process.py --sizes 50 --types unpack10 --threads 1    # 与默认线程数比较多核加速
+
+基准文件与机器相关，仓库中不附带。先在同一台机器上用 --save-baseline 生成 (--quick 或与之后对比相同的
+--sizes/--types 参数)，再用 --baseline 对比；只比较两份结果中都有的测量项。指定的基准文件不存在时报错退出。
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PyQt6.QtGui import QGuiApplication
+
+from widgets.raw_process_util import (pattern_list, raw_bit_depth, mipi_group_size, read_raw, save_raw,
+                                      get_raw8, raw8_to_unpack16bit, raw_to_numpy_array, raw_to_rgb_bayer,
+                                      qimage_to_rgb_numpy_array, raw_to_QImage, pack_mipi, unpack_mipi)
+from widgets.raw_view import RawDisplayView
+from widgets.raw_core import get_worker_count, set_worker_count
+
+# 宽高均为偶数，RGB888 每行字节数为 4 的倍数
+frame_sizes = {
+    12: (4000, 3000),
+    50: (8160, 6120),
+    100: (11648, 8736),
+}
+
+
+def make_frame(width, height, bit_depth, seed=0):
+    """生成可复现的合成拜耳帧：平滑渐变叠加噪声，按原始位深存储"""
+    rng = np.random.default_rng(seed)
+    max_value = (1 << bit_depth) - 1
+    dtype = np.uint8 if bit_depth == 8 else np.dtype('<u2')
+    frame = np.empty((height, width), dtype=dtype)
+    ramp = np.linspace(0, max_value * 0.8, width, dtype=np.float32)
+    band_rows = 256
+    for y in range(0, height, band_rows):
+        rows = min(band_rows, height - y)
+        noise = rng.integers(0, max_value // 5 + 1, (rows, width), dtype=np.int32)
+        frame[y:y + rows] = np.minimum(ramp.astype(np.int32) + noise, max_value)
+    return frame
+
+
+def measure(func, repeat):
+    """返回 (最短耗时秒数, 峰值内存 MB)"""
+    best = None
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, peak / (1024 * 1024)
+
+
+def type_ops(frame, raw_type, path):
+    """与拜耳模式无关的操作"""
+    bit_depth = raw_bit_depth[raw_type]
+    row_stride = None
+    ops = {}
+
+    def load():
+        raw_info = read_raw(path)
+        # 内存映射的数据需要实际读取一遍才算加载完成
+        np.add.reduce(raw_info["raw_data"], axis=None)
+
+    ops["save"] = lambda: save_raw(path, frame, raw_type, row_stride)
+    ops["load"] = load
+    ops["display_gray"] = lambda: raw_to_QImage(frame, frame.shape[1], frame.shape[0], "RGGB", "GRAY", bit_depth)
+    if raw_type in ("unpack10", "unpack12"):
+        ops["raw8_roundtrip"] = lambda: raw8_to_unpack16bit(get_raw8(frame, raw_type), raw_type)
+    if raw_type in mipi_group_size:
+        ops["mipi_roundtrip"] = lambda: unpack_mipi(pack_mipi(frame, raw_type), frame.shape[1], raw_type)
+    return ops
+
+
+def pattern_ops(frame, raw_type, pattern):
+    """依赖拜耳模式的操作"""
+    bit_depth = raw_bit_depth[raw_type]
+    height, width = frame.shape
+    display8 = get_raw8(frame, raw_type) if raw_type in ("unpack10", "unpack12") else None
+    if display8 is None:
+        display8 = raw_to_QImage(frame, width, height, pattern, "GRAY", bit_depth).array
+
+    def display_rgb():
+        RawDisplayView(frame, pattern, "RGB", bit_depth).ensure_rect(0, 0, width, height)
+
+    def rgb_roundtrip():
+        q_img = raw_to_rgb_bayer(display8, width, height, pattern)
+        qimage_to_rgb_numpy_array(q_img, pattern)
+
+    # 预先分配输出，反复转换时不再分配整帧内存
+    rgb_out = np.empty((height, width, 3), dtype=np.uint8)
+    raw_out = np.empty((height, width), dtype=np.uint8)
+
+    def rgb_roundtrip_out():
+        q_img = raw_to_rgb_bayer(display8, width, height, pattern, rgb_out)
+        qimage_to_rgb_numpy_array(q_img, pattern, raw_out)
+
+    return {
+        "display_rgb": display_rgb,
+        "rgb_mosaic": lambda: raw_to_numpy_array(display8, width, height, pattern),
+        "rgb_mosaic_out": lambda: raw_to_numpy_array(display8, width, height, pattern, rgb_out),
+        "rgb_roundtrip": rgb_roundtrip,
+        "rgb_roundtrip_out": rgb_roundtrip_out,
+    }
+
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        for size in args.sizes:
+            width, height = frame_sizes[size]
+            for raw_type in args.types:
+                frame = make_frame(width, height, raw_bit_depth[raw_type])
+                path = os.path.join(tmp_dir, f"bench_{width}X{height}.{raw_type}_{args.patterns[0].lower()}.raw")
+                cases = [(None, type_ops(frame, raw_type, path))]
+                cases += [(pattern, pattern_ops(frame, raw_type, pattern)) for pattern in args.patterns]
+                for pattern, ops in cases:
+                    for op, func in ops.items():
+                        seconds, peak_mb = measure(func, args.repeat)
+                        name = "/".join(filter(None, [f"{size}MP", raw_type, pattern, op]))
+                        result = {
+                            "name": name,
+                            "size_mp": size,
+                            "width": width,
+                            "height": height,
+                            "raw_type": raw_type,
+                            "pattern": pattern,
+                            "op": op,
+                            "seconds": round(seconds, 6),
+                            "mpix_per_s": round(width * height / 1e6 / seconds, 3),
+                            "peak_mb": round(peak_mb, 2),
+                        }
+                        results.append(result)
+                        print(f"{name:<40} {result['seconds']:>9.4f}s {result['mpix_per_s']:>10.1f} MPix/s "
+                              f"{result['peak_mb']:>9.1f} MB", flush=True)
+                del frame
+                if os.path.exists(path):
+                    os.remove(path)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """与基准比较，返回退化项的说明列表"""
+    previous = {item["name"]: item for item in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        base = previous.get(result["name"])
+        if base is None:
+            continue
+        if result["mpix_per_s"] < base["mpix_per_s"] * (1 - tolerance):
+            regressions.append(f"{result['name']}: 吞吐量 {base['mpix_per_s']} -> {result['mpix_per_s']} MPix/s")
+        # 峰值内存允许 1MB 的统计抖动
+        if result["peak_mb"] > base["peak_mb"] * (1 + tolerance) + 1:
+            regressions.append(f"{result['name']}: 峰值内存 {base['peak_mb']} -> {result['peak_mb']} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="raw_process_util 基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", choices=sorted(frame_sizes), default=sorted(frame_sizes),
+                        help="帧大小 (MP)")
+    parser.add_argument("--patterns", nargs="+", choices=pattern_list, default=pattern_list, help="拜耳模式")
+    parser.add_argument("--types", nargs="+", choices=list(raw_bit_depth), default=list(raw_bit_depth),
+                        help="raw 类型")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最短耗时")
+    parser.add_argument("--quick", action="store_true", help="只测 12MP，每项运行一次")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="基准结果 JSON 文件，与之比较，文件必须存在")
+    parser.add_argument("--save-baseline", help="把本次结果写为基准文件")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的退化比例，默认 0.25")
+    parser.add_argument("--tmp-dir", help="临时文件目录，默认为系统临时目录")
+    parser.add_argument("--threads", type=int, help="行带并行的线程数，默认为 CPU 核数")
+    args = parser.parse_args(argv)
+    if args.baseline and not os.path.isfile(args.baseline):
+        parser.error(f"基准文件不存在: {args.baseline}，请先用 --save-baseline 生成")
+    if args.quick:
+        args.sizes, args.repeat = [12], 1
+    if args.threads:
+        set_worker_count(args.threads)
+
+    app = QGuiApplication.instance() or QGuiApplication([])
+    results = run(args)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "threads": get_worker_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        names = {item["name"] for item in baseline.get("results", [])}
+        if not any(result["name"] in names for result in results):
+            print(f"\n基准 {args.baseline} 中没有与本次相同的测量项，无法比较", file=sys.stderr)
+            return 2
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} 项退化 (容差 {args.tolerance:.0%}):")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print(f"\n与基准 {args.baseline} 相比没有退化")
+    del app
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,15 @@
 import sys
+import time
+
+# 在导入 Qt 之前取时间，启动耗时包含 Qt 与各模块的导入
+start_time = time.perf_counter()
+
 from PyQt6.QtWidgets import QApplication
+from widgets import perf
 from widgets.main_widget import MainWidget
 
 def main():
+    perf.mark_startup(start_time)
     app = QApplication(sys.argv)
     window = MainWidget()
     window.show()
@@ -10,4 +17,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,186 @@
+"""
+缺陷像素导入。
+
+支持三种输入，统一转换为 (xs, ys, values) 后用一次花式索引赋值写入原始数据:
+    CSV: 每行 x,y,value[,channel]，可有表头，# 开头的行为注释
+    NPY: (N, 3) 或 (N, 4) 数组，列含义同 CSV；或与 raw 图同大小的二维数组，作为缺陷图
+    图片 (png/bmp/tif): 与 raw 图同大小的缺陷图，非零像素为缺陷，16 位灰度图按原值写入，
+        8 位图按比例缩放到原始位深
+channel 为可选的拜耳通道，用于检查坐标是否落在预期的通道上: R、Gr、Gb、B，或 G (Gr/Gb 均可)；
+数值形式为 stats_channel_names 的下标 (0=R, 1=Gr, 2=Gb, 3=B)，4 为 G。
+"""
+import os
+
+import numpy as np
+
+from .raw_stats import cfa_stats_channels
+
+defect_map_suffixes = (".png", ".bmp", ".tif", ".tiff")
+channel_codes = {"R": 0, "GR": 1, "GB": 2, "B": 3, "G": 4}
+any_green = 4
+
+
+class DefectImportError(ValueError):
+    """缺陷文件格式错误或与当前 raw 图不匹配"""
+
+
+def integer_values(array, message="x、y、value 必须为整数"):
+    """数值数组转换为 int64；浮点数组中有非整数 (含 nan/inf) 时抛出 DefectImportError，不截断"""
+    array = np.asarray(array)
+    if array.dtype.kind == "f" and not np.all(np.isfinite(array) & (array == np.round(array))):
+        raise DefectImportError(message)
+    return array.astype(np.int64)
+
+
+def parse_channels(column):
+    """把通道列 (名称或数值) 转换为通道编号数组"""
+    column = np.asarray(column)
+    if column.dtype.kind in "iuf":
+        codes = integer_values(column, "通道编号只能为 0-4 (R/Gr/Gb/B/G)")
+        if codes.size and (codes.min() < 0 or codes.max() > any_green):
+            raise DefectImportError("通道编号只能为 0-4 (R/Gr/Gb/B/G)")
+        return codes
+    names = np.char.upper(np.char.strip(column.astype(str)))
+    codes = np.full(names.shape, -1, dtype=np.int64)
+    for name, code in channel_codes.items():
+        codes[names == name] = code
+    digits = np.char.isdigit(names)
+    codes[digits] = names[digits].astype(np.int64)
+    bad = np.flatnonzero((codes < 0) | (codes > any_green))
+    if len(bad):
+        raise DefectImportError(f"第 {bad[0] + 1} 项的通道无法识别: {column[bad[0]]}")
+    return codes
+
+
+def is_integer(text):
+    try:
+        int(text)
+    except ValueError:
+        return False
+    return True
+
+
+def read_defect_csv(file_path):
+    """返回 (rows, 行号)，rows 为字符串数组 (N, 列数)"""
+    rows, line_numbers = [], []
+    with open(file_path, "r", encoding="utf-8-sig") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.replace("\t", ",").split(",")]
+            if not rows and not any(map(is_integer, fields)):
+                continue  # 表头：所有字段都不是整数，数据行中格式错误的在转换时报错
+            rows.append(fields)
+            line_numbers.append(line_number)
+    if not rows:
+        raise DefectImportError("文件中没有缺陷")
+    width = len(rows[0])
+    for fields, line_number in zip(rows, line_numbers):
+        if len(fields) != width or width not in (3, 4):
+            raise DefectImportError(f"第 {line_number} 行应为 x,y,value[,channel]")
+    return np.array(rows), line_numbers
+
+
+def defect_map_points(defect_map, shape):
+    """缺陷图中的非零像素，返回 (xs, ys, values)"""
+    if defect_map.shape[:2] != tuple(shape):
+        raise DefectImportError(f"缺陷图大小 {defect_map.shape[1]}x{defect_map.shape[0]} "
+                                f"与图像 {shape[1]}x{shape[0]} 不一致")
+    ys, xs = np.nonzero(defect_map)
+    return xs, ys, integer_values(defect_map[ys, xs])
+
+
+def read_defect_image(file_path, shape, max_value):
+    # 只有图片格式需要 Qt 解码，批处理读取 CSV/NPY 时不加载 Qt
+    from PyQt6.QtGui import QImage
+    from .raw_process_util import qimage_to_numpy_view
+
+    img = QImage(file_path)
+    if img.isNull():
+        raise DefectImportError("无法读取缺陷图")
+    if img.format() == QImage.Format.Format_Grayscale16:
+        values = np.ascontiguousarray(qimage_to_numpy_view(img)).view(np.uint16)[:, :, 0]
+        scale = None
+    else:
+        img = img.convertToFormat(QImage.Format.Format_Grayscale8)
+        values = qimage_to_numpy_view(img)[:, :, 0]
+        scale = max_value / 255
+    xs, ys, values = defect_map_points(values, shape)
+    if scale is not None:
+        values = np.rint(values * scale).astype(np.int64)
+    return xs, ys, values
+
+
+def load_defects(file_path, shape, pattern, bit_depth):
+    """
+    读取缺陷文件并检查，返回 (xs, ys, values)，坐标不重复 (重复时以最后一项为准)。
+
+    坐标超出图像、数值超出位深或通道与拜耳模式 pattern 不符时抛出 DefectImportError。
+    """
+    max_value = (1 << bit_depth) - 1
+    suffix = os.path.splitext(file_path)[1].lower()
+    channels = None
+    labels = None  # 出错时提示的行号
+    if suffix == ".csv":
+        rows, labels = read_defect_csv(file_path)
+        try:
+            xs, ys, values = (rows[:, i].astype(np.int64) for i in range(3))
+        except ValueError:
+            raise DefectImportError("x、y、value 必须为整数")
+        if rows.shape[1] == 4:
+            channels = parse_channels(rows[:, 3])
+    elif suffix == ".npy":
+        try:
+            data = np.load(file_path, allow_pickle=False)
+        except ValueError as e:
+            raise DefectImportError(f"无法读取: {e}")
+        if data.ndim == 2 and data.shape == tuple(shape):
+            xs, ys, values = defect_map_points(data, shape)
+        elif data.ndim == 2 and data.shape[1] in (3, 4) and data.dtype.kind in "iuf":
+            xs, ys, values = integer_values(data[:, :3]).T
+            if data.shape[1] == 4:
+                channels = parse_channels(data[:, 3])
+        else:
+            raise DefectImportError(f"数组形状 {data.shape} 应为 (N, 3)、(N, 4) 或与图像同大小")
+    elif suffix in defect_map_suffixes:
+        xs, ys, values = read_defect_image(file_path, shape, max_value)
+    else:
+        raise DefectImportError("不支持的缺陷文件类型")
+    if len(xs) == 0:
+        raise DefectImportError("文件中没有缺陷")
+
+    def label(index):
+        return f"第 {labels[index]} 行" if labels else f"第 {index + 1} 项"
+
+    height, width = shape
+    bad = np.flatnonzero((xs < 0) | (xs >= width) | (ys < 0) | (ys >= height))
+    if len(bad):
+        raise DefectImportError(f"{len(bad)} 项坐标超出图像 {width}x{height}，"
+                                f"{label(bad[0])}: ({xs[bad[0]]}, {ys[bad[0]]})")
+    bad = np.flatnonzero((values < 0) | (values > max_value))
+    if len(bad):
+        raise DefectImportError(f"{len(bad)} 项数值超出 0-{max_value}，{label(bad[0])}: {values[bad[0]]}")
+    if channels is not None:
+        actual = np.array(cfa_stats_channels(pattern))[ys % 2, xs % 2]
+        matched = (actual == channels) | ((channels == any_green) & ((actual == 1) | (actual == 2)))
+        bad = np.flatnonzero(~matched)
+        if len(bad):
+            names = ["R", "Gr", "Gb", "B", "G"]
+            raise DefectImportError(f"{len(bad)} 项坐标不在指定的通道上 ({pattern})，{label(bad[0])}: "
+                                    f"({xs[bad[0]]}, {ys[bad[0]]}) 为 {names[actual[bad[0]]]}，"
+                                    f"指定为 {names[channels[bad[0]]]}")
+    # 同一坐标出现多次时只保留最后一项，保证一次赋值的结果确定
+    linear = ys * width + xs
+    _, last = np.unique(linear[::-1], return_index=True)
+    if len(last) != len(linear):
+        keep = np.sort(len(linear) - 1 - last)
+        xs, ys, values = xs[keep], ys[keep], values[keep]
+    return xs, ys, values
+
+
+def apply_defects(raw_array, xs, ys, values):
+    """一次花式索引赋值写入所有缺陷，返回外接矩形 (x, y, w, h)"""
+    raw_array[ys, xs] = values.astype(raw_array.dtype)
+    x0, y0 = int(xs.min()), int(ys.min())
+    return x0, y0, int(xs.max()) - x0 + 1, int(ys.max()) - y0 + 1
@@ -0,0 +1,156 @@
+import zlib
+
+import numpy as np
+
+
+class EditHistory:
+    """
+    基于瓦片增量的多级撤销/重做。
+
+    每次编辑只保存被修改到的瓦片在修改前的内容，使用 zlib 压缩。撤销时把当前内容与保存的内容交换，
+    交换出的内容即成为重做记录，因此每条记录只占一份瓦片数据。
+    总占用超过 max_bytes 时从最旧的记录开始淘汰。
+    """
+    tile_size = 64
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, compress_level=1):
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.array = None
+        self.undo_stack = []
+        self.redo_stack = []
+        self.used_bytes = 0
+        self.pending = None  # 当前编辑中已保存的瓦片 {(ty, tx): bytes}
+
+    def reset(self, array=None):
+        """绑定新的图像数组并清空历史"""
+        # 内存映射的数组按普通 ndarray 访问 (共享同一块内存)，避免每次取瓦片时 memmap 子类的额外开销
+        self.array = array.view(np.ndarray) if isinstance(array, np.memmap) else array
+        self.undo_stack = []
+        self.redo_stack = []
+        self.used_bytes = 0
+        self.pending = None
+
+    def can_undo(self):
+        return bool(self.undo_stack) or bool(self.pending)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo_rect(self):
+        """下一次撤销将要修改的区域 (x, y, w, h)，没有可撤销的记录时返回 None"""
+        tiles = self.pending or (self.undo_stack[-1] if self.undo_stack else None)
+        return self.tiles_bounds(tiles) if tiles else None
+
+    def redo_rect(self):
+        """下一次重做将要修改的区域 (x, y, w, h)，没有可重做的记录时返回 None"""
+        return self.tiles_bounds(self.redo_stack[-1]) if self.redo_stack else None
+
+    def has_changes(self):
+        """自绑定以来是否编辑过（撤销回原状也算编辑过）"""
+        return self.can_undo() or self.can_redo()
+
+    def tiles_in_rect(self, x, y, w, h):
+        """返回与区域相交的瓦片坐标 (ty, tx)"""
+        height, width = self.array.shape[:2]
+        ts = self.tile_size
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        x1, y1 = min(int(x + w), width), min(int(y + h), height)
+        if x0 >= x1 or y0 >= y1:
+            return []
+        return [(ty, tx) for ty in range(y0 // ts, (y1 - 1) // ts + 1)
+                for tx in range(x0 // ts, (x1 - 1) // ts + 1)]
+
+    def tile_view(self, key):
+        ty, tx = key
+        ts = self.tile_size
+        return self.array[ty * ts:(ty + 1) * ts, tx * ts:(tx + 1) * ts]
+
+    def save_tile(self, key):
+        return zlib.compress(np.ascontiguousarray(self.tile_view(key)).tobytes(), self.compress_level)
+
+    def restore_tile(self, key, data):
+        tile = self.tile_view(key)
+        tile[...] = np.frombuffer(zlib.decompress(data), dtype=self.array.dtype).reshape(tile.shape)
+
+    def begin(self):
+        """开始一次编辑（例如一笔），之后的 record 都归入同一条记录"""
+        if self.array is not None and self.pending is None:
+            self.pending = {}
+
+    def record(self, x, y, w, h):
+        """在修改区域之前调用，保存区域内尚未保存的瓦片"""
+        if self.pending is None:
+            return
+        for key in self.tiles_in_rect(x, y, w, h):
+            if key not in self.pending:
+                self.pending[key] = self.save_tile(key)
+
+    def record_points(self, xs, ys):
+        """在修改一组离散像素之前调用，只保存这些像素所在的瓦片"""
+        if self.pending is None or len(xs) == 0:
+            return
+        ts = self.tile_size
+        tiles_x = (self.array.shape[1] + ts - 1) // ts
+        for index in np.unique((ys // ts) * tiles_x + xs // ts):
+            key = (int(index) // tiles_x, int(index) % tiles_x)
+            if key not in self.pending:
+                self.pending[key] = self.save_tile(key)
+
+    def commit(self):
+        """结束当前编辑，生成一条撤销记录"""
+        tiles, self.pending = self.pending, None
+        if not tiles:
+            return
+        self.push(self.undo_stack, tiles)
+        for entry in self.redo_stack:
+            self.used_bytes -= self.entry_bytes(entry)
+        self.redo_stack = []
+        self.evict()
+
+    def undo(self):
+        """撤销一步，返回需要刷新的区域 (x, y, w, h)，没有可撤销的记录时返回 None"""
+        if self.pending:
+            self.commit()
+        self.pending = None
+        return self.swap(self.undo_stack, self.redo_stack)
+
+    def redo(self):
+        """重做一步，返回需要刷新的区域 (x, y, w, h)，没有可重做的记录时返回 None"""
+        return self.swap(self.redo_stack, self.undo_stack)
+
+    def swap(self, source, target):
+        if not source:
+            return None
+        tiles = source.pop()
+        self.used_bytes -= self.entry_bytes(tiles)
+        swapped = {}
+        for key, data in tiles.items():
+            swapped[key] = self.save_tile(key)
+            self.restore_tile(key, data)
+        self.push(target, swapped)
+        self.evict()
+        return self.tiles_bounds(swapped)
+
+    def push(self, stack, tiles):
+        stack.append(tiles)
+        self.used_bytes += self.entry_bytes(tiles)
+
+    def evict(self):
+        """超出内存上限时淘汰最旧的撤销记录，再淘汰最远的重做记录"""
+        while self.used_bytes > self.max_bytes and (len(self.undo_stack) + len(self.redo_stack)) > 1:
+            stack = self.undo_stack if self.undo_stack else self.redo_stack
+            self.used_bytes -= self.entry_bytes(stack.pop(0))
+
+    @staticmethod
+    def entry_bytes(tiles):
+        return sum(len(data) for data in tiles.values())
+
+    def tiles_bounds(self, tiles):
+        height, width = self.array.shape[:2]
+        ts = self.tile_size
+        rows = [ty for ty, _ in tiles]
+        cols = [tx for _, tx in tiles]
+        x0, y0 = min(cols) * ts, min(rows) * ts
+        x1, y1 = min((max(cols) + 1) * ts, width), min((max(rows) + 1) * ts, height)
+        return x0, y0, x1 - x0, y1 - y0
@@ -0,0 +1,44 @@
+import numpy as np
+from PyQt6.QtCore import QPointF
+from PyQt6.QtGui import QColor, QPainter, QPen, QPolygonF
+from PyQt6.QtWidgets import QWidget
+
+
+class HistogramWidget(QWidget):
+    """按通道绘制直方图曲线，纵轴为对数刻度"""
+    bin_count = 128
+    channel_colors = [QColor(220, 40, 40), QColor(40, 170, 40), QColor(20, 110, 60), QColor(40, 80, 230)]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.m_hist = None
+        self.setMinimumHeight(90)
+
+    def setHistograms(self, hist):
+        """hist 为 (通道数, 直方图长度) 的数组，为 None 时清空"""
+        if hist is None:
+            self.m_hist = None
+        else:
+            # 合并为 bin_count 个区间后显示
+            bins = min(self.bin_count, hist.shape[1])
+            self.m_hist = hist[:, :hist.shape[1] // bins * bins].reshape(hist.shape[0], bins, -1).sum(axis=2)
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(30, 30, 30))
+        if self.m_hist is None:
+            painter.end()
+            return
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        width, height = self.width(), self.height()
+        levels = np.log1p(self.m_hist.astype(np.float64))
+        top = max(levels.max(), 1.0)
+        xs = np.linspace(0, width - 1, levels.shape[1])
+        for channel, values in enumerate(levels):
+            ys = (height - 1) - values / top * (height - 4)
+            pen = QPen(self.channel_colors[channel % len(self.channel_colors)])
+            pen.setWidthF(1.2)
+            painter.setPen(pen)
+            painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in zip(xs, ys)]))
+        painter.end()
@@ -0,0 +1,87 @@
+import os
+from collections import OrderedDict
+
+from .raw_core import allocated_bytes
+
+
+def file_key(file_path):
+    """文件的 (大小, 修改时间 ns)，文件不存在时返回 None"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def result_bytes(result):
+    """估算 load_image_file 加载结果实际分配的内存，内存映射的 raw 数据不计入"""
+    if "raw_info" in result:
+        preview = result.get("preview")
+        return allocated_bytes(result["raw_info"]["raw_data"]) + (preview["array"].nbytes if preview else 0)
+    if "image" in result:
+        return result["image"].sizeInBytes()
+    return 0
+
+
+class LoadCache:
+    """
+    已解码图片的 LRU 缓存，按文件路径索引。
+
+    缓存的是 load_image_file 的结果，实际分配的内存超过 max_bytes 或项数超过 max_items 时从最久未使用的开始淘汰。
+    内存映射的 raw 文件几乎不占内存，项数上限避免映射的文件越积越多。
+    取出的结果会交给文档直接编辑，因此 take 会把它移出缓存，只有未修改的结果才放回来。
+    每项同时记录读取时文件的 (大小, 修改时间)，取出时文件已变化 (在程序外被改写) 则丢弃。
+    """
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024, max_items=16):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.items = OrderedDict()  # file_path -> (result, bytes, file_key)
+        self.used_bytes = 0
+
+    def __contains__(self, file_path):
+        return file_path in self.items
+
+    def put(self, file_path, result, key=None):
+        """
+        放入加载成功的结果，单个结果超过上限时不缓存。
+
+        key 为读取时文件的 (大小, 修改时间)，默认取结果中的 file_key，都没有时不缓存。
+        """
+        if result is None or "error" in result:
+            return
+        key = key or result.get("file_key")
+        size = result_bytes(result)
+        self.discard(file_path)
+        if key is None or size > self.max_bytes:
+            return
+        self.items[file_path] = (result, size, key)
+        self.used_bytes += size
+        while self.used_bytes > self.max_bytes or len(self.items) > self.max_items:
+            _, (_, old_size, _) = self.items.popitem(last=False)
+            self.used_bytes -= old_size
+
+    def take(self, file_path):
+        """取出并移除缓存的结果，不存在或文件已被改写时返回 None"""
+        item = self.items.pop(file_path, None)
+        if item is None:
+            return None
+        self.used_bytes -= item[1]
+        if file_key(file_path) != item[2]:
+            return None
+        return item[0]
+
+    def paths(self):
+        return list(self.items)
+
+    def touch(self, file_path):
+        """标记为最近使用，避免即将显示的相邻图片被先淘汰"""
+        if file_path in self.items:
+            self.items.move_to_end(file_path)
+
+    def discard(self, file_path):
+        self.take(file_path)
+
+    def clear(self):
+        self.items.clear()
+        self.used_bytes = 0
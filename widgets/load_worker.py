@@ -0,0 +1,107 @@
+import os
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from .raw_core import read_raw, sample_display8, default_display_params
+from .load_cache import file_key
+from .tile_pyramid import TilePyramid
+
+
+class LoadCancelled(Exception):
+    """加载被取消"""
+
+
+def make_preview(raw_info, preview):
+    """
+    按 preview 给出的缩放和显示设置取样生成 raw 图在该缩放下所用金字塔层的整层显示数组。
+
+    显示设置中的 params 只在位深与 bit_depth 相同时沿用 (与切换图片时显示调整的处理一致)，否则用默认参数。
+    所用层为第 0 层 (放大显示) 时需要的是原图的可见区域，不预先生成，返回 None。
+    """
+    width, height = raw_info["raw_width"], raw_info["raw_height"]
+    level = TilePyramid.scale_level(width, height, preview["scale"])
+    if level == 0:
+        return None
+    params = preview["params"] if raw_info["bit_depth"] == preview["bit_depth"] else default_display_params
+    step = 1 << level
+    array = sample_display8(raw_info["raw_data"], raw_info["pattern"], raw_info["bit_depth"], params, step, 0, 0,
+                            -(-width // step), -(-height // step), preview["mode"], bool(preview["demosaic"]))
+    return dict(preview, level=level, params=params, array=array)
+
+
+def load_image_file(file_path, show_mode="GRAY", progress_callback=None, preview=None):
+    """
+    读取并解码图片文件，不依赖界面线程。
+
+    preview 为 {"scale", "mode", "demosaic", "params", "bit_depth"} 时，raw 图另外用 make_preview 预先生成
+    该缩放下的显示层，预取的图片切换过来后第一次绘制不必再取样。
+
+    返回:
+        dict: raw图为 {"raw_info": ...}，普通图片为 {"image": QImage}，失败时为 {"error": 错误信息}；
+            成功时 "file_key" 为读取前文件的 (大小, 修改时间)，供缓存判断文件是否已被改写；
+            生成了显示层时 raw图另有 "preview"
+    """
+    key = file_key(file_path)
+    surfix = os.path.splitext(file_path)[1].lower()
+    if surfix in (".bmp", ".jpg", ".png"):
+        img = QImage(file_path)
+        if img.isNull():
+            return {"error": "无法加载图片"}
+        if show_mode == "GRAY":
+            img = img.convertToFormat(QImage.Format.Format_Grayscale8)
+        else:
+            img = img.convertToFormat(QImage.Format.Format_RGB32)
+        return {"image": img, "file_key": key}
+    if surfix == ".raw":
+        raw_info = read_raw(file_path, progress_callback)
+        if not raw_info:
+            return {"error": "无法加载图片, 不支持的raw图类型"}
+        result = {"raw_info": raw_info, "file_key": key}
+        if preview is not None:
+            result["preview"] = make_preview(raw_info, preview)
+        return result
+    return {"error": "不支持的文件类型"}
+
+
+class LoadSignals(QObject):
+    progress = pyqtSignal(int)  # 百分比
+    finished = pyqtSignal(object)  # load_image_file 的结果，取消时为 None
+
+
+class LoadWorker(QRunnable):
+    """在线程池中加载图片，解码过程中上报进度，可随时取消"""
+
+    def __init__(self, file_path, show_mode="GRAY", preview=None):
+        super().__init__()
+        self.file_path = file_path
+        self.show_mode = show_mode
+        self.preview = preview
+        self.signals = LoadSignals()
+        self.cancel_event = threading.Event()
+        self.last_percent = -1
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def on_progress(self, done, total):
+        if self.cancel_event.is_set():
+            raise LoadCancelled()
+        percent = done * 100 // max(total, 1)
+        if percent != self.last_percent:
+            self.last_percent = percent
+            self.signals.progress.emit(percent)
+
+    def run(self):
+        # 无论成功、失败还是取消都会发出 finished，取消时结果为 None
+        try:
+            result = load_image_file(self.file_path, self.show_mode, self.on_progress, self.preview)
+        except LoadCancelled:
+            result = None
+        except Exception as e:
+            result = {"error": f"加载图片失败: {str(e)}"}
+        self.signals.finished.emit(None if self.cancel_event.is_set() else result)
@@ -1,14 +1,43 @@
-from PyQt6.QtCore import QSize, Qt
-from PyQt6.QtGui import QImage, QDropEvent, QDragEnterEvent, QColor, QIcon, QCursor
+from PyQt6.QtCore import QPoint, QSize, Qt, QThreadPool, QTimer
+from PyQt6.QtGui import (QImage, QPixmap, QDropEvent, QDragEnterEvent, QColor, QIcon, QCursor, QKeySequence,
+                         QShortcut, qGray)
 from PyQt6.QtWidgets import (
     QWidget, QFileDialog, QMessageBox, QLineEdit, QPushButton,
-    QLabel, QHBoxLayout, QVBoxLayout, QGridLayout, QSpacerItem,
-    QSizePolicy, QDoubleSpinBox, QRadioButton, QComboBox, QApplication, QCheckBox, QProgressDialog, QTabWidget,
-    QGroupBox, QSlider
+    QLabel, QHBoxLayout, QVBoxLayout, QGridLayout, QRadioButton, QComboBox, QCheckBox, QProgressDialog, QTabWidget,
+    QGroupBox, QSlider, QListWidget, QSpinBox
 )
-import time, os
+import threading, time, os
+from functools import lru_cache
+import numpy as np
+from . import perf
 from .paint_widget import PaintWidget
-from .raw_process_util import raw_to_QImage, read_raw, qimage_to_raw_rgb, qimage_to_raw_gray, raw8_to_unpack16bit
+from .raw_process_util import (raw_to_QImage, read_raw, stroke_mask, apply_mask_on_raw,
+                               qimage_to_numpy_view, numpy_to_qimage, DisplayParams, auto_stretch_levels)
+from .raw_document import RawDocument
+from .stroke_engine import StrokeEngine
+from .edit_history import EditHistory
+from .load_worker import LoadWorker
+from .load_cache import LoadCache, file_key
+from .histogram_widget import HistogramWidget
+from .raw_stats import stats_channel_names
+from .save_worker import SaveWorker
+from .defect_import import DefectImportError, load_defects, apply_defects
+from .shape_tools import (rect_mask, ellipse_mask, polygon_mask, flood_fill_mask, bayer_flood_fill_mask,
+                          restrict_to_channel, fill_mask)
+
+resource_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resource")
+
+
+@lru_cache(maxsize=None)
+def get_pen_cursor():
+    """绘制时的笔形光标，svg 只在第一次使用时加载并栅格化"""
+    pixmap = QIcon(os.path.join(resource_dir, "pen.svg")).pixmap(QSize(32, 32))
+    return QCursor(pixmap, hotX=2, hotY=28)
+
+
+image_suffixes = (".raw", ".bmp", ".jpg", ".png")
+
+
 class MainWidget(QWidget):
 
     def __init__(self, parent=None):
@@ -22,19 +51,102 @@ class MainWidget(QWidget):
         self.rgbRadioBtn = QRadioButton("RGB")
         self.grayRadioBtn = QRadioButton("GRAY")
         self.grayRadioBtn.setChecked(True)
+        self.demosaicComboBox = QComboBox()
+        self.demosaicComboBox.addItem("无", None)
+        self.demosaicComboBox.addItem("双线性", "bilinear")
+        self.demosaicComboBox.addItem("MHC", "mhc")
+        self.demosaicComboBox.setEnabled(False)
         self.penSizeSlider = QSlider(Qt.Orientation.Horizontal)
         self.penSizeSlider.setRange(3, 30)
         self.penSizeSlider.setValue(5)
         self.drawImgBtn = QPushButton("绘制")
+        self.toolComboBox = QComboBox()
+        for name, tool in [("画笔", "brush"), ("矩形", "rect"), ("椭圆", "ellipse"), ("多边形", "polygon"),
+                           ("填充", "fill")]:
+            self.toolComboBox.addItem(name, tool)
+        self.toolComboBox.setToolTip("多边形：单击添加顶点，双击结束；填充：单击按容差填充连通区域")
+        self.channelComboBox = QComboBox()
+        self.channelComboBox.addItem("全部", None)
+        for channel in ["R", "Gr", "Gb", "B", "G"]:
+            self.channelComboBox.addItem(channel, channel)
+        self.channelComboBox.setToolTip("只修改raw图的一个拜耳通道")
+        self.toleranceSpinBox = QSpinBox()
+        self.toleranceSpinBox.setRange(0, 65535)
+        self.toleranceSpinBox.setToolTip("填充时与起点数值相差不超过容差的相连像素会被填充")
+        self.shape_points = []  # 正在绘制的形状的顶点 (图像坐标)
+        self.importDefectBtn = QPushButton("导入缺陷")
+        self.importDefectBtn.setToolTip("从 CSV/NPY 坐标列表或缺陷图批量写入缺陷像素，可一次撤销")
         self.colorRLineEdit = QLineEdit()
         self.colorGLineEdit = QLineEdit()
         self.colorBLineEdit = QLineEdit()
         self.saveBtn = QPushButton("保存")
         self.resetBtn = QPushButton("重置")
+        self.statusLabel = QLabel()
+        self.undoBtn = QPushButton("撤销")
+        self.redoBtn = QPushButton("重做")
+        self.perfCheckBox = QCheckBox("性能浮层 (F12)")
+        self.patchSaveCheckBox = QCheckBox("增量保存")
+        self.patchSaveCheckBox.setToolTip("raw图只写入修改过的行：先克隆原文件，写入后再替换，原文件不会被写坏")
+        self.patchSaveCheckBox.setChecked(True)
+        self.fileListWidget = QListWidget()
+        self.fileListWidget.setIconSize(QSize(48, 36))
+        # 所有行等高，布局和按坐标定位行时不必逐行计算大小
+        self.fileListWidget.setUniformItemSizes(True)
+        self.prevBtn = QPushButton("上一张")
+        self.nextBtn = QPushButton("下一张")
+        # 显示变换：黑电平、白电平、R/G/B 增益、伽马，只影响显示
+        self.blackSlider = QSlider(Qt.Orientation.Horizontal)
+        self.whiteSlider = QSlider(Qt.Orientation.Horizontal)
+        self.gainSliders = [QSlider(Qt.Orientation.Horizontal) for _ in range(3)]
+        self.gammaSlider = QSlider(Qt.Orientation.Horizontal)
+        self.displayValueLabels = {}
+        self.autoStretchBtn = QPushButton("自动拉伸")
+        self.displayResetBtn = QPushButton("复位")
+        self.display_bit_depth = None
+        # 拖动滑块时合并连续的变化，只按最新的参数刷新一次
+        self.display_timer = QTimer(self)
+        self.display_timer.setSingleShot(True)
+        self.display_timer.setInterval(15)
+        # 通道统计，编辑时增量更新，面板按定时器合并刷新
+        self.histogramWidget = HistogramWidget()
+        self.statsLabel = QLabel()
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setSingleShot(True)
+        self.stats_timer.setInterval(100)
+        # 笔刷参数缓存，输入框或滑块变化时才更新
+        self.brush_color = (0, 0, 0)
+        self.brush_size = self.penSizeSlider.value()
+        self.stroke_engine = StrokeEngine(self.draw_stroke, parent=self)
+        # 撤销历史，只保存每次编辑涉及的瓦片
+        self.history = EditHistory()
+        # 后台加载，新的加载会取消尚未完成的加载
+        self.thread_pool = QThreadPool(self)
+        self.load_worker = None
+        self.load_workers = set()  # 仍在线程池中运行的加载任务，运行结束前需保持引用
+        self.progress_dialog = None
+        self.show_started = 0.0  # 开始显示图片的时间，用于统计加载耗时
+        # 文件列表与相邻图片预取，预取结果放入按字节数限制的 LRU 缓存
+        self.file_list = []
+        self.file_rows = {}  # file_path -> 行号
+        self.file_index = -1
+        self.load_cache = LoadCache()
+        self.prefetch_pool = QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(2)
+        self.prefetch_workers = {}  # file_path -> LoadWorker
+        # 文件信息与缩略图的持久化索引，缺失或过期的缩略图在后台按批生成
+        self.thumb_index = None
+        self.thumb_entries = {}  # file_path -> ThumbEntry
+        self.thumb_pool = QThreadPool(self)
+        self.thumb_pool.setMaxThreadCount(2)
+        self.thumb_cancel = threading.Event()
+        self.thumb_workers = set()
+        # 后台保存，保存期间暂停编辑
+        self.save_worker = None
         self.setUI()
         self.setup_connections()
-        self.img_copy = None
         self.raw_info = None
+        self.raw_doc = None
+        self.raw_view = None
         # self.img = QImage("D:\\Pictures\\theme.png")
 
         # self.paintWidget.setImage(self.img)
@@ -42,6 +154,7 @@ class MainWidget(QWidget):
         # 图像显示状态
         self.show_mode = "GRAY"  # "GRAY" 或 "RGB"
         self.file_path = ""
+        self.file_key = None  # 当前图片读取时文件的 (大小, 修改时间)
         # 绘制状态
         self.is_drawing = False
         self.is_raw_img = False
@@ -53,7 +166,8 @@ class MainWidget(QWidget):
         raw_info = read_raw(raw_path)
         if not raw_info:
             return
-        raw_qimage = raw_to_QImage(raw_info['raw_data'], raw_info['raw_width'], raw_info['raw_height'], raw_info['pattern'], "RGB")
+        raw_qimage = raw_to_QImage(raw_info['raw_data'], raw_info['raw_width'], raw_info['raw_height'], raw_info['pattern'], "RGB",
+                                   raw_info['bit_depth'])
         self.paintWidget.setImage(raw_qimage)
 
 
@@ -98,11 +212,15 @@ class MainWidget(QWidget):
         groupBoxLayout.addWidget(self.loadImgBtn)
         groupBoxLayout.addLayout(sizeLayout)
         groupBoxLayout.addLayout(modeLayout)
+        demosaicLayout = QHBoxLayout()
+        demosaicLayout.addWidget(QLabel("插值："))
+        demosaicLayout.addWidget(self.demosaicComboBox)
+        groupBoxLayout.addLayout(demosaicLayout)
         imgGroupBox.setLayout(groupBoxLayout)
 
         drawGroupBox = QGroupBox("绘制")
         drawGroupBox.setMaximumWidth(180)
-        drawGroupBox.setMaximumHeight(150)
+        drawGroupBox.setMaximumHeight(260)
         drawGroupBoxLayout = QVBoxLayout()
 
         ### 绘制相关组件
@@ -120,28 +238,98 @@ class MainWidget(QWidget):
         colorEditLayout.addWidget(QLabel("B:"))
         colorEditLayout.addWidget(self.colorBLineEdit)
 
+        # 工具、通道限制和填充容差
+        toolLayout = QGridLayout()
+        toolLayout.addWidget(QLabel("工具："), 0, 0)
+        toolLayout.addWidget(self.toolComboBox, 0, 1)
+        toolLayout.addWidget(QLabel("通道："), 1, 0)
+        toolLayout.addWidget(self.channelComboBox, 1, 1)
+        toolLayout.addWidget(QLabel("容差："), 2, 0)
+        toolLayout.addWidget(self.toleranceSpinBox, 2, 1)
+
+        drawGroupBoxLayout.addLayout(toolLayout)
         drawGroupBoxLayout.addLayout(penSizeLayout)
         drawGroupBoxLayout.addLayout(colorEditLayout)
         drawGroupBoxLayout.addWidget(self.drawImgBtn)
+        drawGroupBoxLayout.addWidget(self.importDefectBtn)
         """..."""
         drawGroupBox.setLayout(drawGroupBoxLayout)
 
         otherGroupBox = QGroupBox("其他")
         otherGroupBox.setMaximumWidth(180)
-        otherGroupBox.setMaximumHeight(150)
+        otherGroupBox.setMaximumHeight(200)
         otherGroupBoxLayout = QVBoxLayout()
         # 添加内容
+        undoLayout = QHBoxLayout()
+        undoLayout.addWidget(self.undoBtn)
+        undoLayout.addWidget(self.redoBtn)
+        otherGroupBoxLayout.addLayout(undoLayout)
         otherGroupBoxLayout.addWidget(self.resetBtn)
         otherGroupBoxLayout.addWidget(self.saveBtn)
+        otherGroupBoxLayout.addWidget(self.patchSaveCheckBox)
+        otherGroupBoxLayout.addWidget(self.perfCheckBox)
 
         otherGroupBox.setLayout(otherGroupBoxLayout)
 
+        # 文件列表与显示调整放在同一个标签页中
+        fileTab = QWidget()
+        fileTabLayout = QVBoxLayout()
+        fileTabLayout.setContentsMargins(2, 2, 2, 2)
+        fileTabLayout.addWidget(self.fileListWidget)
+        navLayout = QHBoxLayout()
+        navLayout.addWidget(self.prevBtn)
+        navLayout.addWidget(self.nextBtn)
+        fileTabLayout.addLayout(navLayout)
+        fileTab.setLayout(fileTabLayout)
+
+        displayTab = QWidget()
+        displayLayout = QGridLayout()
+        displayLayout.setContentsMargins(2, 2, 2, 2)
+        display_rows = [("黑", self.blackSlider), ("白", self.whiteSlider), ("R", self.gainSliders[0]),
+                        ("G", self.gainSliders[1]), ("B", self.gainSliders[2]), ("γ", self.gammaSlider)]
+        for row, (name, slider) in enumerate(display_rows):
+            valueLabel = QLabel()
+            valueLabel.setMinimumWidth(32)
+            self.displayValueLabels[slider] = valueLabel
+            displayLayout.addWidget(QLabel(name), row, 0)
+            displayLayout.addWidget(slider, row, 1)
+            displayLayout.addWidget(valueLabel, row, 2)
+        displayBtnLayout = QHBoxLayout()
+        displayBtnLayout.addWidget(self.autoStretchBtn)
+        displayBtnLayout.addWidget(self.displayResetBtn)
+        displayLayout.addLayout(displayBtnLayout, len(display_rows), 0, 1, 3)
+        displayTab.setLayout(displayLayout)
+        displayTab.setEnabled(False)
+        self.displayTab = displayTab
+
+        statsTab = QWidget()
+        statsLayout = QVBoxLayout()
+        statsLayout.setContentsMargins(2, 2, 2, 2)
+        statsLayout.addWidget(self.histogramWidget)
+        statsFont = self.statsLabel.font()
+        statsFont.setFamily("monospace")
+        statsFont.setPointSize(max(statsFont.pointSize() - 2, 6))
+        self.statsLabel.setFont(statsFont)
+        statsLayout.addWidget(self.statsLabel)
+        statsLayout.addStretch()
+        statsTab.setLayout(statsLayout)
+        self.statsTab = statsTab
+
+        opTabWidget = QTabWidget()
+        opTabWidget.setMaximumWidth(180)
+        opTabWidget.addTab(fileTab, "文件列表")
+        opTabWidget.addTab(displayTab, "显示")
+        opTabWidget.addTab(statsTab, "统计")
+        self.opTabWidget = opTabWidget
+
         opLayout.addWidget(imgGroupBox)
         opLayout.addWidget(drawGroupBox)
         opLayout.addWidget(otherGroupBox)
+        opLayout.addWidget(opTabWidget)
 
         mainHLayout.addLayout(opLayout)
         mainLayout.addLayout(mainHLayout)
+        mainLayout.addWidget(self.statusLabel)
 
         self.setLayout(mainLayout)
 
@@ -149,53 +337,442 @@ class MainWidget(QWidget):
     def setup_connections(self):
         self.loadImgBtn.clicked.connect(self.on_load_img_clicked)
         self.drawImgBtn.clicked.connect(self.on_draw_btn_clicked)
+        self.importDefectBtn.clicked.connect(self.on_import_defects)
+        self.paintWidget.mouse_pressed.connect(self.on_stroke_begin)
         self.paintWidget.mouse_moved.connect(self.draw_event)
+        self.paintWidget.mouse_released.connect(self.on_stroke_end)
+        self.paintWidget.mouse_double_clicked.connect(self.on_shape_double_clicked)
+        self.toolComboBox.currentIndexChanged.connect(self.cancel_shape)
+        self.penSizeSlider.valueChanged.connect(self.on_brush_size_changed)
+        self.colorRLineEdit.textChanged.connect(self.update_brush_color)
+        self.colorGLineEdit.textChanged.connect(self.update_brush_color)
+        self.colorBLineEdit.textChanged.connect(self.update_brush_color)
+        self.colorRLineEdit.editingFinished.connect(self.check_color_input)
+        self.colorGLineEdit.editingFinished.connect(self.check_color_input)
+        self.colorBLineEdit.editingFinished.connect(self.check_color_input)
         self.resetBtn.clicked.connect(self.on_reset_btn_clicked)
+        self.undoBtn.clicked.connect(self.on_undo)
+        self.redoBtn.clicked.connect(self.on_redo)
+        QShortcut(QKeySequence.StandardKey.Undo, self, self.on_undo)
+        QShortcut(QKeySequence.StandardKey.Redo, self, self.on_redo)
         self.saveBtn.clicked.connect(self.on_save_btn_clicked)
         self.rgbRadioBtn.toggled.connect(self.on_radio_btn_changed)
         self.grayRadioBtn.toggled.connect(self.on_radio_btn_changed)
+        self.demosaicComboBox.currentIndexChanged.connect(self.on_demosaic_changed)
+        self.fileListWidget.currentRowChanged.connect(self.on_file_row_changed)
+        # 滚动或列表大小变化时补上新出现的行的缩略图
+        self.fileListWidget.verticalScrollBar().valueChanged.connect(lambda value: self.update_visible_thumbs())
+        self.fileListWidget.verticalScrollBar().rangeChanged.connect(lambda low, high: self.update_visible_thumbs())
+        self.prevBtn.clicked.connect(self.show_prev)
+        self.nextBtn.clicked.connect(self.show_next)
+        QShortcut(QKeySequence(Qt.Key.Key_PageUp), self, self.show_prev)
+        QShortcut(QKeySequence(Qt.Key.Key_PageDown), self, self.show_next)
+        self.perfCheckBox.toggled.connect(self.paintWidget.setPerfOverlayVisible)
+        for slider in [self.blackSlider, self.whiteSlider, self.gammaSlider] + self.gainSliders:
+            slider.valueChanged.connect(self.on_display_slider_changed)
+        self.display_timer.timeout.connect(self.apply_display_params)
+        self.autoStretchBtn.clicked.connect(self.on_auto_stretch)
+        self.displayResetBtn.clicked.connect(self.reset_display_controls)
+        self.stats_timer.timeout.connect(self.update_stats_panel)
+        self.opTabWidget.currentChanged.connect(self.update_stats_panel)
+        QShortcut(QKeySequence(Qt.Key.Key_F12), self, self.perfCheckBox.toggle)
 
 
     def on_load_img_clicked(self):
-        self.file_path, _ = QFileDialog.getOpenFileName(self, "选择图片", "", "Images (*.raw;*.bmp;*.jpg;*.png)")
-        if not self.file_path:
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择图片", "", "Images (*.raw;*.bmp;*.jpg;*.png)")
+        if not file_path:
+            return
+        self.set_file_list([file_path])
+
+    def set_file_list(self, file_list, index=0):
+        """设置可前后切换的文件列表并显示其中一张"""
+        self.file_list = list(file_list)
+        self.file_rows = {file_path: row for row, file_path in enumerate(self.file_list)}
+        for file_path in list(self.prefetch_workers):
+            if file_path not in self.file_list:
+                self.prefetch_workers.pop(file_path).cancel()
+        self.fileListWidget.blockSignals(True)
+        self.fileListWidget.clear()
+        self.fileListWidget.addItems([os.path.basename(file_path) for file_path in self.file_list])
+        self.fileListWidget.blockSignals(False)
+        self.index_file_list(index)
+        self.file_index = -1
+        self.show_file_at(index)
+
+    def get_thumb_index(self):
+        if self.thumb_index is None:
+            # 第一次打开文件列表时才加载 sqlite3，不影响启动
+            import sqlite3
+            from .thumb_index import ThumbIndex
+
+            try:
+                self.thumb_index = ThumbIndex()
+            except (OSError, sqlite3.Error):
+                # 缓存目录不可写时只在本次运行中索引
+                self.thumb_index = ThumbIndex(":memory:")
+        return self.thumb_index
+
+    def index_file_list(self, start=0):
+        """从索引读取文件列表的信息和缩略图，缺失或已过期的从 start 开始在后台生成"""
+        from .thumb_worker import ThumbWorker
+
+        self.thumb_cancel.set()
+        self.thumb_cancel = threading.Event()
+        with perf.timer("index_lookup", files=len(self.file_list)):
+            keys = {file_path: file_key(file_path) for file_path in self.file_list}
+            self.thumb_entries = self.get_thumb_index().lookup(self.file_list, keys)
+            for entry in self.thumb_entries.values():
+                self.set_thumb_info(entry)
+        ordered = self.file_list[start:] + self.file_list[:start]
+        missing = [file_path for file_path in ordered
+                   if file_path not in self.thumb_entries and keys[file_path] is not None]
+        batch = 8
+        for i in range(0, len(missing), batch):
+            worker = ThumbWorker(missing[i:i + batch], self.thumb_cancel)
+            worker.setAutoDelete(False)
+            worker.signals.finished.connect(lambda entries, w=worker: self.on_thumbs_finished(w, entries))
+            self.thumb_workers.add(worker)
+            self.thumb_pool.start(worker)
+        self.update_visible_thumbs()
+
+    def on_thumbs_finished(self, worker, entries):
+        self.thumb_workers.discard(worker)
+        if not entries:
+            return
+        # 列表已切换时结果仍然写入索引，下次浏览可以直接使用
+        self.get_thumb_index().store(entries)
+        if worker.cancel_event is not self.thumb_cancel:
+            return
+        for entry in entries:
+            self.thumb_entries[entry.path] = entry
+            self.set_thumb_info(entry)
+        self.update_visible_thumbs()
+
+    def set_thumb_info(self, entry):
+        row = self.file_rows.get(entry.path)
+        if row is not None:
+            self.fileListWidget.item(row).setToolTip(entry.info_text())
+
+    def update_visible_thumbs(self):
+        """只为可见的行创建缩略图图标，上万个文件时列表也能立即显示"""
+        count = self.fileListWidget.count()
+        if not count or not self.thumb_entries:
+            return
+        viewport = self.fileListWidget.viewport()
+        first = self.fileListWidget.indexAt(QPoint(0, 0)).row()
+        last = self.fileListWidget.indexAt(QPoint(0, viewport.height() - 1)).row()
+        first = max(first, 0)
+        last = count - 1 if last < 0 else last
+        pending = {}  # 行号 -> ThumbEntry
+        for row in range(first, last + 1):
+            entry = self.thumb_entries.get(self.file_list[row])
+            if entry is not None and entry.has_thumb() and self.fileListWidget.item(row).icon().isNull():
+                pending[row] = entry
+        if not pending:
+            return
+        self.get_thumb_index().load_thumbs(pending.values())
+        for row, entry in pending.items():
+            thumb = entry.thumb_array()
+            if thumb is None:
+                continue
+            self.fileListWidget.item(row).setIcon(QIcon(QPixmap.fromImage(numpy_to_qimage(thumb))))
+
+    def show_file_at(self, index):
+        if not 0 <= index < len(self.file_list) or index == self.file_index:
+            return
+        self.file_index = index
+        self.fileListWidget.blockSignals(True)
+        self.fileListWidget.setCurrentRow(index)
+        self.fileListWidget.blockSignals(False)
+        self.show_img(self.file_list[index])
+
+    def on_file_row_changed(self, row):
+        self.show_file_at(row)
+
+    def show_prev(self):
+        self.show_file_at(self.file_index - 1)
+
+    def show_next(self):
+        self.show_file_at(self.file_index + 1)
+
+    def show_img(self, file_path, use_cache=True):
+        """
+        显示图片：优先使用预取缓存，否则在后台线程加载，加载完成后在界面线程显示。
+        use_cache 为 False 时总是从磁盘重新读取。
+        """
+        self.stroke_engine.end()
+        self.history.commit()
+        self.cancel_load()
+        self.show_started = time.perf_counter()
+        if use_cache:
+            self.stash_current()
+            result = self.load_cache.take(file_path)
+            if result is not None:
+                self.install_result(file_path, result)
+                self.record_show_time(cached=True)
+                return
+        else:
+            self.load_cache.discard(file_path)
+        worker = self.prefetch_workers.pop(file_path, None) if use_cache else None
+        if worker is None:
+            worker = self.create_load_worker(file_path)
+            self.thread_pool.start(worker)
+        # 正在预取的图片直接接管，不重复解码
+        self.load_worker = worker
+        self.show_progress_dialog(os.path.basename(file_path))
+
+    def create_load_worker(self, file_path, preview=None):
+        worker = LoadWorker(file_path, self.show_mode, preview)
+        worker.setAutoDelete(False)
+        worker.signals.progress.connect(lambda percent, w=worker: self.on_load_progress(w, percent))
+        worker.signals.finished.connect(lambda result, w=worker: self.on_load_finished(w, result))
+        self.load_workers.add(worker)
+        return worker
+
+    def stash_current(self):
+        """离开当前图片时，未编辑过的解码结果放回缓存，切换回来时不必重新解码"""
+        if not self.file_path or self.paintWidget.m_q_img.isNull() or self.history.has_changes():
+            return
+        if self.is_raw_img:
+            self.load_cache.put(self.file_path, {"raw_info": self.raw_info}, self.file_key)
+        else:
+            self.load_cache.put(self.file_path, {"image": self.paintWidget.m_q_img}, self.file_key)
+
+    def forget_file(self, file_path):
+        """文件将被改写：丢弃缓存的解码结果，取消正在进行的预取"""
+        target = os.path.normcase(os.path.abspath(file_path))
+        for path in set(self.load_cache.paths()) | set(self.prefetch_workers):
+            if os.path.normcase(os.path.abspath(path)) != target:
+                continue
+            self.load_cache.discard(path)
+            worker = self.prefetch_workers.pop(path, None)
+            if worker is not None:
+                worker.cancel()
+
+    def prefetch_neighbours(self):
+        """在后台预取当前图片前后的图片，取消已经不相邻的预取"""
+        if not 0 <= self.file_index < len(self.file_list):
             return
-        self.show_img(self.file_path)
+        wanted = [self.file_list[i] for i in (self.file_index + 1, self.file_index - 1, self.file_index + 2)
+                  if 0 <= i < len(self.file_list) and self.file_list[i] != self.file_path]
+        for file_path in list(self.prefetch_workers):
+            if file_path not in wanted:
+                self.prefetch_workers.pop(file_path).cancel()
+        for file_path in reversed(wanted):
+            self.load_cache.touch(file_path)
+        for file_path in wanted:
+            if file_path in self.load_cache or file_path in self.prefetch_workers:
+                continue
+            worker = self.create_load_worker(file_path, self.preview_settings())
+            self.prefetch_workers[file_path] = worker
+            self.prefetch_pool.start(worker)
 
+    def preview_settings(self):
+        """预取 raw 图时按当前的缩放和显示设置预先生成显示层"""
+        return {"scale": self.paintWidget.m_scale, "mode": self.show_mode,
+                "demosaic": self.demosaicComboBox.currentData() if self.show_mode == "RGB" else None,
+                "params": self.get_display_params(), "bit_depth": self.display_bit_depth}
+
+    def apply_preview(self, preview):
+        """预取时生成的显示层与当前视图和缩放一致时直接放入瓦片金字塔"""
+        view = self.raw_view
+        if preview is None or (preview["mode"], preview["demosaic"], preview["params"]) != \
+                (view.mode, view.demosaic, view.params):
+            return
+        if preview["level"] != self.paintWidget.m_pyramid.level_for_scale(self.paintWidget.m_scale):
+            return
+        self.paintWidget.setLevelImage(preview["level"], numpy_to_qimage(preview["array"]))
+
+    def show_progress_dialog(self, file_name):
+        if self.progress_dialog is None:
+            self.progress_dialog = QProgressDialog(self)
+            self.progress_dialog.setWindowTitle("加载")
+            self.progress_dialog.setCancelButtonText("取消")
+            self.progress_dialog.setRange(0, 100)
+            # 非模态，加载过程中界面仍可操作，也可以拖入新的文件
+            self.progress_dialog.setWindowModality(Qt.WindowModality.NonModal)
+            self.progress_dialog.setMinimumDuration(300)
+            self.progress_dialog.canceled.connect(self.cancel_load)
+        self.progress_dialog.setLabelText(f"正在加载 {file_name} ...")
+        self.progress_dialog.reset()
+        self.progress_dialog.setValue(0)
+
+    def cancel_load(self):
+        """取消尚未完成的加载"""
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+            self.load_worker = None
+        if self.progress_dialog is not None:
+            self.progress_dialog.reset()
+
+    def on_load_progress(self, worker, percent):
+        if worker is self.load_worker and self.progress_dialog is not None:
+            self.progress_dialog.setValue(percent)
+
+    def on_load_finished(self, worker, result):
+        self.load_workers.discard(worker)
+        if self.prefetch_workers.get(worker.file_path) is worker:
+            # 预取完成，放入缓存等待切换
+            del self.prefetch_workers[worker.file_path]
+            if not worker.is_cancelled():
+                self.load_cache.put(worker.file_path, result)
+            return
+        if worker is not self.load_worker or worker.is_cancelled():
+            return
+        self.load_worker = None
+        self.progress_dialog.reset()
+        if result is None:
+            return
+        if "error" in result:
+            QMessageBox.critical(self, "错误", result["error"])
+            return
+        self.install_result(worker.file_path, result)
+        self.record_show_time(cached=False)
 
+    def record_show_time(self, cached):
+        """记录从请求显示到图片安装完成的耗时"""
+        perf.record("show_img", (time.perf_counter() - self.show_started) * 1000, cached=cached)
 
+    def install_result(self, file_path, result):
+        """显示加载结果，并开始预取相邻的图片"""
+        self.file_path = file_path
+        self.file_key = result.get("file_key")
+        self.prefetch_neighbours()
 
-    def show_img(self, file_path):
-        file_name = os.path.basename(file_path)
-        surfix = os.path.splitext(file_name)[1].lower()
-        if surfix == ".bmp" or surfix == ".jpg" or surfix == ".png":
-            img = QImage(file_path)
+        if "image" in result:
+            img = result["image"]
+            # 加载期间显示模式可能已切换
             if self.show_mode == "GRAY":
                 img = img.convertToFormat(QImage.Format.Format_Grayscale8)
-            if img.isNull():
-                QMessageBox.critical(self, "错误", "无法加载图片")
-                return
+            else:
+                img = img.convertToFormat(QImage.Format.Format_RGB32)
             self.is_raw_img = False
-            self.img_copy = QImage(img)
+            self.raw_doc = None
+            self.displayTab.setEnabled(False)
+            self.update_stats_panel()
             self.paintWidget.setImage(img)
+            # 直接引用图像内存，撤销时按瓦片恢复
+            self.history.reset(qimage_to_numpy_view(img))
             self.imgWidthLineEdit.setText(str(img.width()))
             self.imgHeightLineEdit.setText(str(img.height()))
+            self.update_brush_color()
             return
-        elif surfix == ".raw":
-            img_info = read_raw(file_path)
-            if not img_info:
-                QMessageBox.critical(self, "错误", "无法加载图片, 不支持的raw图类型")
-                return
-            img = raw_to_QImage(img_info['raw_data'], img_info['raw_width'], img_info['raw_height'], img_info['pattern'],
-                            self.show_mode)
-            self.is_raw_img = True
-            self.img_copy = QImage(img)  # 保留原始图像的副本用于重置
-            self.raw_info = img_info
-            self.paintWidget.setImage(img)
-            self.imgWidthLineEdit.setText(str(img_info['raw_width']))
-            self.imgHeightLineEdit.setText(str(img_info['raw_height']))
-        else:
-            QMessageBox.critical(self, "错误", "不支持的文件类型")
+
+        img_info = result["raw_info"]
+        self.is_raw_img = True
+        self.raw_doc = RawDocument(img_info, file_path)
+        self.raw_info = img_info
+        # 位深相同时沿用当前的显示调整，便于连续查看同一组图片
+        if img_info['bit_depth'] != self.display_bit_depth:
+            self.reset_display_controls(img_info['bit_depth'], apply=False)
+        self.raw_doc.set_display_params(self.get_display_params())
+        self.displayTab.setEnabled(True)
+        self.set_raw_view()
+        self.apply_preview(result.get("preview"))
+        self.update_stats_panel()
+        self.history.reset(img_info['raw_data'])
+        self.imgWidthLineEdit.setText(str(img_info['raw_width']))
+        self.imgHeightLineEdit.setText(str(img_info['raw_height']))
+        # 颜色取值范围随位深变化
+        self.update_brush_color()
+
+    def reset_display_controls(self, bit_depth=None, apply=True):
+        """按位深设置显示调整滑块的范围并恢复默认值"""
+        if bit_depth is None or isinstance(bit_depth, bool):
+            bit_depth = self.display_bit_depth or 8
+        self.display_bit_depth = bit_depth
+        max_value = (1 << bit_depth) - 1
+        sliders = [self.blackSlider, self.whiteSlider, self.gammaSlider] + self.gainSliders
+        for slider in sliders:
+            slider.blockSignals(True)
+        self.blackSlider.setRange(0, max_value - 1)
+        self.blackSlider.setValue(0)
+        self.whiteSlider.setRange(1, max_value)
+        self.whiteSlider.setValue(max_value)
+        # 增益与伽马按百分比取值
+        for slider in self.gainSliders:
+            slider.setRange(25, 800)
+            slider.setValue(100)
+        self.gammaSlider.setRange(20, 300)
+        self.gammaSlider.setValue(100)
+        for slider in sliders:
+            slider.blockSignals(False)
+        self.update_display_labels()
+        if apply:
+            self.apply_display_params()
+
+    def get_display_params(self):
+        """由滑块取值生成显示变换参数，默认取值时与不做变换一致"""
+        max_value = (1 << (self.display_bit_depth or 8)) - 1
+        white = self.whiteSlider.value()
+        return DisplayParams(self.blackSlider.value(), None if white >= max_value else white,
+                             tuple(slider.value() / 100 for slider in self.gainSliders),
+                             self.gammaSlider.value() / 100)
+
+    def update_display_labels(self):
+        for slider, label in self.displayValueLabels.items():
+            if slider in (self.blackSlider, self.whiteSlider):
+                label.setText(str(slider.value()))
+            else:
+                label.setText(f"{slider.value() / 100:.2f}")
+
+    def on_display_slider_changed(self):
+        # 白电平不低于黑电平
+        if self.whiteSlider.value() <= self.blackSlider.value():
+            self.whiteSlider.blockSignals(True)
+            self.whiteSlider.setValue(self.blackSlider.value() + 1)
+            self.whiteSlider.blockSignals(False)
+        self.update_display_labels()
+        self.display_timer.start()
+
+    def apply_display_params(self):
+        """按当前滑块取值刷新显示，原始数据不变"""
+        self.display_timer.stop()
+        if not self.is_raw_img or self.raw_doc is None:
+            return
+        params = self.get_display_params()
+        if params == self.raw_doc.display_params:
+            return
+        self.raw_doc.set_display_params(params)
+        view = self.raw_doc.get_view(self.show_mode, self.demosaicComboBox.currentData())
+        if view is self.raw_view:
+            # 只有显示变换变化：保留瓦片金字塔，只重新生成当前缩放下可见的瓦片
+            self.paintWidget.replaceImage(view.q_img)
+            return
+        self.set_raw_view()
+
+    def on_auto_stretch(self):
+        """按百分位数自动设置黑电平和白电平"""
+        if not self.is_raw_img or self.raw_doc is None:
+            return
+        black, white = auto_stretch_levels(self.raw_doc.raw_array, self.raw_doc.bit_depth)
+        for slider, value in ((self.blackSlider, black), (self.whiteSlider, white)):
+            slider.blockSignals(True)
+            slider.setValue(value)
+            slider.blockSignals(False)
+        self.update_display_labels()
+        self.apply_display_params()
+
+    def update_stats_panel(self):
+        """统计标签页可见时刷新直方图和各通道统计，第一次显示时整帧计算"""
+        self.stats_timer.stop()
+        if self.opTabWidget.currentWidget() is not self.statsTab:
+            return
+        if not self.is_raw_img or self.raw_doc is None:
+            self.histogramWidget.setHistograms(None)
+            self.statsLabel.setText("只支持raw图")
+            return
+        stats = self.raw_doc.get_stats()
+        self.histogramWidget.setHistograms(stats.hist)
+        lines = ["    均值    最小  最大  饱和"]
+        for name, item in zip(stats_channel_names, stats.summary()):
+            lines.append(f"{name:<3}{item['mean']:7.1f} {item['min']:5d} {item['max']:5d} {item['saturated']:5d}")
+        self.statsLabel.setText("\n".join(lines))
+
+    def set_raw_view(self):
+        """按当前显示模式从文档取显示视图，显示数据按可见区域懒解码"""
+        self.raw_view = self.raw_doc.get_view(self.show_mode, self.demosaicComboBox.currentData())
+        self.paintWidget.setImage(self.raw_view.q_img, self.raw_view.ensure_rect, self.raw_view.sample_level)
 
     def dragEnterEvent(self, event: QDragEnterEvent):
         """拖拽进入时检查文件类型"""
@@ -205,27 +782,24 @@ class MainWidget(QWidget):
             event.ignore()
 
     def dropEvent(self, event: QDropEvent):
-        """释放文件时触发，只支持单个文件"""
+        """释放文件时触发，支持多个文件和文件夹，拖入的图片组成可前后切换的文件列表"""
         if event.mimeData().hasUrls():
-            urls = event.mimeData().urls()
-            print(urls)
-            # 检查文件数量
-            if len(urls) != 1:
-                QMessageBox.critical(self, "错误", "只支持拖入单个文件，请重新拖拽")
-                event.ignore()
-                return
-
-            # 检查是否为文件夹
-            file_path = urls[0].toLocalFile()
-            if os.path.isdir(file_path):
-                QMessageBox.critical(self, "错误", "不支持拖入文件夹，请拖入单个文件")
+            file_list = []
+            for url in event.mimeData().urls():
+                path = url.toLocalFile()
+                if os.path.isdir(path):
+                    # 文件夹只取第一层中支持的图片
+                    file_list.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                                     if name.lower().endswith(image_suffixes))
+                elif path.lower().endswith(image_suffixes):
+                    file_list.append(path)
+            if not file_list:
+                QMessageBox.critical(self, "错误", "没有可加载的图片，支持 raw/bmp/jpg/png")
                 event.ignore()
                 return
 
             event.acceptProposedAction()
-            self.file_path = file_path
-            # 显示图片
-            self.show_img(file_path)
+            self.set_file_list(file_list)
 
         else:
             event.ignore()
@@ -239,13 +813,7 @@ class MainWidget(QWidget):
         if not self.is_drawing:
             self.is_drawing = True
             self.paintWidget.m_enabel_move = False
-
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            svg_path = os.path.join(current_dir, "../resource/pen.svg")
-            pen_icon = QIcon(svg_path)
-            pixmap = pen_icon.pixmap(QSize(32, 32))
-            pen_cursor = QCursor(pixmap, hotX=2, hotY=28)
-            self.setCursor(pen_cursor)
+            self.setCursor(get_pen_cursor())
 
             # 设置按钮文本
             self.drawImgBtn.setText("结束绘制")
@@ -256,32 +824,262 @@ class MainWidget(QWidget):
             # 恢复默认鼠标光标
             self.setCursor(Qt.CursorShape.ArrowCursor)
             self.drawImgBtn.setText("绘制")
+            self.cancel_shape()
+
+    def get_max_color_value(self):
+        """当前图像颜色值上限，raw图为其原始位深的最大值"""
+        if self.is_raw_img and self.raw_info:
+            return (1 << self.raw_info["bit_depth"]) - 1
+        return 255
 
     def get_color_from_input(self):
-        """从输入框获取颜色值，默认为黑色"""
+        """从输入框获取颜色值 (r, g, b)，默认为黑色；raw图按原始位深取值，输入无效时返回 None"""
+        max_value = self.get_max_color_value()
         try:
             r = int(self.colorRLineEdit.text()) if self.colorRLineEdit.text() else 0
             g = int(self.colorGLineEdit.text()) if self.colorGLineEdit.text() else 0
             b = int(self.colorBLineEdit.text()) if self.colorBLineEdit.text() else 0
-            return QColor(r, g, b)
+            return tuple(min(max(v, 0), max_value) for v in (r, g, b))
         except ValueError:
-            QMessageBox.warning(self, "提示", "请输入有效的颜色值（0-255）")
-            return QColor(0, 0, 0)
+            return None
+
+    def update_brush_color(self):
+        """输入框内容变化时更新笔刷颜色缓存，输入无效时保留原值"""
+        color = self.get_color_from_input()
+        if color is not None:
+            self.brush_color = color
+
+    def check_color_input(self):
+        """输入完成时提示无效的颜色值"""
+        if self.get_color_from_input() is None:
+            QMessageBox.warning(self, "提示", f"请输入有效的颜色值（0-{self.get_max_color_value()}）")
+
+    def on_brush_size_changed(self, value):
+        self.brush_size = value
+
+    def on_stroke_begin(self):
+        """按下鼠标开始一笔，一笔对应一条撤销记录"""
+        if not self.is_drawing or not self.paintWidget.m_is_mouse_pressed or self.is_saving():
+            return
+        tool = self.toolComboBox.currentData()
+        if tool != "brush":
+            self.on_shape_press(tool)
+            return
+        self.history.begin()
+        self.stroke_engine.begin(self.paintWidget.getImgPos(clip=False))
+
+    def on_stroke_end(self):
+        if self.toolComboBox.currentData() in ("rect", "ellipse") and self.shape_points:
+            points, self.shape_points = self.shape_points, []
+            points[-1] = self.shape_img_pos()
+            self.paintWidget.setShapePreview()
+            self.apply_shape(self.shape_mask(self.toolComboBox.currentData(), points))
+            return
+        self.stroke_engine.end()
+        self.history.commit()
 
+    @perf.timed("draw_event")
     def draw_event(self):
-        """绘制事件处理"""
+        """绘制事件处理：只记录采样点，由笔画引擎按帧合并绘制"""
         if not self.is_drawing:
             return
+        tool = self.toolComboBox.currentData()
+        if tool in ("rect", "ellipse", "polygon"):
+            if tool == "polygon" and self.shape_points:
+                # 多边形跟随鼠标显示下一条边
+                self.paintWidget.setShapePreview(tool, self.shape_points + [self.shape_img_pos()])
+            elif self.shape_points and self.paintWidget.m_is_mouse_pressed:
+                # 拖动中的矩形/椭圆更新对角点
+                self.shape_points[-1] = self.shape_img_pos()
+                self.paintWidget.setShapePreview(tool, self.shape_points)
+            return
 
         if self.paintWidget.m_is_mouse_pressed:
-            color = self.get_color_from_input()
-            img_pos = self.paintWidget.getImgPos()
-            self.paintWidget.draw_img(img_pos, color, self.penSizeSlider.value())
+            self.stroke_engine.addPoint(self.paintWidget.getImgPos(clip=False))
+
+    def shape_img_pos(self):
+        pos = self.paintWidget.getImgPos(clip=False)
+        return int(pos.x()), int(pos.y())
+
+    def on_shape_press(self, tool):
+        point = self.shape_img_pos()
+        if tool == "fill":
+            self.apply_shape(self.shape_mask(tool, [point]))
+        elif tool == "polygon":
+            self.shape_points.append(point)
+            self.paintWidget.setShapePreview(tool, self.shape_points)
+        else:
+            self.shape_points = [point, point]
+            self.paintWidget.setShapePreview(tool, self.shape_points)
+
+    def on_shape_double_clicked(self):
+        """双击结束多边形"""
+        if not self.is_drawing or self.toolComboBox.currentData() != "polygon" or not self.shape_points:
+            return
+        points, self.shape_points = self.shape_points, []
+        self.paintWidget.setShapePreview()
+        self.apply_shape(self.shape_mask("polygon", points))
+
+    def cancel_shape(self):
+        self.shape_points = []
+        self.paintWidget.setShapePreview()
+
+    def shape_mask(self, tool, points):
+        """把形状光栅化为 (x0, y0, mask)，raw图按所选通道限制"""
+        channel = self.channelComboBox.currentData() if self.is_raw_img else None
+        if self.is_raw_img:
+            values = self.raw_info["raw_data"]
+        else:
+            values = qimage_to_numpy_view(self.paintWidget.m_q_img)
+        shape = values.shape[:2]
+        if tool == "rect":
+            result = rect_mask(points[0], points[-1], shape)
+        elif tool == "ellipse":
+            result = ellipse_mask(points[0], points[-1], shape)
+        elif tool == "polygon":
+            result = polygon_mask(points, shape)
+        elif self.is_raw_img:
+            return bayer_flood_fill_mask(values, self.raw_info["pattern"], *points[0], self.toleranceSpinBox.value(),
+                                         channel)
+        else:
+            if values.shape[2] > 1:
+                # 普通彩色图片按亮度比较
+                values = (values[:, :, 2].astype(np.uint16) * 11 + values[:, :, 1].astype(np.uint16) * 16
+                          + values[:, :, 0].astype(np.uint16) * 5) // 32
+            else:
+                values = values[:, :, 0]
+            return flood_fill_mask(values, *points[0], self.toleranceSpinBox.value())
+        if result is None:
+            return None
+        x0, y0, mask = result
+        if channel is not None:
+            mask = restrict_to_channel(x0, y0, mask, self.raw_info["pattern"], channel)
+        return x0, y0, mask
+
+    @perf.timed("shape")
+    def apply_shape(self, shape):
+        """把形状掩码一次写入图像，作为一条撤销记录"""
+        if shape is None or self.is_saving() or not shape[2].any():
+            return
+        x0, y0, mask = shape
+        rect = (x0, y0, mask.shape[1], mask.shape[0])
+        color = self.brush_color
+        self.history.commit()
+        self.history.begin()
+        self.history.record(*rect)
+        if self.is_raw_img:
+            self.raw_doc.begin_change(*rect, mask=mask)
+            apply_mask_on_raw(self.raw_info["raw_data"], x0, y0, mask, color, self.raw_info["pattern"],
+                              self.show_mode, self.get_max_color_value())
+            self.history.commit()
+            self.refresh_img_rect(rect, mask)
+            return
+        img = self.paintWidget.m_q_img
+        if img.format() == QImage.Format.Format_Grayscale8:
+            value = qGray(*color)
+        else:
+            value = (color[2], color[1], color[0], 255)  # RGB32 在内存中为 B, G, R, A
+        fill_mask(qimage_to_numpy_view(img), x0, y0, mask, value)
+        self.history.commit()
+        self.paintWidget.updateImageRect(*rect)
+
+    def draw_stroke(self, points):
+        """绘制一帧内缓存的连续线段"""
+        if self.is_raw_img:
+            self.draw_raw_img(points, self.brush_color, self.brush_size)
+        else:
+            width = self.brush_size
+            xs = [x for x, _ in points]
+            ys = [y for _, y in points]
+            self.history.record(min(xs) - width, min(ys) - width,
+                                max(xs) - min(xs) + 2 * width + 1, max(ys) - min(ys) + 2 * width + 1)
+            self.paintWidget.draw_polyline(points, QColor(*self.brush_color), width)
+
+    @perf.timed("draw")
+    def draw_raw_img(self, points, color, width):
+        """在原始位深的raw数据上绘制，再刷新显示图像的对应区域"""
+        raw_array = self.raw_info["raw_data"]
+        # 掩码已裁剪到图像范围内
+        stroke = stroke_mask(points, width, raw_array.shape)
+        if stroke is None:
+            return
+        x0, y0, mask = stroke
+        rect = (x0, y0, mask.shape[1], mask.shape[0])
+        self.history.record(*rect)
+        self.raw_doc.begin_change(*rect, mask=mask)
+        apply_mask_on_raw(raw_array, x0, y0, mask, color, self.raw_info["pattern"],
+                          self.show_mode, self.get_max_color_value())
+        self.refresh_img_rect(rect, mask)
+
+    def refresh_img_rect(self, rect, mask=None):
+        """图像数据在区域内被修改后刷新显示，mask 给出区域内实际被修改的像素"""
+        if self.is_raw_img:
+            self.raw_doc.mark_dirty(*rect, current_view=self.raw_view, mask=mask)
+            if self.raw_doc.stats is not None:
+                self.stats_timer.start()
+            # 去马赛克时修改会影响到周围的显示像素
+            halo = self.raw_view.halo
+            x, y, w, h = rect
+            rect = (x - halo, y - halo, w + 2 * halo, h + 2 * halo)
+        self.paintWidget.updateImageRect(*rect)
+
+    def on_import_defects(self):
+        """导入缺陷列表或缺陷图，所有缺陷一次写入，作为一条撤销记录"""
+        if not self.is_raw_img or self.raw_doc is None:
+            QMessageBox.warning(self, "提示", "请先加载raw图")
+            return
+        if self.stroke_engine.isActive() or self.is_saving():
+            return
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择缺陷文件", os.path.dirname(self.file_path),
+                                                   "缺陷文件 (*.csv *.npy *.png *.bmp *.tif *.tiff)")
+        if not file_path:
+            return
+        self.import_defects(file_path)
+
+    def import_defects(self, file_path):
+        doc = self.raw_doc
+        try:
+            with perf.timer("import_defects"):
+                xs, ys, values = load_defects(file_path, doc.raw_array.shape, doc.pattern, doc.bit_depth)
+                self.history.commit()
+                self.history.begin()
+                self.history.record_points(xs, ys)
+                doc.begin_points(xs, ys)
+                x, y, w, h = apply_defects(doc.raw_array, xs, ys, values)
+                doc.mark_points_dirty(xs, ys)
+                self.history.commit()
+        except (OSError, DefectImportError) as e:
+            QMessageBox.critical(self, "错误", f"导入缺陷失败: {e}")
+            return
+        if doc.stats is not None:
+            self.stats_timer.start()
+        halo = self.raw_view.halo
+        self.paintWidget.updateImageRect(x - halo, y - halo, w + 2 * halo, h + 2 * halo)
+        self.statusLabel.setText(f"已导入 {len(xs)} 个缺陷像素: {os.path.basename(file_path)}")
 
+    def on_undo(self):
+        """撤销"""
+        if self.stroke_engine.isActive() or self.is_saving():
+            return
+        if self.is_raw_img and self.history.undo_rect() is not None:
+            self.raw_doc.begin_change(*self.history.undo_rect())
+        rect = self.history.undo()
+        if rect is not None:
+            self.refresh_img_rect(rect)
+
+    def on_redo(self):
+        """重做"""
+        if self.stroke_engine.isActive() or self.is_saving():
+            return
+        if self.is_raw_img and self.history.redo_rect() is not None:
+            self.raw_doc.begin_change(*self.history.redo_rect())
+        rect = self.history.redo()
+        if rect is not None:
+            self.refresh_img_rect(rect)
 
     def on_save_btn_clicked(self):
         """保存图片"""
-        if self.paintWidget.m_q_img is None:
+        if self.paintWidget.m_q_img.isNull():
             QMessageBox.warning(self, "提示", "没有图片可保存")
             return
 
@@ -295,40 +1093,86 @@ class MainWidget(QWidget):
         if not file_path:
             return
 
+        self.stroke_engine.end()
+        self.history.commit()
+        self.forget_file(file_path)
         if self.is_raw_img:
-            origin_type = self.raw_info["origin_type"]
-            pattern = self.raw_info["pattern"]
-            if self.show_mode == "RGB":  # 拿到raw8数据
-                raw_data = qimage_to_raw_rgb(self.paintWidget.m_q_img, pattern)
+            source_path = self.raw_doc.file_path
+            to_source = bool(source_path) and os.path.abspath(file_path) == os.path.abspath(source_path)
+            if self.patchSaveCheckBox.isChecked() and source_path and os.path.exists(source_path):
+                # 增量保存：克隆原文件，只写修改过的行，再原子地替换目标文件
+                worker = SaveWorker(file_path, raw_info=self.raw_info, spans=self.raw_doc.dirty_spans(),
+                                    source_path=source_path, source_key=self.file_key)
             else:
-                raw_data = qimage_to_raw_gray(self.paintWidget.m_q_img)
-            if origin_type != "raw8":
-                raw_data = raw8_to_unpack16bit(raw_data, origin_type)
+                # 原始数据保持原位深，后台按原格式分行带写出（MIPI 紧凑格式重新打包）
+                worker = SaveWorker(file_path, raw_info=self.raw_info)
+            worker.to_source = to_source
+        else:
+            # 普通图片的像素内存会被直接编辑，交给后台线程前先深拷贝
+            worker = SaveWorker(file_path, q_img=self.paintWidget.m_q_img.copy())
+        worker.setAutoDelete(False)
+        worker.signals.finished.connect(self.on_save_finished)
+        self.save_worker = worker
+        self.saveBtn.setEnabled(False)
+        self.statusLabel.setText(f"正在保存 {file_path} ...")
+        self.thread_pool.start(worker)
 
-            # 直接保存为raw文件
-            try:
-                with open(file_path, "wb") as f:
-                    f.write(raw_data)
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"保存图片失败: {str(e)}")
-        # 非raw图直接使用QImage的保存功能
-        else :
-            if not self.paintWidget.m_q_img.save(file_path):
-                QMessageBox.critical(self, "错误", "保存图片失败")
+    def is_saving(self):
+        return self.save_worker is not None
 
-        QMessageBox.information(self, "成功", f"图片保存成功到{file_path}")
+    def on_save_finished(self, file_path, error):
+        worker, self.save_worker = self.save_worker, None
+        # 保存期间切换图片可能又预取了目标文件
+        self.forget_file(file_path)
+        self.saveBtn.setEnabled(True)
+        if error:
+            self.statusLabel.setText("保存失败")
+            QMessageBox.critical(self, "错误", f"保存图片失败: {error}")
+            return
+        if getattr(worker, "to_source", False) and worker.raw_info is self.raw_info:
+            # 已写回原文件，之后的增量保存只需写新的修改
+            self.raw_doc.clear_dirty()
+            self.file_key = file_key(file_path)
+        if worker is not None and worker.spans is not None:
+            self.statusLabel.setText(f"图片增量保存成功到{file_path}，写入 {worker.written_bytes / 1024:.1f} KB")
+            return
+        self.statusLabel.setText(f"图片保存成功到{file_path}")
 
     def on_radio_btn_changed(self):
         """显示模式切换事件"""
-        if self.rgbRadioBtn.isChecked():
-            self.show_mode = "RGB"
+        show_mode = "RGB" if self.rgbRadioBtn.isChecked() else "GRAY"
+        if show_mode == self.show_mode:
+            return
+        self.show_mode = show_mode
+        self.demosaicComboBox.setEnabled(show_mode == "RGB")
+        if self.paintWidget.m_q_img.isNull():
+            return
+        self.stroke_engine.end()
+        self.history.commit()
+
+        # raw图从内存中的文档切换显示视图，不重新读取文件，编辑内容保留
+        if self.is_raw_img:
+            self.set_raw_view()
+            return
+        # 普通图片直接转换当前(含编辑内容的)图像
+        if show_mode == "GRAY":
+            img = self.paintWidget.m_q_img.convertToFormat(QImage.Format.Format_Grayscale8)
         else:
-            self.show_mode = "GRAY"
+            img = self.paintWidget.m_q_img.convertToFormat(QImage.Format.Format_RGB32)
+        self.paintWidget.setImage(img)
+        self.history.reset(qimage_to_numpy_view(img))
 
-        # 如果当前是raw图，重新加载以应用显示模式
-        self.show_img(self.file_path)
+    def on_demosaic_changed(self):
+        """RGB 模式下切换去马赛克方法，只影响显示，不修改原始数据"""
+        if not self.is_raw_img or self.show_mode != "RGB":
+            return
+        self.stroke_engine.end()
+        self.history.commit()
+        self.set_raw_view()
 
     def on_reset_btn_clicked(self):
         print("重置")
         """重置图片为原始状态"""
-        self.show_img(self.file_path)
\ No newline at end of file
+        if not self.file_path:
+            return
+        self.show_img(self.file_path, use_cache=False)
\ No newline at end of file
@@ -1,10 +1,10 @@
-from PyQt6.QtCore import QPoint, QRect, Qt, pyqtSignal
-from PyQt6.QtGui import QPainter, QImage, QPalette, QTransform
-from PyQt6.QtWidgets import (
-    QWidget, QFileDialog, QMessageBox, QLineEdit, QPushButton,
-    QLabel, QHBoxLayout, QVBoxLayout, QGridLayout, QSpacerItem,
-    QSizePolicy, QDoubleSpinBox, QRadioButton, QComboBox, QApplication, QCheckBox, QProgressDialog, QTabWidget
-)
+import time
+
+from PyQt6.QtCore import QPoint, QPointF, QRect, QRectF, Qt, QTimer, pyqtSignal
+from PyQt6.QtGui import QPainter, QImage, QColor, QFont, QPen, QPolygonF
+from PyQt6.QtWidgets import QWidget
+from .tile_pyramid import TilePyramid
+from . import perf
 
 
 class PaintWidget(QWidget):
@@ -12,10 +12,13 @@ class PaintWidget(QWidget):
     mouse_pressed = pyqtSignal()
     mouse_released = pyqtSignal()
     mouse_moved = pyqtSignal()
+    mouse_double_clicked = pyqtSignal()
     def __init__(self, parent=None):
         super().__init__(parent)
         # 图像数据相关
         self.m_q_img = QImage()
+        self.m_prepare_rect = None  # 生成瓦片前回调，用于懒解码可见区域
+        self.m_pyramid = None  # 多分辨率瓦片缓存
         self.m_is_img_load = False
         self.m_scaled_img_width = None
         self.m_scaled_img_height = None
@@ -35,18 +38,86 @@ class PaintWidget(QWidget):
         self.setMouseTracking(True)  # 启用鼠标跟踪  即使鼠标没有点击也会触发move事件
         self.m_is_mouse_pressed = False
         self.m_enabel_move = True
+        # 形状工具的预览 (kind, [(x, y), ...] 图像坐标)，kind 为 "rect"、"ellipse" 或 "polygon"
+        self.m_shape_preview = None
 
         # 界面相关
         self.setMinimumWidth(400)
         self.setMinimumHeight(400)
         self.setStyleSheet("background-color: red;")
-    def setImage(self, image):
+        # 性能浮层
+        self.m_show_perf = False
+        self.m_perf_version = -1
+        self.m_perf_timer = QTimer(self)
+        self.m_perf_timer.setInterval(500)
+        self.m_perf_timer.timeout.connect(self.refreshPerfOverlay)
+
+    def setPerfOverlayVisible(self, visible):
+        """显示或隐藏左上角的性能浮层"""
+        self.m_show_perf = visible
+        if visible:
+            self.m_perf_timer.start()
+        else:
+            self.m_perf_timer.stop()
+        self.update()
+
+    def refreshPerfOverlay(self):
+        # 有新的统计数据时才重绘浮层
+        if perf.version != self.m_perf_version:
+            self.m_perf_version = perf.version
+            self.update(self.perfOverlayRect())
+
+    def perfOverlayRect(self):
+        return QRect(0, 0, min(self.width(), 560), 16 * 8 + 8)
+    def setImage(self, image, prepare_rect=None, sample_level=None):
+        """
+        设置显示图像。
+
+        prepare_rect(x, y, w, h) 在生成瓦片前以对应的图像区域调用，
+        图像数据懒加载时用于只解码需要显示的部分。
+        sample_level(level, x, y, w, h) 返回缩小 2^level 倍后某层区域的图像，缩小显示时不必解码整帧。
+        """
         self.m_q_img = image
+        self.m_prepare_rect = prepare_rect
+        self.m_pyramid = TilePyramid(image, prepare_rect, sample_level=sample_level)
         self.m_is_img_load = True
         self.update()
 
-    def paintEvent(self, event):
+    def replaceImage(self, image):
+        """同样大小的图像内容整体改变后调用，保留瓦片金字塔，重绘时只重新生成可见的瓦片"""
+        if not self.m_is_img_load or image.size() != self.m_q_img.size():
+            self.setImage(image, self.m_prepare_rect, self.m_pyramid.sample_level if self.m_pyramid else None)
+            return
+        self.m_q_img = image
+        self.m_pyramid.set_image(image)
+        self.update()
+
+    def setLevelImage(self, level, image):
+        """放入预先生成的金字塔第 level 层整层图像，该层的瓦片不必再生成"""
+        if self.m_is_img_load:
+            self.m_pyramid.put_level(level, image)
+            self.update()
+
+    def updateImageRect(self, x, y, w, h):
+        """图像数据在区域内被修改后调用，只刷新对应瓦片并重绘该区域在控件上的范围"""
+        if not self.m_is_img_load:
+            return
+        img_rect = QRect(x, y, w, h)
+        self.m_pyramid.update_rect(img_rect)
+        self.update(self.imageRectToWidget(img_rect))
+
+    def imageRectToWidget(self, img_rect):
+        """将图像坐标区域映射到控件坐标，向外扩展以覆盖缩放层级和取整带来的误差"""
+        level = self.m_pyramid.level_for_scale(self.m_scale)
+        margin = int((1 << level) * self.m_scale) + 2
+        x0 = int(self.m_draw_point.x() + img_rect.x() * self.m_scale)
+        y0 = int(self.m_draw_point.y() + img_rect.y() * self.m_scale)
+        x1 = int(self.m_draw_point.x() + (img_rect.x() + img_rect.width()) * self.m_scale) + 1
+        y1 = int(self.m_draw_point.y() + (img_rect.y() + img_rect.height()) * self.m_scale) + 1
+        return QRect(x0, y0, x1 - x0, y1 - y0).adjusted(-margin, -margin, margin, margin)
 
+    def paintEvent(self, event):
+        frame_start = time.perf_counter()
         painter = QPainter(self)
         if self.m_is_img_load:
             # 保存原始绘图状态
@@ -59,11 +130,59 @@ class PaintWidget(QWidget):
             widget_rect = QRect(0, 0, self.width(), self.height())
             self.inverse_transform, res = painter.transform().inverted()  # 获取逆矩阵
             img_view_rect = self.inverse_transform.mapRect(widget_rect)
+            # 局部重绘时只处理需要更新的区域
+            img_update_rect = self.inverse_transform.mapRect(event.rect()).adjusted(-1, -1, 1, 1)
+            painter.restore() # 恢复状态
             # print(img_view_rect)
-            # 绘制
-            painter.drawImage(img_view_rect, self.m_q_img, img_view_rect)
+            # 绘制：只绘制需更新区域内对应缩放层级的瓦片
+            self.m_pyramid.draw(painter, img_view_rect.intersected(img_update_rect), self.m_draw_point, self.m_scale)
+            if self.m_shape_preview is not None:
+                self.drawShapePreview(painter)
+        if self.m_show_perf:
+            self.drawPerfOverlay(painter)
+        painter.end()
+        perf.frame_presented(frame_start)
+
+    def setShapePreview(self, kind=None, points=None):
+        """设置形状工具的预览轮廓，kind 为 None 时清除"""
+        self.m_shape_preview = (kind, list(points)) if kind and points else None
+        self.update()
+
+    def drawShapePreview(self, painter):
+        kind, points = self.m_shape_preview
+        painter.save()
+        painter.translate(self.m_draw_point)
+        painter.scale(self.m_scale, self.m_scale)
+        pen = QPen(QColor(255, 255, 0))
+        pen.setCosmetic(True)
+        pen.setStyle(Qt.PenStyle.DashLine)
+        painter.setPen(pen)
+        # 轮廓画在像素中心上
+        polygon = QPolygonF([QPointF(x + 0.5, y + 0.5) for x, y in points])
+        if kind in ("rect", "ellipse") and len(points) == 2:
+            rect = QRectF(polygon[0], polygon[1]).normalized()
+            if kind == "rect":
+                painter.drawRect(rect)
+            else:
+                painter.drawEllipse(rect)
+        elif kind == "polygon":
+            painter.drawPolyline(polygon)
+        painter.restore()
 
-        painter.restore() # 恢复状态
+    def drawPerfOverlay(self, painter):
+        lines = perf.overlay_lines()
+        painter.save()
+        font = QFont("monospace")
+        font.setStyleHint(QFont.StyleHint.Monospace)
+        font.setPixelSize(12)
+        painter.setFont(font)
+        rect = self.perfOverlayRect()
+        rect.setHeight(16 * len(lines) + 8)
+        painter.fillRect(rect, QColor(0, 0, 0, 160))
+        painter.setPen(QColor(0, 255, 0))
+        for i, line in enumerate(lines):
+            painter.drawText(6, 16 * (i + 1), line)
+        painter.restore()
 
     def setZoom(self, scale):
 
@@ -112,6 +231,10 @@ class PaintWidget(QWidget):
 
         self.mouse_released.emit()
 
+    def mouseDoubleClickEvent(self, event):
+        if self.m_is_img_load and event.button() == Qt.MouseButton.LeftButton:
+            self.mouse_double_clicked.emit()
+
     def bound(self,min_val, val, max_val):
         return max(min_val, min(val, max_val))
 
@@ -143,11 +266,13 @@ class PaintWidget(QWidget):
         self.update()
 
 
-    def widgetToImagePos(self, widget_pos):
-        """将界面坐标转换为图像像素坐标"""
-        if not self.m_is_img_load:
+    def widgetToImagePos(self, widget_pos, clip=True):
+        """将界面坐标转换为图像像素坐标，clip 为 False 时不检查是否在图像范围内"""
+        if not self.m_is_img_load or self.inverse_transform is None:
             return None
         image_pos = self.inverse_transform.map(widget_pos)
+        if not clip:
+            return image_pos
 
         # 检查坐标是否在图像范围内
         if (0 <= image_pos.x() < self.m_q_img.width() and
@@ -155,19 +280,32 @@ class PaintWidget(QWidget):
             return image_pos
         return None
 
-    def getImgPos(self):
-        return self.widgetToImagePos(self.m_mouse_point)
+    def getImgPos(self, clip=True):
+        return self.widgetToImagePos(self.m_mouse_point, clip)
 
     def draw_img(self, img_pos, color, width=5):
         """在图像上绘制点"""
-        if not self.m_is_img_load:
-            return
         if img_pos is not None:
-            painter = QPainter(self.m_q_img)
-            pen = painter.pen()
-            pen.setColor(color)
-            pen.setWidth(width)
-            painter.setPen(pen)
-            painter.drawPoint(img_pos)
-            painter.end()
-            self.update()
+            self.draw_polyline([(img_pos.x(), img_pos.y())], color, width)
+
+    @perf.timed("draw")
+    def draw_polyline(self, points, color, width=5):
+        """在图像上用一个 QPainter 绘制一串相连的线段，points 为 [(x, y), ...] 图像坐标"""
+        if not self.m_is_img_load or not points:
+            return
+        painter = QPainter(self.m_q_img)
+        pen = painter.pen()
+        pen.setColor(color)
+        pen.setWidth(width)
+        pen.setCapStyle(Qt.PenCapStyle.SquareCap)
+        painter.setPen(pen)
+        if len(points) == 1:
+            painter.drawPoint(QPoint(*points[0]))
+        else:
+            painter.drawPolyline(*[QPoint(x, y) for x, y in points])
+        painter.end()
+        # 只刷新笔画覆盖的区域
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        self.updateImageRect(min(xs) - width, min(ys) - width,
+                             max(xs) - min(xs) + 2 * width + 1, max(ys) - min(ys) + 2 * width + 1)
@@ -0,0 +1,195 @@
+"""
+性能统计。
+
+各热点路径调用 record 记录耗时，按名称汇总为直方图，供画布上的性能浮层显示。
+设置环境变量 RAW_EDIT_TRACE 为文件路径（或目录）时，每条记录同时以 JSON 行追加写入该文件，
+退出时再写入一次各直方图的汇总，便于从现场机器收集。
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+trace_env = "RAW_EDIT_TRACE"
+
+
+class Histogram:
+    """
+    耗时直方图。
+
+    按 2 的幂划分桶（第 i 个桶为 [2^(i-1), 2^i) 毫秒，第 0 个桶为 1ms 以下），
+    另保留最近 size 个样本用于计算分位数。
+    """
+    bucket_count = 16
+
+    def __init__(self, name, size=1024):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.buckets = [0] * self.bucket_count
+        self.recent = deque(maxlen=size)
+
+    def add(self, ms, nbytes=0):
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.bytes += nbytes
+        index = 0 if ms < 1 else min(int(math.log2(ms)) + 1, self.bucket_count - 1)
+        self.buckets[index] += 1
+        self.recent.append(ms)
+
+    def percentile(self, p):
+        if not self.recent:
+            return 0.0
+        samples = sorted(self.recent)
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "max_ms": round(self.max, 3),
+            "bytes": self.bytes,
+            "buckets": list(self.buckets),
+        }
+
+
+_lock = threading.Lock()
+_histograms = {}
+_trace_file = None
+_trace_opened = False
+_input_time = None
+_startup_time = None
+version = 0  # 每次记录加一，浮层据此判断是否需要刷新
+
+
+def get_histogram(name):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(name)
+        return histogram
+
+
+def histograms():
+    with _lock:
+        return dict(_histograms)
+
+
+def trace_path():
+    path = os.environ.get(trace_env)
+    if not path:
+        return None
+    if os.path.isdir(path):
+        path = os.path.join(path, f"raw_edit_trace_{os.getpid()}.jsonl")
+    return path
+
+
+def _write_trace(entry):
+    """调用方需持有 _lock"""
+    global _trace_file, _trace_opened
+    if not _trace_opened:
+        _trace_opened = True
+        path = trace_path()
+        if path:
+            try:
+                _trace_file = open(path, "a", encoding="utf-8", buffering=1)
+                atexit.register(write_summary)
+            except OSError:
+                _trace_file = None
+    if _trace_file is not None:
+        _trace_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def record(name, ms, nbytes=0, **fields):
+    """记录一次耗时 (毫秒)，nbytes 为该操作分配或读写的字节数"""
+    global version
+    histogram = get_histogram(name)
+    with _lock:
+        histogram.add(ms, nbytes)
+        version += 1
+        entry = {"t": round(time.time(), 6), "name": name, "ms": round(ms, 3)}
+        if nbytes:
+            entry["bytes"] = nbytes
+        entry.update(fields)
+        _write_trace(entry)
+
+
+@contextmanager
+def timer(name, nbytes=0, **fields):
+    """统计 with 块的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start) * 1000, nbytes, **fields)
+
+
+def timed(name, size=None):
+    """统计函数耗时的装饰器，size(result) 返回该次调用的字节数"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            record(name, (time.perf_counter() - start) * 1000, size(result) if size else 0)
+            return result
+        return wrapper
+    return decorator
+
+
+def mark_input(input_time):
+    """输入事件 (perf_counter 时间) 已作用到图像数据，等待下一帧显示"""
+    global _input_time
+    if input_time is not None and (_input_time is None or input_time < _input_time):
+        _input_time = input_time
+
+
+def mark_startup(start_time):
+    """程序启动 (perf_counter 时间)，第一帧显示时记录启动耗时 startup"""
+    global _startup_time
+    _startup_time = start_time
+
+
+def frame_presented(frame_start):
+    """一帧绘制完成：记录帧耗时，以及最早未显示的输入到显示的延迟"""
+    global _input_time, _startup_time
+    now = time.perf_counter()
+    record("frame", (now - frame_start) * 1000)
+    if _startup_time is not None:
+        record("startup", (now - _startup_time) * 1000)
+        _startup_time = None
+    if _input_time is not None:
+        record("stroke_latency", (now - _input_time) * 1000)
+        _input_time = None
+
+
+def write_summary():
+    with _lock:
+        summary = {name: histogram.summary() for name, histogram in _histograms.items()}
+        _write_trace({"t": round(time.time(), 6), "name": "summary", "histograms": summary})
+        if _trace_file is not None:
+            _trace_file.flush()
+
+
+def overlay_lines(names=("startup", "frame", "stroke_latency", "draw", "draw_event", "read_raw", "show_img",
+                         "save")):
+    """浮层显示的文本行"""
+    lines = []
+    with _lock:
+        for name in names:
+            histogram = _histograms.get(name)
+            if histogram is None or not histogram.count:
+                continue
+            lines.append(f"{name:<15} p50 {histogram.percentile(50):7.2f}  p95 {histogram.percentile(95):7.2f}  "
+                         f"max {histogram.max:7.2f} ms  n={histogram.count}")
+    return lines or ["暂无性能数据"]
@@ -0,0 +1,1093 @@
+"""
+raw 图的纯 numpy 核心：文件名解析、位深与显示查找表、raw8/unpack/MIPI 编解码、保存与局部回写、
+拜耳通道运算、去马赛克、笔刷掩码和缩略图。
+
+本模块不依赖 Qt，批处理脚本和后台进程可以直接导入；与 QImage 之间的转换在 raw_process_util 中。
+"""
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+pattern_list = ["GRBG", "GBRG", "RGGB", "BGGR"]
+import re
+
+from . import perf
+
+# 各 raw 类型的有效位深
+raw_bit_depth = {
+    "raw8": 8,
+    "unpack10": 10,
+    "unpack12": 12,
+    "mipi10": 10,
+    "mipi12": 12,
+}
+
+# MIPI CSI-2 紧凑格式：每组像素数与字节数 (RAW10: 4像素5字节，RAW12: 2像素3字节)
+mipi_group_size = {
+    "mipi10": (4, 5),
+    "mipi12": (2, 3),
+}
+
+# 2x2 拜耳单元中每个位置对应的通道 (0:R 1:G 2:B)，按 [行奇偶][列奇偶] 索引
+cfa_channel_table = {
+    "GRBG": ((1, 0), (2, 1)),
+    "GBRG": ((1, 2), (0, 1)),
+    "RGGB": ((0, 1), (1, 2)),
+    "BGGR": ((2, 1), (1, 0)),
+}
+
+
+def parse_image_info(filename, image_types=None, bayer_patterns=None):
+    """
+    从文件名中解析图像信息，包括宽高、图片类型和拜耳模式。
+
+    参数:
+        filename (str): 待解析的文件名
+        image_types (list): 支持的图片类型列表，默认为常见类型
+        bayer_patterns (list): 支持的拜耳模式列表，默认为常见模式
+
+    返回:
+        dict: 包含宽、高、图片类型、拜耳模式的字典
+    """
+    # 默认支持的图片类型
+    if image_types is None:
+        image_types = ['unpack10', 'raw8','unpack12', 'mipi10', 'mipi12']
+
+    # 默认支持的拜耳模式
+    if bayer_patterns is None:
+        bayer_patterns = ['grbg', 'rggb', 'bggr', 'gbrg']
+
+    result = {
+        'width': None,
+        'height': None,
+        'image_type': None,
+        'bayer_pattern': None
+    }
+
+    # 1. 提取宽高（支持 数字X数字 格式）
+    resolution_match = re.search(r'(\d+)X(\d+)', filename, re.IGNORECASE)
+    if resolution_match:
+        result['width'] = int(resolution_match.group(1))
+        result['height'] = int(resolution_match.group(2))
+
+    # 2. 提取图片类型
+    for img_type in image_types:
+        if img_type.lower() in filename.lower():
+            result['image_type'] = img_type
+            break
+
+    # 3. 提取拜耳模式
+    for pattern in bayer_patterns:
+        if pattern.lower() in filename.lower():
+            result['bayer_pattern'] = pattern
+            break
+
+    return result
+
+
+
+def get_bit_depth(raw_type):
+    """获取 raw 类型对应的有效位深"""
+    return raw_bit_depth.get(raw_type, 8)
+
+
+# 显示变换参数，只影响显示，不修改原始数据
+# black/white 为原始位深下的黑电平和白电平 (white 为 None 时取最大值)，gains 为 R/G/B 通道增益，
+# gamma 为显示伽马 (输出 = 输入 ^ (1 / gamma))
+DisplayParams = namedtuple("DisplayParams", ["black", "white", "gains", "gamma"],
+                           defaults=(0, None, (1.0, 1.0, 1.0), 1.0))
+default_display_params = DisplayParams()
+
+
+@lru_cache(maxsize=64)
+def get_display_lut(bit_depth, black=0, white=None, gain=1.0, gamma=1.0):
+    """
+    生成 bit_depth 位原始值到 8bit 显示值的查找表 (2^bit_depth 项)，按参数缓存。
+
+    默认参数时直接截取高 8 位，与不做显示变换时一致。
+    """
+    if black == 0 and white is None and gain == 1.0 and gamma == 1.0:
+        values = np.arange(1 << bit_depth, dtype=np.uint32) >> (bit_depth - 8)
+        return values.astype(np.uint8)
+    max_value = (1 << bit_depth) - 1
+    white = max_value if white is None else white
+    values = (np.arange(1 << bit_depth, dtype=np.float64) - black) / max(white - black, 1) * gain
+    values = np.clip(values, 0.0, 1.0)
+    if gamma != 1.0:
+        values = values ** (1.0 / gamma)
+    return np.rint(values * 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=64)
+def get_index_lut(bit_depth, black=0, white=None, gain=1.0, gamma=1.0):
+    """
+    补齐到 65536 项的显示查找表，超出位深的值取最后一项 (与 np.take 的 clip 模式相同)。
+
+    uint8/uint16 的 raw 数组可以直接作为下标索引，不会越界。
+    """
+    lut = get_display_lut(bit_depth, black, white, gain, gamma)
+    index_lut = np.full(1 << 16, lut[-1], dtype=np.uint8)
+    index_lut[:len(lut)] = lut
+    return index_lut
+
+
+def get_display_luts(bit_depth, params=None):
+    """返回 R/G/B 三个通道的显示查找表 (补齐到 65536 项)"""
+    params = params or default_display_params
+    return tuple(get_index_lut(bit_depth, params.black, params.white, float(gain), params.gamma)
+                 for gain in params.gains)
+
+
+def apply_lut(lut, values, out=None, band_rows=64):
+    """
+    查表 lut[values]，超出查找表的值取最后一项。
+
+    查找表覆盖 uint8/uint16 的全部取值时直接索引：np.take 会先把下标整体转换为 intp，
+    多出每像素 8 字节的临时数组。out 为预先分配的数组时按行带写入，临时数组不超过一个行带。
+    """
+    if values.dtype.kind != "u" or len(lut) < 1 << (8 * values.dtype.itemsize):
+        return np.take(lut, values, mode='clip', out=out)
+    if out is None:
+        return lut[values]
+    for y in range(0, values.shape[0], band_rows):
+        out[y:y + band_rows] = lut[values[y:y + band_rows]]
+    return out
+
+
+def raw_to_display8(raw_array, bit_depth, params=None, pattern=None, x0=0, y0=0, out=None):
+    """
+    将原始位深的 raw 数组映射为 8bit 显示数组，每个拜耳相位查一次表，大图按行带并行。
+
+    params 为显示变换参数，为空时按默认参数，raw8 且未给出 out 时直接返回原数组不拷贝。
+    各通道增益不同时需要给出拜耳模式 pattern 和数组左上角的图像坐标 (x0, y0)。
+    out 为预先分配的 uint8 数组时结果直接写入其中，不再分配整帧的新数组。
+    """
+    params = params or default_display_params
+    if params == default_display_params and bit_depth == 8 and out is None:
+        return raw_array
+    if out is None:
+        out = np.empty(raw_array.shape, dtype=np.uint8)
+    run_bands(lambda b0, b1: display8_band(raw_array[b0:b1], bit_depth, params, pattern, x0, y0 + b0, out[b0:b1]),
+              len(raw_array), row_nbytes(raw_array))
+    return out
+
+
+def raw_to_rgb_mosaic8(raw_array, bit_depth, pattern, params=None, x0=0, y0=0, out=None):
+    """
+    将原始位深的 raw 数组经显示查找表直接写为 8bit RGB 拜耳马赛克 (每个像素只有所在通道非零)。
+
+    每个行带按拜耳相位查表后直接写入 out 的对应通道，不经过整帧的 8bit 中间数组；大图按行带并行。
+    (x0, y0) 为数组左上角的图像坐标，用于确定拜耳相位。pattern 不支持时返回 None。
+    """
+    if pattern not in cfa_channel_table:
+        return None
+    luts = get_display_luts(bit_depth, params)
+    if out is None:
+        out = np.empty(raw_array.shape + (3,), dtype=np.uint8)
+
+    def convert(b0, b1):
+        band = out[b0:b1]
+        band[...] = 0
+        for dy, dx, channel in cfa_phases(pattern, x0, y0 + b0):
+            apply_lut(luts[channel], raw_array[b0 + dy:b1:2, dx::2], band[dy::2, dx::2, channel])
+
+    run_bands(convert, len(raw_array), row_nbytes(out))
+    return out
+
+
+def display8_band(raw_array, bit_depth, params, pattern, x0, y0, out):
+    """raw_to_display8 的一个行带"""
+    if params == default_display_params:
+        if bit_depth == 8:
+            out[...] = raw_array
+        else:
+            apply_lut(get_index_lut(bit_depth), raw_array, out)
+        return
+    luts = get_display_luts(bit_depth, params)
+    if luts[0] is luts[1] is luts[2]:
+        apply_lut(luts[0], raw_array, out)
+        return
+    for dy, dx, channel in cfa_phases(pattern, x0, y0):
+        apply_lut(luts[channel], raw_array[dy::2, dx::2], out[dy::2, dx::2])
+
+
+def sample_display8(raw_array, pattern, bit_depth, params, step, x0, y0, width, height, mode="GRAY",
+                    demosaic=False):
+    """
+    每隔 step 个像素 (step 为偶数) 取一个完整的 2x2 拜耳单元，生成缩小 step 倍的 8bit 显示数组。
+
+    输出像素 (i, j) 对应原图中 (x0 + j * step, y0 + i * step) 起的 step x step 区域，取区域中心附近的拜耳单元，
+    只读取这些单元，不需要先转换整帧。结果近似完整显示图缩小 step 倍：GRAY 为单元内 4 个像素显示值的均值，
+    RGB 去马赛克时 R/B 取各自的值、G 取 Gr 和 Gb 的均值，不去马赛克时为马赛克图缩小后各通道的值。
+
+    返回:
+        np.ndarray: GRAY 为 (height, width)，RGB 为 (height, width, 3) 的 uint8 数组
+    """
+    raw_height, raw_width = raw_array.shape[:2]
+    offset = (step // 2) & ~1
+    rows = np.minimum(y0 + offset + np.arange(height) * step, max((raw_height & ~1) - 2, 0))
+    cols = np.minimum(x0 + offset + np.arange(width) * step, max((raw_width & ~1) - 2, 0))
+    luts = get_display_luts(bit_depth, params)
+    sums = np.zeros((height, width, 3), dtype=np.uint16)
+    for dy, dx, channel in cfa_phases(pattern, 0, 0):
+        sums[:, :, channel] += apply_lut(luts[channel], raw_array[np.ix_(rows + dy, cols + dx)])
+    if mode == "GRAY":
+        return ((sums.sum(axis=2, dtype=np.uint16) + 2) // 4).astype(np.uint8)
+    if demosaic:
+        sums[:, :, 1] = (sums[:, :, 1] + 1) // 2
+        return sums.astype(np.uint8)
+    # 马赛克图中每个 2x2 单元里 R/B 各占 1 个像素、G 占 2 个，其余通道为 0
+    return ((sums + 2) // 4).astype(np.uint8)
+
+
+def auto_stretch_levels(raw_array, bit_depth, low=0.1, high=99.9, step=4):
+    """
+    按百分位数估计自动拉伸的黑电平和白电平，返回 (black, white)。
+
+    每个拜耳相位各隔 step 个单元取样，各通道的样本比例与原图一致。
+    """
+    max_value = (1 << bit_depth) - 1
+    samples = np.concatenate([raw_array[dy::2 * step, dx::2 * step].ravel() for dy in range(2) for dx in range(2)])
+    if samples.size == 0:
+        return 0, max_value
+    hist = np.bincount(np.minimum(samples, max_value), minlength=max_value + 1)
+    cdf = np.cumsum(hist) / samples.size
+    black = int(np.searchsorted(cdf, low / 100))
+    white = int(np.searchsorted(cdf, high / 100))
+    if white <= black:
+        white = min(black + 1, max_value)
+        black = white - 1
+    return black, white
+
+
+def bayer_thumbnail(raw_array, pattern, bit_depth, max_size=96, band_bytes=4 * 1024 * 1024,
+                    raw_type=None, raw_width=None):
+    """
+    生成已去马赛克的 RGB888 缩略图，长边不超过 max_size，返回 (高, 宽, 3) 的 uint8 数组。
+
+    每个缩略图像素对应 step x step 的区域 (step 为偶数)，区域内完整的 2x2 拜耳单元按通道求平均，
+    R/B 取各自的均值，G 取 Gr 和 Gb 的均值，因此不需要插值。按行带读取，内存映射的数据不会整帧读入。
+    raw_type 为 MIPI 类型时 raw_array 为 (H, stride) 的紧凑数据，需同时给出 raw_width，
+    逐个行带解包，不会解出整帧，也不解包缩略图用不到的末尾几行。
+    """
+    packed = raw_type in mipi_group_size
+    height = raw_array.shape[0]
+    width = raw_width if packed else raw_array.shape[1]
+    itemsize = 2 if packed else raw_array.itemsize
+    step = 2 * max(1, -(-max(width, height) // (2 * max_size)))
+    thumb_width, thumb_height = width // step, height // step
+    if thumb_width == 0 or thumb_height == 0:
+        return None
+    sums = np.zeros((thumb_height, thumb_width, 3), dtype=np.float64)
+    band = max(1, band_bytes // max(step * width * itemsize, 1))
+    if packed:
+        unpacked = np.empty((min(band, thumb_height) * step, width), dtype=np.uint16)
+    for ty in range(0, thumb_height, band):
+        rows = min(band, thumb_height - ty)
+        if packed:
+            band_array = unpack_mipi(raw_array[ty * step:(ty + rows) * step], width, raw_type,
+                                     out=unpacked[:rows * step])
+        else:
+            band_array = raw_array[ty * step:(ty + rows) * step]
+        block = band_array[:, :thumb_width * step].reshape(rows, step, thumb_width, step)
+        for dy, dx, channel in cfa_phases(pattern, 0, 0):
+            sums[ty:ty + rows, :, channel] += block[:, dy::2, :, dx::2].sum(axis=(1, 3), dtype=np.float64)
+    quads = (step // 2) ** 2
+    sums /= np.array([quads, 2 * quads, quads], dtype=np.float64)
+    values = np.minimum(np.rint(sums).astype(np.intp), (1 << bit_depth) - 1)
+    return np.take(get_display_lut(bit_depth), values)
+
+
+# 整帧转换按行带在线程池中并行，NumPy 运算会释放 GIL
+threads_env = "RAW_EDIT_THREADS"
+default_band_bytes = 1 << 20  # 每个行带约 1MB，处理时留在缓存中
+_executor = None
+_worker_count = None
+_thread_state = threading.local()
+
+
+def get_worker_count():
+    """并行线程数，默认为 CPU 核数，可用环境变量 RAW_EDIT_THREADS 或 set_worker_count 指定"""
+    if _worker_count is not None:
+        return _worker_count
+    try:
+        return max(1, int(os.environ.get(threads_env, "")))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+def set_worker_count(count=None):
+    """修改并行线程数，None 时恢复默认；已有的线程池在当前任务完成后关闭"""
+    global _executor, _worker_count
+    _worker_count = None if count is None else max(1, int(count))
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+def _mark_worker():
+    _thread_state.in_worker = True
+
+
+def get_executor():
+    """整帧转换和显示瓦片共用的线程池"""
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers=get_worker_count(), thread_name_prefix="raw_band",
+                                       initializer=_mark_worker)
+    return _executor
+
+
+def split_bands(height, row_bytes, band_bytes=None):
+    """
+    把 [0, height) 行划分为约 band_bytes 字节 (默认 default_band_bytes) 的行带 [(y0, y1), ...]，
+    每个行带从偶数行开始，保持拜耳相位。
+    """
+    band_bytes = band_bytes or default_band_bytes
+    rows = max(2, band_bytes // max(int(row_bytes), 1)) & ~1
+    return [(y, min(y + rows, height)) for y in range(0, height, rows)]
+
+
+def run_bands(func, height, row_bytes, band_bytes=None):
+    """
+    对每个行带调用 func(y0, y1)。
+
+    各行带写入的区域不能重叠，这样并行与串行的结果完全相同。只有一个行带、线程数为 1，
+    或者已经在线程池的线程中 (避免嵌套提交后互相等待) 时直接串行执行。
+    """
+    bands = split_bands(height, row_bytes, band_bytes)
+    if len(bands) == 1 or get_worker_count() == 1 or getattr(_thread_state, "in_worker", False):
+        for y0, y1 in bands:
+            func(y0, y1)
+        return
+    for _ in get_executor().map(lambda band: func(*band), bands):
+        pass
+
+
+def row_nbytes(array):
+    """数组第一维每一项 (二维时为一行) 的字节数"""
+    return array.nbytes // max(len(array), 1)
+
+
+def allocated_bytes(array):
+    """数组自身分配的内存字节数；内存映射文件的数据由页缓存承载，按需读入且可被回收，记为 0"""
+    return 0 if isinstance(array, np.memmap) else array.nbytes
+
+
+def get_raw8(raw_data, raw_type):
+    diff_bit = 2
+    if raw_type == 'unpack10':
+        diff_bit = 2
+    elif raw_type == 'unpack12':
+        diff_bit = 4
+    if raw_type != 'raw8':
+        data_array = raw_data if isinstance(raw_data, np.ndarray) else np.frombuffer(raw_data, dtype=np.uint16)
+        raw8_values = np.empty(data_array.shape, dtype=np.uint8)
+
+        def convert(y0, y1):
+            # 与 (data >> diff_bit).astype(np.uint8) 相同，超出 8 位的部分按 uint8 截断
+            np.right_shift(data_array[y0:y1], diff_bit, out=raw8_values[y0:y1], casting='unsafe')
+
+        run_bands(convert, len(data_array), row_nbytes(data_array))
+        return raw8_values
+    else:
+        return raw_data
+
+def raw8_to_unpack16bit(raw8_data, raw_type):
+    if raw_type == 'unpack10':
+        diff_bit = 2
+    elif raw_type == 'unpack12':
+        diff_bit = 4
+    else:
+        return None
+    data_array = raw8_data if isinstance(raw8_data, np.ndarray) else np.frombuffer(raw8_data, dtype=np.uint8)
+    raw10_values = np.empty(data_array.shape, dtype=np.uint16)
+
+    def convert(y0, y1):
+        band = raw10_values[y0:y1]
+        band[...] = data_array[y0:y1]
+        band <<= diff_bit
+
+    run_bands(convert, len(data_array), row_nbytes(raw10_values))
+    return raw10_values
+
+def get_mipi_min_stride(raw_width, raw_type):
+    """MIPI 紧凑格式一行数据的最小字节数（不含行尾填充）"""
+    pixels, nbytes = mipi_group_size[raw_type]
+    return (raw_width + pixels - 1) // pixels * nbytes
+
+
+@lru_cache(maxsize=None)
+def get_mipi_low_bits_lut(raw_type):
+    """MIPI 紧凑格式低位字节查找表：低位字节值 -> 组内各像素的低位"""
+    pixels, _ = mipi_group_size[raw_type]
+    low_bits = get_bit_depth(raw_type) - 8
+    values = np.arange(256, dtype=np.uint16)
+    lut = np.empty((256, pixels), dtype=np.uint16)
+    for i in range(pixels):
+        lut[:, i] = (values >> (low_bits * i)) & ((1 << low_bits) - 1)
+    return lut
+
+
+def get_mipi_band_rows(groups):
+    """按每行的组数计算行带高度，使每个行带的中间数据能留在缓存中"""
+    return max(1, 8192 // max(groups, 1))
+
+
+def unpack_mipi(packed, raw_width, raw_type, out=None, progress_callback=None):
+    """
+    解包 MIPI CSI-2 紧凑格式 (RAW10: 4像素5字节，RAW12: 2像素3字节)。
+
+    每组前几个字节依次为各像素的高 8 位，最后一个字节依次存放各像素的低位。
+    高位字节以步长为组字节数的 uint32/uint16 视图一次取出，低位通过查找表展开，
+    按行带处理，全程没有 Python 层的逐像素循环。
+
+    参数:
+        packed (np.ndarray): (H, stride) 的 uint8 数组，stride 可包含行尾填充
+        raw_width (int): 图像宽度
+        raw_type (str): "mipi10" 或 "mipi12"
+        out (np.ndarray): 可选的 (H, W) uint16 输出数组
+        progress_callback (callable): 可选，每个行带完成后以 (已完成行数, 总行数) 调用，抛出异常可中断解包
+
+    返回:
+        np.ndarray: (H, W) 的 uint16 数组
+    """
+    pixels, nbytes = mipi_group_size[raw_type]
+    low_bits = get_bit_depth(raw_type) - 8
+    height = packed.shape[0]
+    groups = (raw_width + pixels - 1) // pixels
+    if out is None:
+        out = np.empty((height, raw_width), dtype=np.uint16)
+    # 宽度不是整组时先解到补齐的缓冲区
+    full = out if raw_width == groups * pixels else np.empty((height, groups * pixels), dtype=np.uint16)
+    full_groups = full.reshape(height, groups, pixels)
+
+    packed = np.ascontiguousarray(packed)
+    high = np.ndarray(shape=(height, groups), dtype="<u%d" % pixels, buffer=packed,
+                      strides=(packed.strides[0], nbytes))
+    low = packed[:, :groups * nbytes].reshape(height, groups, nbytes)[:, :, nbytes - 1]
+    lut = get_mipi_low_bits_lut(raw_type)
+
+    band_rows = get_mipi_band_rows(groups)
+    high_buf = np.empty((band_rows, groups), dtype="<u%d" % pixels)
+    low_buf = np.empty((band_rows, groups, pixels), dtype=np.uint16)
+    for y in range(0, height, band_rows):
+        n = min(band_rows, height - y)
+        high_band = high_buf[:n]
+        high_band[...] = high[y:y + n]
+        out_band = full_groups[y:y + n]
+        np.left_shift(high_band.view(np.uint8).reshape(n, groups, pixels), low_bits, out=out_band, dtype=np.uint16)
+        np.take(lut, low[y:y + n], axis=0, out=low_buf[:n])
+        out_band |= low_buf[:n]
+        if progress_callback is not None:
+            progress_callback(y + n, height)
+    if full is not out:
+        out[...] = full[:, :raw_width]
+    return out
+
+
+def pack_mipi(raw_array, raw_type, row_stride=None):
+    """
+    将 (H, W) 的原始位深数据打包为 MIPI CSI-2 紧凑格式，与 unpack_mipi 互逆。
+
+    参数:
+        raw_array (np.ndarray): (H, W) 的 uint16 数组
+        raw_type (str): "mipi10" 或 "mipi12"
+        row_stride (int): 每行字节数，超出有效数据的行尾部分补 0，默认不填充
+
+    返回:
+        np.ndarray: (H, stride) 的 uint8 数组
+    """
+    pixels, nbytes = mipi_group_size[raw_type]
+    low_bits = get_bit_depth(raw_type) - 8
+    height, raw_width = raw_array.shape
+    groups = (raw_width + pixels - 1) // pixels
+    row_stride = row_stride or groups * nbytes
+    packed = np.zeros((height, row_stride), dtype=np.uint8)
+    high = np.ndarray(shape=(height, groups), dtype="<u%d" % pixels, buffer=packed,
+                      strides=(row_stride, nbytes))
+    low = packed[:, :groups * nbytes].reshape(height, groups, nbytes)[:, :, nbytes - 1]
+
+    band_rows = get_mipi_band_rows(groups)
+    pad_buf = np.zeros((band_rows, groups * pixels), dtype=np.uint16)
+    high_buf = np.empty((band_rows, groups * pixels), dtype=np.uint8)
+    low_buf = np.empty((band_rows, groups * pixels), dtype=np.uint8)
+    for y in range(0, height, band_rows):
+        n = min(band_rows, height - y)
+        band = raw_array[y:y + n]
+        if raw_width != groups * pixels:
+            pad_buf[:n, :raw_width] = band
+            band = pad_buf[:n]
+        high_band = high_buf[:n]
+        np.right_shift(band, low_bits, out=high_band, casting="unsafe")
+        high[y:y + n] = high_band.view("<u%d" % pixels).reshape(n, groups)
+        # 组内各像素的低位字节拼成一个整数后移位合并到一个字节
+        low_band = low_buf[:n]
+        np.bitwise_and(band, (1 << low_bits) - 1, out=low_band, casting="unsafe")
+        merged = low_band.view("<u%d" % pixels).reshape(n, groups)
+        value = merged.copy()
+        for i in range(1, pixels):
+            value |= merged >> (i * (8 - low_bits))
+        low[y:y + n] = value
+    return packed
+
+
+def write_raw(f, raw_array, raw_type, row_stride=None, band_bytes=4 * 1024 * 1024):
+    """
+    将原始位深的 raw 数组按原格式写入已打开的文件。
+
+    按行带写出，每个行带约 band_bytes 字节：raw8/unpack 格式直接写出内存数据，不做转换；
+    MIPI 紧凑格式逐行带打包，峰值内存只有一个行带的打包数据。
+    """
+    height = raw_array.shape[0]
+    row_bytes = row_stride or raw_array[:1].nbytes
+    band_rows = max(1, band_bytes // max(row_bytes, 1))
+    for y in range(0, height, band_rows):
+        band = raw_array[y:y + band_rows]
+        if raw_type in mipi_group_size:
+            band = pack_mipi(band, raw_type, row_stride)
+        f.write(memoryview(np.ascontiguousarray(band)).cast("B"))
+
+
+def replace_file(tmp_path, file_path):
+    """
+    用临时文件 tmp_path 替换 file_path，通常由 os.replace 原子地完成。
+
+    Windows 上目标文件正被内存映射时 (当前文档以 memmap 打开源文件保存回原处，或其他进程仍映射着它)
+    不能替换，os.replace 抛出 PermissionError；此时退回为把临时文件的内容原地写入目标文件，
+    映射保持有效，但不再是原子的。目标文件需要缩短而仍被映射时截断会失败，照常抛出异常。
+    """
+    try:
+        os.replace(tmp_path, file_path)
+        return
+    except PermissionError:
+        if os.name != "nt":
+            raise
+    with open(tmp_path, "rb") as src, open(file_path, "r+b") as dst:
+        shutil.copyfileobj(src, dst, 4 * 1024 * 1024)
+        dst.truncate()
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.remove(tmp_path)
+
+
+def save_raw(file_path, raw_array, raw_type, row_stride=None):
+    """
+    原子地保存 raw 文件：先在同一目录下写临时文件并落盘，再用 replace_file 替换目标文件。
+
+    写入中途失败或进程崩溃都不会破坏原文件；原文件正以内存映射方式打开时也不会被截断。
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(file_path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_raw(f, raw_array, raw_type, row_stride)
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def row_spans(dirty_rows):
+    """把按行的 bool 标记合并为连续的行区间 [(y0, y1), ...]，右端为开区间"""
+    rows = np.flatnonzero(dirty_rows)
+    if len(rows) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > 1)
+    starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+    ends = np.concatenate((rows[breaks], [rows[-1]])) + 1
+    return [(int(y0), int(y1)) for y0, y1 in zip(starts, ends)]
+
+
+def clone_file(src_path, dst_path):
+    """
+    复制文件，文件系统支持时使用写时复制克隆 (Linux FICLONE)，不实际复制数据块。
+
+    不支持克隆时退回 shutil.copyfile，它会尽量使用 sendfile 等内核内复制。
+    """
+    if sys.platform.startswith("linux"):
+        import fcntl
+        ficlone = 0x40049409
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), ficlone, src.fileno())
+                return
+            except OSError:
+                pass
+    shutil.copyfile(src_path, dst_path)
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, offset)
+    # Windows 没有 pwrite
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, data)
+
+
+def _pread(fd, size, offset):
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def encode_raw_rows(raw_array, raw_type, row_stride=None):
+    """把若干行原始位深数据编码为文件中的字节，MIPI 紧凑格式重新打包"""
+    if raw_type in mipi_group_size:
+        raw_array = pack_mipi(raw_array, raw_type, row_stride)
+    return memoryview(np.ascontiguousarray(raw_array)).cast("B")
+
+
+def patch_raw(file_path, raw_array, raw_type, spans, row_stride=None, source_path=None):
+    """
+    只把修改过的行写入已有的 raw 文件，写入量与修改的行数成正比。
+
+    source_path 为空时直接改写 file_path，不是原子的，中途崩溃会留下部分写入的行；
+    否则先把 source_path (可以就是 file_path) 克隆为同目录下的临时文件，在临时文件上写入修改的行后
+    再用 replace_file 替换 file_path，支持 reflink 的文件系统上克隆不复制数据，写入量仍与修改成正比。
+    写入后读回各行区间，与写入内容的 crc32 不一致时抛出 IOError。
+
+    参数:
+        spans (list): [(y0, y1), ...] 修改过的行区间
+        row_stride (int): 文件中每行的字节数，默认为数据本身的行字节数
+
+    返回:
+        int: 写入的字节数
+    """
+    height = raw_array.shape[0]
+    row_stride = row_stride or raw_array[:1].nbytes
+    target_path = file_path
+    if source_path is not None:
+        directory = os.path.dirname(os.path.abspath(file_path))
+        fd, target_path = tempfile.mkstemp(prefix="." + os.path.basename(file_path) + ".", suffix=".tmp",
+                                           dir=directory)
+        os.close(fd)
+    try:
+        if source_path is not None:
+            clone_file(source_path, target_path)
+        if os.path.getsize(target_path) != height * row_stride:
+            raise IOError("文件大小与图像尺寸不一致，无法增量保存")
+        written = 0
+        checksums = []
+        fd = os.open(target_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            for y0, y1 in spans:
+                data = encode_raw_rows(raw_array[y0:y1], raw_type, row_stride)
+                offset = y0 * row_stride
+                view = data
+                while len(view):
+                    n = _pwrite(fd, view, offset + len(data) - len(view))
+                    view = view[n:]
+                written += len(data)
+                checksums.append((offset, len(data), zlib.crc32(data)))
+            os.fsync(fd)
+            for offset, size, crc in checksums:
+                if zlib.crc32(_pread(fd, size, offset)) != crc:
+                    raise IOError("增量保存校验失败")
+        finally:
+            os.close(fd)
+        if source_path is not None:
+            replace_file(target_path, file_path)
+        return written
+    except BaseException:
+        if source_path is not None and os.path.exists(target_path):
+            os.remove(target_path)
+        raise
+
+
+def read_mipi_raw(raw_path, raw_width, raw_height, raw_type, progress_callback=None, unpack=True):
+    """
+    读取 MIPI 紧凑格式 raw，行跨度由文件大小推算，返回 (uint16 数组, 行跨度)。
+    unpack 为 False 时不解包，返回只读映射的 (H, 行跨度) 紧凑数据。
+    """
+    file_size = os.path.getsize(raw_path)
+    row_stride = file_size // raw_height
+    if file_size % raw_height or row_stride < get_mipi_min_stride(raw_width, raw_type):
+        return None, None
+    packed = np.memmap(raw_path, dtype=np.uint8, mode='r', shape=(raw_height, row_stride))
+    if not unpack:
+        return packed, row_stride
+    raw_array = unpack_mipi(packed, raw_width, raw_type, progress_callback=progress_callback)
+    del packed
+    return raw_array, row_stride
+
+
+"""
+    获取raw图
+"""
+# 记录实际分配的字节数：内存映射的 raw8/unpack 文件为 0，MIPI 为解包后的数组大小
+@perf.timed("read_raw", size=lambda raw_info: allocated_bytes(raw_info["raw_data"]) if raw_info else 0)
+def read_raw(raw_path, progress_callback=None):
+    return _open_raw(raw_path, progress_callback)
+
+
+def _open_raw(raw_path, progress_callback=None, unpack=True):
+    """
+    read_raw 的实现，不计入 read_raw 的耗时统计。
+    unpack 为 False 时 MIPI 格式不解包，raw_data 为 (H, row_stride) 的紧凑数据
+    """
+    file_name = os.path.basename(raw_path)
+    if not os.path.splitext(file_name)[1] == ".raw":
+        return None
+    # 解析文件名 _000_1207D416A588_FailRaw_20260122T133327.4096X3072.unpack10_grbg.vcmpos_289.raw
+    img_info = parse_image_info(file_name)
+    if not img_info['image_type'] or not img_info['bayer_pattern']:
+        return None
+    raw_type = img_info['image_type']
+    raw_width = img_info['width']
+    raw_height = img_info['height']
+    if not raw_width or not raw_height:
+        return None
+    if raw_type in mipi_group_size:
+        # MIPI 紧凑格式解包为原始位深的 uint16，保存时再重新打包
+        raw_array, row_stride = read_mipi_raw(raw_path, raw_width, raw_height, raw_type,
+                                              progress_callback, unpack)
+        if raw_array is None:
+            return None
+        return {
+            "origin_type" : raw_type,
+            "origin_name" : file_name,
+            "raw_data" : raw_array,
+            "raw_width" : raw_width,
+            "raw_height" : raw_height,
+            "row_stride" : row_stride,
+            "bit_depth" : get_bit_depth(raw_type),
+            "pattern" : img_info['bayer_pattern'].upper(),
+        }
+    # 保持原始位深：raw8 为 uint8，unpack10/12 为小端 uint16
+    dtype = np.dtype(np.uint8) if raw_type == 'raw8' else np.dtype('<u2')
+    if os.path.getsize(raw_path) != raw_width * raw_height * dtype.itemsize:
+        return None
+    # 以写时复制方式映射文件：打开时不读取整个文件，编辑只复制被修改的页，不会写回原文件
+    raw_array = np.memmap(raw_path, dtype=dtype, mode='c', shape=(raw_height, raw_width))
+    return {
+        "origin_type" : raw_type,
+        "origin_name" : file_name,
+        "raw_data" : raw_array,
+        "raw_width" : raw_width,
+        "raw_height" : raw_height,
+        "row_stride" : raw_width * dtype.itemsize,
+        "bit_depth" : get_bit_depth(raw_type),
+        "pattern" : img_info['bayer_pattern'].upper(),
+    }
+
+
+def read_raw_thumbnail(raw_path, max_size=96):
+    """
+    读取 raw 文件并生成 bayer_thumbnail 缩略图，无法解码时返回 None。
+    不计入 read_raw 的耗时统计；MIPI 格式只按行带解包缩略图用到的行。
+    """
+    raw_info = _open_raw(raw_path, unpack=False)
+    if not raw_info:
+        return None
+    packed = raw_info["origin_type"] in mipi_group_size
+    return bayer_thumbnail(raw_info["raw_data"], raw_info["pattern"], raw_info["bit_depth"], max_size,
+                           raw_type=raw_info["origin_type"] if packed else None,
+                           raw_width=raw_info["raw_width"])
+
+
+def bayer_to_rgb_mosaic(raw_array, pattern, out=None):
+    """按拜耳模式将单通道数组散布到 RGB 三通道，raw_array 左上角需与拜耳单元对齐"""
+    channels = cfa_channel_table.get(pattern)
+    if channels is None:
+        return None
+    if out is None:
+        out = np.zeros(raw_array.shape + (3,), dtype=np.uint8)
+    else:
+        out[...] = 0
+    for dy in range(2):
+        for dx in range(2):
+            out[dy::2, dx::2, channels[dy][dx]] = raw_array[dy::2, dx::2]
+    return out
+
+
+def rgb_to_bayer(rgb_array, pattern, out=None, channel_order=(0, 1, 2)):
+    """
+    bayer_to_rgb_mosaic 的逆变换：每个像素按拜耳模式取所在通道的值，得到单通道数组。
+
+    rgb_array 为 (H, W, 每像素字节数) 的数组，channel_order 为 R/G/B 所在的下标，
+    可以直接传入 QImage 的内存视图 (如 RGB32 在小端机器上为 (2, 1, 0))，不需要先转换格式。
+    out 为预先分配的数组时结果直接写入其中。
+    """
+    channels = cfa_channel_table.get(pattern)
+    if channels is None:
+        return None
+    if out is None:
+        out = np.empty(rgb_array.shape[:2], dtype=rgb_array.dtype)
+    for dy in range(2):
+        for dx in range(2):
+            out[dy::2, dx::2] = rgb_array[dy::2, dx::2, channel_order[channels[dy][dx]]]
+    return out
+
+
+# 去马赛克卷积核，以 {(dy, dx): 系数} 表示
+# 双线性：相邻同色像素取平均
+_bilinear_kernels = {
+    "g_at_rb": {(-1, 0): 0.25, (1, 0): 0.25, (0, -1): 0.25, (0, 1): 0.25},
+    "row": {(0, -1): 0.5, (0, 1): 0.5},
+    "col": {(-1, 0): 0.5, (1, 0): 0.5},
+    "diag": {(-1, -1): 0.25, (-1, 1): 0.25, (1, -1): 0.25, (1, 1): 0.25},
+}
+# Malvar-He-Cutler：在双线性基础上加入同位置其他通道的梯度修正，系数均除以 8
+_mhc_kernels = {
+    "g_at_rb": {(0, 0): 4, (-1, 0): 2, (1, 0): 2, (0, -1): 2, (0, 1): 2,
+                (-2, 0): -1, (2, 0): -1, (0, -2): -1, (0, 2): -1},
+    "row": {(0, 0): 5, (0, -1): 4, (0, 1): 4, (0, -2): -1, (0, 2): -1,
+            (-1, -1): -1, (-1, 1): -1, (1, -1): -1, (1, 1): -1, (-2, 0): 0.5, (2, 0): 0.5},
+    "col": {(0, 0): 5, (-1, 0): 4, (1, 0): 4, (-2, 0): -1, (2, 0): -1,
+            (-1, -1): -1, (-1, 1): -1, (1, -1): -1, (1, 1): -1, (0, -2): 0.5, (0, 2): 0.5},
+    "diag": {(0, 0): 6, (-1, -1): 2, (-1, 1): 2, (1, -1): 2, (1, 1): 2,
+             (-2, 0): -1.5, (2, 0): -1.5, (0, -2): -1.5, (0, 2): -1.5},
+}
+_mhc_kernels = {name: {k: v / 8 for k, v in kernel.items()} for name, kernel in _mhc_kernels.items()}
+demosaic_methods = {
+    "bilinear": _bilinear_kernels,
+    "mhc": _mhc_kernels,
+}
+# 去马赛克需要的邻域半径
+demosaic_halo = 2
+
+
+@lru_cache(maxsize=None)
+def get_demosaic_kernels(method):
+    """把卷积核按系数分组：{名称: {系数: [(dy, dx), ...]}}"""
+    grouped = {}
+    for name, kernel in demosaic_methods[method].items():
+        groups = {}
+        for offset, coef in kernel.items():
+            groups.setdefault(coef, []).append(offset)
+        grouped[name] = groups
+    return grouped
+
+
+def demosaic_padded(padded, pattern, method="bilinear", out=None):
+    """
+    对四周已扩展 demosaic_halo 个像素的拜耳数组去马赛克。
+
+    每种拜耳相位只在其 1/4 采样格点上计算需要的卷积核，卷积以切片加权求和实现，全程向量化。
+
+    参数:
+        padded (np.ndarray): (H + 4, W + 4) 数组，中心区域左上角与拜耳单元对齐
+        pattern (str): 拜耳模式
+        method (str): "bilinear" 或 "mhc"
+        out (np.ndarray): 可选的 (H, W, 3) uint8 输出数组
+
+    返回:
+        np.ndarray: (H, W, 3) uint8 RGB 数组
+    """
+    kernels = get_demosaic_kernels(method)
+    channels = cfa_channel_table[pattern]
+    halo = demosaic_halo
+    height, width = padded.shape[0] - 2 * halo, padded.shape[1] - 2 * halo
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+    src = padded.astype(np.float32, copy=False)
+
+    def convolve(kernel, dy, dx):
+        # 系数相同的抽头先相加再乘系数，减少乘法和临时数组
+        acc = None
+        for coef, offsets in kernel.items():
+            group = None
+            for ky, kx in offsets:
+                tap = src[halo + dy + ky:halo + height + ky:2, halo + dx + kx:halo + width + kx:2]
+                if group is None:
+                    group = tap.copy()
+                else:
+                    group += tap
+            group *= coef
+            if acc is None:
+                acc = group
+            else:
+                acc += group
+        return acc
+
+    def store(dy, dx, channel, values):
+        np.clip(values, 0, 255, out=values)
+        out[dy::2, dx::2, channel] = np.rint(values)
+
+    for dy in range(2):
+        for dx in range(2):
+            if dy >= height or dx >= width:
+                continue
+            channel = channels[dy][dx]
+            out[dy::2, dx::2, channel] = padded[halo + dy:halo + height:2, halo + dx:halo + width:2]
+            if channel == 1:
+                # G 位置：同行与同列的邻居分别是 R/B 中的一种
+                store(dy, dx, channels[dy][1 - dx], convolve(kernels["row"], dy, dx))
+                store(dy, dx, channels[1 - dy][dx], convolve(kernels["col"], dy, dx))
+            else:
+                store(dy, dx, 1, convolve(kernels["g_at_rb"], dy, dx))
+                store(dy, dx, 2 - channel, convolve(kernels["diag"], dy, dx))
+    return out
+
+
+def pad_region(raw_array, x0, y0, x1, y1, halo=demosaic_halo):
+    """
+    取出区域及其四周 halo 个像素的邻域，超出图像的部分以镜像方式补齐。
+
+    镜像不重复边缘像素，补出的像素与原位置拜耳相位一致。
+    """
+    height, width = raw_array.shape
+    sy0, sy1 = max(y0 - halo, 0), min(y1 + halo, height)
+    sx0, sx1 = max(x0 - halo, 0), min(x1 + halo, width)
+    region = raw_array[sy0:sy1, sx0:sx1]
+    pad = ((halo - (y0 - sy0), halo - (sy1 - y1)), (halo - (x0 - sx0), halo - (sx1 - x1)))
+    if any(p for pair in pad for p in pair):
+        region = np.pad(region, pad, mode="reflect")
+    return region
+
+
+def demosaic_region(raw_array, pattern, x0, y0, x1, y1, method="bilinear", out=None):
+    """对图像中的一个区域去马赛克，区域左上角需与拜耳单元对齐，邻域取自周围的真实像素"""
+    return demosaic_padded(pad_region(raw_array, x0, y0, x1, y1), pattern, method, out)
+
+
+def raw_to_numpy_array(raw_data, raw_width, raw_height, pattern, out=None):
+    # 将 raw_data 转换为 numpy 数组 (bytes 时直接引用，不拷贝)
+    if isinstance(raw_data, np.ndarray):
+        raw_array = raw_data.reshape(raw_height, raw_width)
+    else:
+        raw_array = np.frombuffer(raw_data, dtype=np.uint8).reshape(raw_height, raw_width)
+
+    # 创建 RGB 数组 (或写入预先分配的 out)，各位置按拜耳模式取 R/G/B 通道，按行带并行
+    if pattern not in cfa_channel_table:
+        return None
+    if out is None:
+        out = np.empty((raw_height, raw_width, 3), dtype=np.uint8)
+    run_bands(lambda y0, y1: bayer_to_rgb_mosaic(raw_array[y0:y1], pattern, out[y0:y1]),
+              raw_height, row_nbytes(out))
+    return out
+
+
+def stroke_mask(points, size, shape=None):
+    """
+    将一串笔刷采样点光栅化为方形笔刷连线的掩码。
+
+    相邻采样点之间按整像素步进插值，每个点覆盖 size x size 的方块。
+    连线与方块的闵可夫斯基和是凸的，每行的覆盖范围为一个区间，按行向量化求出，不逐点循环。
+
+    参数:
+        points (list): [(x, y), ...] 图像坐标
+        size (int): 笔刷大小
+        shape (tuple): 可选的图像尺寸 (H, W)，用于把掩码裁剪到图像范围内
+
+    返回:
+        tuple: (x0, y0, mask)，mask 为左上角位于 (x0, y0) 的 bool 数组；完全在图像外时返回 None
+    """
+    pts = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    if len(pts) == 0:
+        return None
+    r_lo = size // 2
+    r_hi = size - 1 - r_lo
+    x0, y0 = pts[:, 0].min() - r_lo, pts[:, 1].min() - r_lo
+    x1, y1 = pts[:, 0].max() + r_hi + 1, pts[:, 1].max() + r_hi + 1
+    if shape is not None:
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, shape[1]), min(y1, shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return None
+
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    cols = np.arange(x0, x1)
+    segments = zip(pts[:-1], pts[1:]) if len(pts) > 1 else [(pts[0], pts[0])]
+    for start, end in segments:
+        steps = int(np.abs(end - start).max()) + 1
+        t = np.linspace(0.0, 1.0, steps)
+        cx = np.rint(start[0] + t * (end[0] - start[0])).astype(np.int64)
+        cy = np.rint(start[1] + t * (end[1] - start[1])).astype(np.int64)
+        if cy[0] > cy[-1]:
+            cx, cy = cx[::-1], cy[::-1]
+        rows = np.arange(max(cy[0] - r_lo, y0), min(cy[-1] + r_hi + 1, y1))
+        if len(rows) == 0:
+            continue
+        # 覆盖第 y 行的采样点满足 y - r_hi <= cy <= y + r_lo，cx 沿线段单调，区间端点即最值
+        i0 = np.searchsorted(cy, rows - r_hi, side="left")
+        i1 = np.searchsorted(cy, rows + r_lo, side="right") - 1
+        left = np.minimum(cx[i0], cx[i1]) - r_lo
+        right = np.maximum(cx[i0], cx[i1]) + r_hi
+        mask[rows[0] - y0:rows[-1] - y0 + 1] |= (cols >= left[:, None]) & (cols <= right[:, None])
+    return int(x0), int(y0), mask
+
+
+def cfa_phases(pattern, x0, y0):
+    """
+    返回左上角位于 (x0, y0) 的区域内 4 个拜耳相位 [(dy, dx, channel), ...]。
+
+    区域中 [dy::2, dx::2] 位置的像素属于通道 channel (0=R, 1=G, 2=B)。
+    """
+    channels = cfa_channel_table[pattern]
+    return [(dy, dx, channels[(y0 + dy) % 2][(x0 + dx) % 2]) for dy in range(2) for dx in range(2)]
+
+
+def apply_mask_on_raw(raw_array, x0, y0, mask, color, pattern, mode="GRAY", max_value=255):
+    """
+    按掩码把颜色一次性写入原始位深的 raw 数组。
+
+    参数:
+        raw_array (np.ndarray): 原始 raw 数组 (H, W)
+        x0, y0 (int): 掩码左上角的图像坐标
+        mask (np.ndarray): bool 掩码
+        color (tuple): (r, g, b) 原始位深下的数值
+        pattern (str): 拜耳模式
+        mode (str): "GRAY" 写入灰度值，"RGB" 按拜耳位置写入对应通道值
+        max_value (int): 原始位深的最大值
+
+    返回:
+        tuple: 被修改的区域 (x, y, w, h)，无修改时返回 None
+    """
+    height, width = raw_array.shape
+    bx0, by0 = max(x0, 0), max(y0, 0)
+    bx1, by1 = min(x0 + mask.shape[1], width), min(y0 + mask.shape[0], height)
+    if bx0 >= bx1 or by0 >= by1:
+        return None
+    sub_mask = mask[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0]
+    target = raw_array[by0:by1, bx0:bx1]
+
+    r, g, b = (min(max(int(v), 0), max_value) for v in color)
+    if mode == "GRAY":
+        # 与 QPainter 在灰度图上的取值一致 (qGray)
+        target[sub_mask] = (r * 11 + g * 16 + b * 5) // 32
+    else:
+        # 按拜耳相位分别写入对应通道的值，只访问掩码覆盖的像素
+        color = (r, g, b)
+        for dy, dx, channel in cfa_phases(pattern, bx0, by0):
+            target[dy::2, dx::2][sub_mask[dy::2, dx::2]] = color[channel]
+    return bx0, by0, bx1 - bx0, by1 - by0
+
+
+def draw_stroke_on_raw(raw_array, points, size, color, pattern, mode="GRAY", max_value=255):
+    """
+    直接在原始位深的 raw 数组上绘制方形笔刷连线。
+
+    参数:
+        raw_array (np.ndarray): 原始 raw 数组 (H, W)
+        points (list): [(x, y), ...] 图像坐标，单个点时绘制一个笔刷点
+        size (int): 笔刷大小
+        color (tuple): (r, g, b) 原始位深下的数值
+        pattern (str): 拜耳模式
+        mode (str): "GRAY" 写入灰度值，"RGB" 按拜耳位置写入对应通道值
+        max_value (int): 原始位深的最大值
+
+    返回:
+        tuple: 被修改的区域 (x, y, w, h)，无修改时返回 None
+    """
+    stroke = stroke_mask(points, size, raw_array.shape)
+    if stroke is None:
+        return None
+    x0, y0, mask = stroke
+    return apply_mask_on_raw(raw_array, x0, y0, mask, color, pattern, mode, max_value)
+
+
+def draw_point_on_raw(raw_array, x, y, size, color, pattern, mode="GRAY", max_value=255):
+    """直接在原始位深的 raw 数组上绘制方形笔刷点，返回被修改的区域 (x, y, w, h)"""
+    return draw_stroke_on_raw(raw_array, [(x, y)], size, color, pattern, mode, max_value)
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from .raw_view import RawDisplayView
+from .raw_core import row_spans, default_display_params
+from .raw_stats import ChannelStats
+
+
+class RawDocument:
+    """
+    内存中的 raw 文档。
+
+    只保存一份原始位深的数据，GRAY/RGB 等显示视图按需派生并缓存，切换显示模式不需要重新读取文件，
+    也不会丢失编辑。数据修改后当前视图立即刷新修改区域，其余缓存视图只把相交瓦片标记为失效，
+    切换过去时再按需重新转换。
+    另外记录相对 file_path 上的文件被修改过的行，用于增量保存。
+    通道统计在第一次取用时整帧计算，之后随修改增量更新：修改前调用 begin_change，修改后调用 mark_dirty。
+    """
+    max_views = 3
+
+    def __init__(self, raw_info, file_path=""):
+        self.raw_info = raw_info
+        self.file_path = file_path
+        self.views = OrderedDict()  # (mode, demosaic) -> RawDisplayView
+        self.display_params = default_display_params
+        self.stats = None
+        self.dirty_rows = np.zeros(self.raw_array.shape[0], dtype=bool)
+
+    @property
+    def raw_array(self):
+        return self.raw_info["raw_data"]
+
+    @property
+    def pattern(self):
+        return self.raw_info["pattern"]
+
+    @property
+    def bit_depth(self):
+        return self.raw_info["bit_depth"]
+
+    @property
+    def max_value(self):
+        return (1 << self.bit_depth) - 1
+
+    def get_view(self, mode, demosaic=None):
+        """获取显示视图 (使用当前显示变换参数)，未缓存时创建，超出缓存数量时淘汰最久未使用的视图"""
+        key = (mode, demosaic if mode == "RGB" else None)
+        view = self.views.get(key)
+        if view is not None:
+            self.views.move_to_end(key)
+            view.set_display_params(self.display_params)
+            return view
+        view = RawDisplayView(self.raw_array, self.pattern, mode, self.bit_depth, key[1], self.display_params)
+        self.views[key] = view
+        while len(self.views) > self.max_views:
+            self.views.popitem(last=False)
+        return view
+
+    def set_display_params(self, params):
+        """修改显示变换参数，缓存的视图在下次取用时按新参数重新转换"""
+        self.display_params = params or default_display_params
+
+    def get_stats(self):
+        """获取通道统计，第一次调用时整帧计算"""
+        if self.stats is None:
+            self.stats = ChannelStats(self.raw_array, self.pattern, self.bit_depth)
+        return self.stats
+
+    def begin_change(self, x, y, w, h, mask=None):
+        """原始数据在区域内 (或掩码覆盖的像素上) 被修改前调用，必须与之后的 mark_dirty 成对使用"""
+        if self.stats is not None:
+            self.stats.remove_rect(x, y, w, h, mask)
+
+    def mark_dirty(self, x, y, w, h, current_view=None, mask=None):
+        """
+        原始数据在区域内被修改后调用。
+
+        mask 为与区域同大小的 bool 数组时，当前视图只重新转换掩码覆盖的像素。
+        """
+        if self.stats is not None:
+            self.stats.add_rect(x, y, w, h, mask)
+        self.dirty_rows[max(int(y), 0):max(int(y + h), 0)] = True
+        for view in self.views.values():
+            if view is current_view:
+                if mask is not None:
+                    view.refresh_mask(x, y, mask)
+                else:
+                    view.refresh_rect(x, y, w, h)
+            else:
+                view.invalidate_rect(x, y, w, h)
+
+    def begin_points(self, xs, ys):
+        """一组离散像素被修改前调用，必须与之后的 mark_points_dirty 成对使用"""
+        if self.stats is not None:
+            self.stats.remove_points(xs, ys)
+
+    def mark_points_dirty(self, xs, ys):
+        """一组离散像素被修改后调用，各视图只刷新这些像素"""
+        if self.stats is not None:
+            self.stats.add_points(xs, ys)
+        self.dirty_rows[ys] = True
+        for view in self.views.values():
+            view.refresh_points(xs, ys)
+
+    def dirty_spans(self):
+        """与 file_path 上的文件相比修改过的行区间 [(y0, y1), ...]"""
+        return row_spans(self.dirty_rows)
+
+    def clear_dirty(self):
+        """数据已写回 file_path 后调用"""
+        self.dirty_rows[...] = False
@@ -1,253 +1,131 @@
+"""
+raw 数据与 QImage 之间的转换。
+
+纯 numpy 的部分在 raw_core 中，这里全部重新导出，原有的 from .raw_process_util import ... 仍然可用；
+不需要 Qt 的模块应直接从 raw_core 导入。
+QImage 与 numpy 数组之间尽量共享内存：numpy_to_qimage 让 QImage 直接引用数组，
+qimage_to_numpy_view 反过来让数组直接引用 QImage 的像素，各转换函数都可以写入预先分配的 out。
+"""
+import sys
+
 import numpy as np
-from PyQt6.QtGui import QImage, qRgb
-import os
-pattern_list = ["GRBG", "GBRG", "RGGB", "BGGR"]
-import re
+from PyQt6.QtGui import QImage
 
+from .raw_core import *  # noqa: F401,F403
+from .raw_core import (raw_to_display8, raw_to_numpy_array, raw_to_rgb_mosaic8, rgb_to_bayer, cfa_channel_table,
+                       run_bands, row_nbytes)
 
-def parse_image_info(filename, image_types=None, bayer_patterns=None):
-    """
-    从文件名中解析图像信息，包括宽高、图片类型和拜耳模式。
+# QImage 内存中 R/G/B 所在的字节下标，RGB32 等按 32 位整数 0xAARRGGBB 存储，与字节序有关
+qimage_channel_order = {
+    QImage.Format.Format_RGB888: (0, 1, 2),
+    QImage.Format.Format_RGB32: (2, 1, 0) if sys.byteorder == "little" else (1, 2, 3),
+    QImage.Format.Format_ARGB32: (2, 1, 0) if sys.byteorder == "little" else (1, 2, 3),
+}
 
-    参数:
-        filename (str): 待解析的文件名
-        image_types (list): 支持的图片类型列表，默认为常见类型
-        bayer_patterns (list): 支持的拜耳模式列表，默认为常见模式
 
-    返回:
-        dict: 包含宽、高、图片类型、拜耳模式的字典
+def numpy_to_qimage(array, image_format=None):
     """
-    # 默认支持的图片类型
-    if image_types is None:
-        image_types = ['unpack10', 'raw8','unpack12']
-
-    # 默认支持的拜耳模式
-    if bayer_patterns is None:
-        bayer_patterns = ['grbg', 'rggb', 'bggr', 'gbrg']
-
-    result = {
-        'width': None,
-        'height': None,
-        'image_type': None,
-        'bayer_pattern': None
-    }
-
-    # 1. 提取宽高（支持 数字X数字 格式）
-    resolution_match = re.search(r'(\d+)X(\d+)', filename, re.IGNORECASE)
-    if resolution_match:
-        result['width'] = int(resolution_match.group(1))
-        result['height'] = int(resolution_match.group(2))
-
-    # 2. 提取图片类型
-    for img_type in image_types:
-        if img_type.lower() in filename.lower():
-            result['image_type'] = img_type
-            break
-
-    # 3. 提取拜耳模式
-    for pattern in bayer_patterns:
-        if pattern.lower() in filename.lower():
-            result['bayer_pattern'] = pattern
-            break
-
-    return result
-
-
-
-def get_raw8(raw_data, raw_type):
-    diff_bit = 2
-    if raw_type == 'unpack10':
-        diff_bit = 2
-    elif raw_type == 'unpack12':
-        diff_bit = 4
-    if raw_type != 'raw8':
-        data_array = np.frombuffer(raw_data, dtype=np.uint16)
-        raw8_values = data_array >> diff_bit
-        return raw8_values.astype(np.uint8)
-    else:
-        return raw_data
-
-def raw8_to_unpack16bit(raw8_data, raw_type):
-    if raw_type == 'unpack10':
-        diff_bit = 2
-    elif raw_type == 'unpack12':
-        diff_bit = 4
-    else:
-        return None
-    data_array = np.frombuffer(raw8_data, dtype=np.uint8)
-    raw10_values = (data_array.astype(np.uint16)) << diff_bit
-    return raw10_values.astype(np.uint16)
+    创建直接引用 numpy 数组内存的 QImage，不拷贝。
 
-"""
-    获取raw图
-"""
-def read_raw(raw_path):
-    file_name = os.path.basename(raw_path)
-    if not os.path.splitext(file_name)[1] == ".raw":
-        return None
-    # 解析文件名 _000_1207D416A588_FailRaw_20260122T133327.4096X3072.unpack10_grbg.vcmpos_289.raw
-    img_info = parse_image_info(file_name)
-    if not img_info['image_type'] or not img_info['bayer_pattern']:
-        return None
-    with open(raw_path, 'rb') as f:
-        raw_data = f.read()
-    raw_data = get_raw8(raw_data, img_info.get('image_type', "unpack10"))
-    return {
-        "origin_type" : img_info.get('image_type', "raw8"),
-        "origin_name" : file_name,
-        "raw_data" : raw_data,
-        "raw_width" : img_info['width'],
-        "raw_height" : img_info['height'],
-        "pattern" : img_info['bayer_pattern'].upper(),
-    }
-
-
-def raw_to_numpy_array(raw_data, raw_width, raw_height, pattern):
-    # 将 raw_data 转换为 numpy 数组
-    raw_array = np.frombuffer(raw_data, dtype=np.uint8).reshape(raw_height, raw_width)
-
-    # 创建 RGB 数组
-    rgb_array = np.zeros((raw_height, raw_width, 3), dtype=np.uint8)
-
-    if pattern == "GRBG":
-        # 偶数行偶数列: G
-        rgb_array[0::2, 0::2, 1] = raw_array[0::2, 0::2]  # G通道
-        # 奇数行奇数列: G
-        rgb_array[1::2, 1::2, 1] = raw_array[1::2, 1::2]  # G通道
-        # 偶数行奇数列: R
-        rgb_array[0::2, 1::2, 0] = raw_array[0::2, 1::2]  # R通道
-        # 奇数行偶数列: B
-        rgb_array[1::2, 0::2, 2] = raw_array[1::2, 0::2]  # B通道
-    elif pattern == "GBRG":
-        # 偶数行偶数列: G
-        rgb_array[0::2, 0::2, 1] = raw_array[0::2, 0::2]
-        # 奇数行奇数列: G
-        rgb_array[1::2, 1::2, 1] = raw_array[1::2, 1::2]
-        # 奇数行偶数列: R
-        rgb_array[1::2, 0::2, 0] = raw_array[1::2, 0::2]
-        # 偶数行奇数列: B
-        rgb_array[0::2, 1::2, 2] = raw_array[0::2, 1::2]
-    elif pattern == "RGGB":
-        # 偶数行偶数列: R
-        rgb_array[0::2, 0::2, 0] = raw_array[0::2, 0::2]
-        # 奇数行奇数列: B
-        rgb_array[1::2, 1::2, 2] = raw_array[1::2, 1::2]
-        # 其他位置: G
-        rgb_array[0::2, 1::2, 1] = raw_array[0::2, 1::2]
-        rgb_array[1::2, 0::2, 1] = raw_array[1::2, 0::2]
-    elif pattern == "BGGR":
-        # 偶数行偶数列: B
-        rgb_array[0::2, 0::2, 2] = raw_array[0::2, 0::2]
-        # 奇数行奇数列: R
-        rgb_array[1::2, 1::2, 0] = raw_array[1::2, 1::2]
-        # 其他位置: G
-        rgb_array[0::2, 1::2, 1] = raw_array[0::2, 1::2]
-        rgb_array[1::2, 0::2, 1] = raw_array[1::2, 0::2]
-    else:
-        return None
-    return rgb_array
-def raw_to_rgb_bayer(raw_data, raw_width, raw_height, pattern):
-    # 将 raw_data 转换为 numpy 数组
-    rgb_array = raw_to_numpy_array(raw_data, raw_width, raw_height, pattern)
-
-    # 将 numpy 数组转换为 QImage
-    q_img = QImage(rgb_array.data, raw_width, raw_height, 3 * raw_width, QImage.Format.Format_RGB888)
+    array 为 (H, W) 的 uint8/uint16 灰度数组、(H, W, 3) 的 RGB888 或 (H, W, 4) 的 RGB32 数组，
+    行内像素需连续，行间可以有间隔 (如大数组的切片)。QImage 不持有数据，这里把数组挂在 QImage 对象上，
+    QImage 存在期间数组不会被回收；调用方需保证数组在此期间不被重新分配。
+    """
+    height, width = array.shape[:2]
+    if image_format is None:
+        if array.ndim == 2:
+            image_format = QImage.Format.Format_Grayscale16 if array.dtype == np.uint16 else \
+                QImage.Format.Format_Grayscale8
+        else:
+            image_format = QImage.Format.Format_RGB888 if array.shape[2] == 3 else QImage.Format.Format_RGB32
+    if array.strides[1] != array.itemsize * (array.shape[2] if array.ndim == 3 else 1):
+        raise ValueError("数组每行内的像素必须连续")
+    q_img = QImage(array.ctypes.data, width, height, array.strides[0], image_format)
     # 必须保留对数组的引用，否则数据会被垃圾回收
-    q_img.rgb_array = rgb_array
+    q_img.array = array
     return q_img
 
-def raw_to_QImage(raw_data, raw_width, raw_height, pattern, mode="GRAY"):
+
+def raw_to_rgb_bayer(raw_data, raw_width, raw_height, pattern, out=None):
+    # 按拜耳位置填充 RGB 通道 (可写入预先分配的 out)，QImage 直接引用该数组
+    rgb_array = raw_to_numpy_array(raw_data, raw_width, raw_height, pattern, out)
+    if rgb_array is None:
+        return None
+    return numpy_to_qimage(rgb_array)
+
+
+def raw_to_QImage(raw_data, raw_width, raw_height, pattern, mode="GRAY", bit_depth=8, out=None):
+    """
+    raw 数据转换为 8bit 显示的 QImage，原始数据保持原位深不变。
+
+    out 为预先分配的显示数组 (GRAY 为 (H, W)，RGB 为 (H, W, 3))，反复转换同样大小的图像时不再分配内存。
+    """
+    raw_array = raw_data if isinstance(raw_data, np.ndarray) else np.frombuffer(raw_data, dtype=np.uint8)
+    raw_array = raw_array.reshape(raw_height, raw_width)
     if mode == "GRAY":
-        return QImage(raw_data, raw_width, raw_height, QImage.Format.Format_Grayscale8)
+        display_array = raw_to_display8(raw_array, bit_depth, out=out)
+        if not display_array.flags.c_contiguous:
+            display_array = np.ascontiguousarray(display_array)
+        return numpy_to_qimage(display_array)
 
     if mode != "RGB":
         return None
 
-    return raw_to_rgb_bayer(raw_data, raw_width, raw_height, pattern)
+    # 按行带查表后直接写入 RGB 数组的对应通道，不分配整帧的 8bit 中间数组
+    rgb_array = raw_to_rgb_mosaic8(raw_array, bit_depth, pattern, out=out)
+    return None if rgb_array is None else numpy_to_qimage(rgb_array)
 
-def qimage_to_rgb_numpy_array(q_img, pattern):
-    # 获取 QImage 的尺寸
-    width = q_img.width()
-    height = q_img.height()
 
-    # 将 QImage 转换为 numpy 数组
-    q_img = q_img.convertToFormat(QImage.Format.Format_RGB888)
-    ptr = q_img.bits()
-    ptr.setsize(height * width * 3)
-    rgb_array = np.frombuffer(ptr, dtype=np.uint8).reshape(height, width, 3)
-
-    # 创建空的 raw 数组
-    raw_array = np.zeros((height, width), dtype=np.uint8)
-
-    # 根据 Bayer 模式从 RGB 中提取原始像素
-    if pattern == "GRBG":
-        # 偶数行偶数列: 取 G 通道
-        raw_array[0::2, 0::2] = rgb_array[0::2, 0::2, 1]
-        # 奇数行奇数列: 取 G 通道
-        raw_array[1::2, 1::2] = rgb_array[1::2, 1::2, 1]
-        # 偶数行奇数列: 取 R 通道
-        raw_array[0::2, 1::2] = rgb_array[0::2, 1::2, 0]
-        # 奇数行偶数列: 取 B 通道
-        raw_array[1::2, 0::2] = rgb_array[1::2, 0::2, 2]
-
-    elif pattern == "GBRG":
-        # 偶数行偶数列: 取 G 通道
-        raw_array[0::2, 0::2] = rgb_array[0::2, 0::2, 1]
-        # 奇数行奇数列: 取 G 通道
-        raw_array[1::2, 1::2] = rgb_array[1::2, 1::2, 1]
-        # 奇数行偶数列: 取 R 通道
-        raw_array[1::2, 0::2] = rgb_array[1::2, 0::2, 0]
-        # 偶数行奇数列: 取 B 通道
-        raw_array[0::2, 1::2] = rgb_array[0::2, 1::2, 2]
-
-    elif pattern == "RGGB":
-        # 偶数行偶数列: 取 R 通道
-        raw_array[0::2, 0::2] = rgb_array[0::2, 0::2, 0]
-        # 奇数行奇数列: 取 B 通道
-        raw_array[1::2, 1::2] = rgb_array[1::2, 1::2, 2]
-        # 偶数行奇数列: 取 G 通道
-        raw_array[0::2, 1::2] = rgb_array[0::2, 1::2, 1]
-        # 奇数行偶数列: 取 G 通道
-        raw_array[1::2, 0::2] = rgb_array[1::2, 0::2, 1]
-
-    elif pattern == "BGGR":
-        # 偶数行偶数列: 取 B 通道
-        raw_array[0::2, 0::2] = rgb_array[0::2, 0::2, 2]
-        # 奇数行奇数列: 取 R 通道
-        raw_array[1::2, 1::2] = rgb_array[1::2, 1::2, 0]
-        # 偶数行奇数列: 取 G 通道
-        raw_array[0::2, 1::2] = rgb_array[0::2, 1::2, 1]
-        # 奇数行偶数列: 取 G 通道
-        raw_array[1::2, 0::2] = rgb_array[1::2, 0::2, 1]
-
-    else:
+def qimage_to_rgb_numpy_array(q_img, pattern, out=None):
+    """
+    按拜耳模式从 QImage 中取出每个像素所在通道的值，得到单通道的 raw 数组 (uint8)。
+
+    RGB888/RGB32/ARGB32 直接读取像素内存，其他格式先转换为 RGB888；out 为预先分配的 (H, W) 数组。
+    """
+    if pattern not in cfa_channel_table:
         return None
+    channel_order = qimage_channel_order.get(q_img.format())
+    if channel_order is None:
+        q_img = q_img.convertToFormat(QImage.Format.Format_RGB888)
+        channel_order = (0, 1, 2)
+    rgb_array = qimage_to_numpy_view(q_img)
+    if out is None:
+        out = np.empty(rgb_array.shape[:2], dtype=np.uint8)
+    # 按行带并行，各行带写入 out 中互不重叠的行
+    run_bands(lambda y0, y1: rgb_to_bayer(rgb_array[y0:y1], pattern, out[y0:y1], channel_order),
+              len(rgb_array), row_nbytes(rgb_array))
+    return out
 
-    return raw_array
 
 def qimage_to_raw_rgb(q_img, pattern):
     """将 QImage 转换回原始 raw 数据"""
-    raw_array= qimage_to_rgb_numpy_array(q_img, pattern)
+    raw_array = qimage_to_rgb_numpy_array(q_img, pattern)
 
     # 将 numpy 数组转换为原始 bytes 数据
-    raw_data = raw_array.tobytes()
-
-    return raw_data
+    return None if raw_array is None else raw_array.tobytes()
 
 
 def qimage_to_raw_gray(q_img):
     """将 QImage 转换回灰度 raw 数据"""
-    # 获取 QImage 的尺寸
-    width = q_img.width()
-    height = q_img.height()
-
-    # 将 QImage 转换为 numpy 数组
-    q_img = q_img.convertToFormat(QImage.Format.Format_Grayscale8)
-    ptr = q_img.bits()
-    ptr.setsize(height * width)
-    gray_array = np.frombuffer(ptr, dtype=np.uint8).reshape(height, width)
+    # 已是 8bit 灰度图时直接读取像素内存，只在生成 bytes 时拷贝一次
+    if q_img.format() != QImage.Format.Format_Grayscale8:
+        q_img = q_img.convertToFormat(QImage.Format.Format_Grayscale8)
+    gray_array = qimage_to_numpy_view(q_img)[:, :, 0]
 
     # 将 numpy 数组转换为原始 bytes 数据
-    raw_data = gray_array.tobytes()
+    return gray_array.tobytes()
+
+
+def qimage_to_numpy_view(q_img):
+    """
+    返回直接引用 QImage 像素内存的 numpy 数组 (H, W, 每像素字节数)，不拷贝。
 
-    return raw_data
\ No newline at end of file
+    修改数组即修改图像；调用方需保证 QImage 在数组使用期间不被释放或重新分配。
+    """
+    width = q_img.width()
+    height = q_img.height()
+    bytes_per_pixel = q_img.depth() // 8
+    ptr = q_img.bits()
+    ptr.setsize(q_img.sizeInBytes())
+    data = np.frombuffer(ptr, dtype=np.uint8).reshape(height, q_img.bytesPerLine())
+    return data[:, :width * bytes_per_pixel].reshape(height, width, bytes_per_pixel)
@@ -0,0 +1,93 @@
+import numpy as np
+
+from .raw_core import cfa_channel_table
+
+# 统计的 4 个拜耳通道：Gr 为与 R 同行的绿色，Gb 为与 B 同行的绿色
+stats_channel_names = ["R", "Gr", "Gb", "B"]
+
+
+def cfa_stats_channels(pattern):
+    """返回 2x2 拜耳单元中各位置对应的统计通道下标 [[c00, c01], [c10, c11]]"""
+    table = cfa_channel_table[pattern]
+    channels = [[0, 0], [0, 0]]
+    for dy in range(2):
+        for dx in range(2):
+            channel = table[dy][dx]
+            if channel == 1:
+                # 绿色按同一行的另一个像素区分 Gr/Gb
+                channels[dy][dx] = 1 if table[dy][1 - dx] == 0 else 2
+            else:
+                channels[dy][dx] = 0 if channel == 0 else 3
+    return channels
+
+
+class ChannelStats:
+    """
+    按拜耳通道 (R, Gr, Gb, B) 统计的直方图。
+
+    创建时对整帧统计一次，之后数据被修改时先减去修改前区域的直方图，修改后再加上新的直方图，
+    每次更新的代价与修改的像素数成正比，与图像大小无关。均值、最值和饱和像素数都由直方图得出。
+    """
+    band_rows = 512
+
+    def __init__(self, raw_array, pattern, bit_depth):
+        self.raw_array = raw_array
+        self.max_value = (1 << bit_depth) - 1
+        self.channels = cfa_stats_channels(pattern)
+        self.hist = np.zeros((4, self.max_value + 1), dtype=np.int64)
+        height = raw_array.shape[0]
+        # 按行带统计，避免整帧的临时数组
+        for y in range(0, height, self.band_rows):
+            self.add_rect(0, y, raw_array.shape[1], min(self.band_rows, height - y))
+
+    def region_hist(self, x, y, w, h, mask=None):
+        """区域内 (可选只统计掩码覆盖的像素) 各通道的直方图"""
+        hist = np.zeros_like(self.hist)
+        region = self.raw_array[y:y + h, x:x + w]
+        for dy in range(2):
+            for dx in range(2):
+                values = region[dy::2, dx::2]
+                if mask is not None:
+                    values = values[mask[dy::2, dx::2]]
+                if values.size == 0:
+                    continue
+                values = np.minimum(values.ravel(), self.max_value)
+                hist[self.channels[(y + dy) % 2][(x + dx) % 2]] += np.bincount(values, minlength=self.max_value + 1)
+        return hist
+
+    def points_hist(self, xs, ys):
+        """一组像素坐标上各通道的直方图"""
+        channels = np.array(self.channels)[ys % 2, xs % 2]
+        values = np.minimum(self.raw_array[ys, xs], self.max_value).astype(np.int64)
+        size = self.max_value + 1
+        return np.bincount(channels * size + values, minlength=4 * size).reshape(4, size)
+
+    def remove_points(self, xs, ys):
+        self.hist -= self.points_hist(xs, ys)
+
+    def add_points(self, xs, ys):
+        self.hist += self.points_hist(xs, ys)
+
+    def remove_rect(self, x, y, w, h, mask=None):
+        """数据修改前调用，减去区域内原来的统计"""
+        self.hist -= self.region_hist(x, y, w, h, mask)
+
+    def add_rect(self, x, y, w, h, mask=None):
+        """数据修改后调用，加上区域内新的统计"""
+        self.hist += self.region_hist(x, y, w, h, mask)
+
+    def summary(self):
+        """各通道的 {"count", "mean", "min", "max", "saturated"}"""
+        values = np.arange(self.max_value + 1)
+        result = []
+        for hist in self.hist:
+            count = int(hist.sum())
+            nonzero = np.flatnonzero(hist)
+            result.append({
+                "count": count,
+                "mean": float(hist @ values) / count if count else 0.0,
+                "min": int(nonzero[0]) if len(nonzero) else 0,
+                "max": int(nonzero[-1]) if len(nonzero) else 0,
+                "saturated": int(hist[-1]),
+            })
+        return result
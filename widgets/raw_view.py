@@ -0,0 +1,211 @@
+import numpy as np
+
+from .raw_core import (raw_to_display8, raw_to_rgb_mosaic8, pad_region, demosaic_padded, demosaic_halo,
+                      cfa_phases, cfa_channel_table, get_display_luts, apply_lut, default_display_params,
+                      get_executor, sample_display8)
+from .raw_process_util import numpy_to_qimage
+
+
+class RawDisplayView:
+    """
+    raw 数据的 8bit 显示视图。
+
+    显示缓冲区按瓦片懒转换：只有绘制时可见的瓦片才会从原始数据解码，
+    大图打开时不需要先对整帧做一次转换。QImage 直接引用显示缓冲区，不额外拷贝。
+    RGB 模式下 demosaic 为 None 时按拜耳位置直接填充通道，否则按指定方法去马赛克。
+    一次需要转换多行瓦片时按瓦片行分带，在线程池中并行转换。
+    显示变换 (黑电平、通道增益、伽马) 通过查找表作用于显示缓冲区，不修改原始数据。
+    缩小显示时的金字塔高层瓦片由 sample_level 隔行隔列取样原始数据直接生成，不经过显示缓冲区。
+    """
+    tile_size = 256
+
+    def __init__(self, raw_array, pattern, mode="GRAY", bit_depth=8, demosaic=None, params=None):
+        self.raw_array = raw_array
+        self.pattern = pattern
+        self.mode = mode
+        self.bit_depth = bit_depth
+        self.demosaic = demosaic if mode == "RGB" else None
+        self.params = params or default_display_params
+        # 去马赛克时每个像素依赖周围邻域，修改区域需要向外扩展
+        self.halo = demosaic_halo if self.demosaic else 0
+        self.height, self.width = raw_array.shape
+        self.allocate()
+
+    def can_zero_copy(self):
+        # raw8 灰度且不做显示变换时直接使用原始数据，无需转换
+        return (self.mode == "GRAY" and self.bit_depth == 8 and self.raw_array.flags.c_contiguous
+                and self.params == default_display_params)
+
+    def allocate(self):
+        """分配显示缓冲区和引用它的 QImage，所有瓦片标记为失效"""
+        tile_rows = (self.height + self.tile_size - 1) // self.tile_size
+        tile_cols = (self.width + self.tile_size - 1) // self.tile_size
+        if self.can_zero_copy():
+            self.display_array = self.raw_array
+            self.valid_tiles = np.ones((tile_rows, tile_cols), dtype=bool)
+        else:
+            shape = (self.height, self.width) if self.mode == "GRAY" else (self.height, self.width, 3)
+            # np.empty 只分配虚拟内存，未解码的瓦片不会占用物理内存
+            self.display_array = np.empty(shape, dtype=np.uint8)
+            self.valid_tiles = np.zeros((tile_rows, tile_cols), dtype=bool)
+        self.q_img = numpy_to_qimage(self.display_array)
+
+    def is_zero_copy(self):
+        return self.display_array is self.raw_array
+
+    def set_display_params(self, params):
+        """
+        修改显示变换参数，所有瓦片失效后按需重新转换。
+
+        返回:
+            bool: 显示缓冲区 (q_img) 是否被重新分配
+        """
+        params = params or default_display_params
+        if params == self.params:
+            return False
+        self.params = params
+        if self.is_zero_copy() or self.can_zero_copy():
+            self.allocate()
+            return True
+        self.invalidate()
+        return False
+
+    def to_display8(self, raw, x0, y0):
+        return raw_to_display8(raw, self.bit_depth, self.params, self.pattern, x0, y0)
+
+    def sample_level(self, level, x, y, w, h):
+        """生成金字塔第 level 层 (缩小 2^level 倍) 坐标区域内的显示图像，只读取取样到的原始数据"""
+        step = 1 << level
+        array = sample_display8(self.raw_array, self.pattern, self.bit_depth, self.params, step, x * step, y * step,
+                                w, h, self.mode, bool(self.demosaic))
+        return numpy_to_qimage(array)
+
+    def clip_rect(self, x, y, w, h):
+        """将区域裁剪到图像范围内，返回 (x0, y0, x1, y1)，为空时返回 None"""
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        x1, y1 = min(int(x + w), self.width), min(int(y + h), self.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1
+
+    def convert_region(self, x0, y0, x1, y1):
+        """从原始数据转换指定区域到显示缓冲区"""
+        if self.is_zero_copy():
+            return
+        # 对齐到拜耳单元，保证区域左上角的拜耳相位不变
+        x0, y0 = x0 & ~1, y0 & ~1
+        if self.demosaic:
+            # 填充宽度为偶数，填充后左上角的拜耳相位与 (x0, y0) 相同
+            padded = self.to_display8(pad_region(self.raw_array, x0, y0, x1, y1), x0, y0)
+            demosaic_padded(padded, self.pattern, self.demosaic, out=self.display_array[y0:y1, x0:x1])
+            return
+        if self.mode == "GRAY":
+            raw_to_display8(self.raw_array[y0:y1, x0:x1], self.bit_depth, self.params, self.pattern, x0, y0,
+                            out=self.display_array[y0:y1, x0:x1])
+        else:
+            raw_to_rgb_mosaic8(self.raw_array[y0:y1, x0:x1], self.bit_depth, self.pattern, self.params, x0, y0,
+                               out=self.display_array[y0:y1, x0:x1])
+
+    def ensure_rect(self, x, y, w, h):
+        """保证区域内的瓦片都已解码，绘制前调用"""
+        rect = self.clip_rect(x, y, w, h)
+        if rect is None:
+            return
+        x0, y0, x1, y1 = rect
+        ts = self.tile_size
+        ty0, ty1 = y0 // ts, (y1 - 1) // ts + 1
+        tx0, tx1 = x0 // ts, (x1 - 1) // ts + 1
+        tiles = self.valid_tiles[ty0:ty1, tx0:tx1]
+        if tiles.all():
+            return
+        # 每个瓦片行中从第一个到最后一个失效瓦片合为一个行带
+        bands = []
+        for row, invalid in enumerate(~tiles):
+            cols = np.nonzero(invalid)[0]
+            if len(cols) == 0:
+                continue
+            ty = ty0 + row
+            bands.append(((tx0 + cols[0]) * ts, ty * ts,
+                          min((tx0 + cols[-1] + 1) * ts, self.width), min((ty + 1) * ts, self.height)))
+        if len(bands) == 1:
+            self.convert_region(*bands[0])
+        else:
+            list(get_executor().map(lambda band: self.convert_region(*band), bands))
+        self.valid_tiles[ty0:ty1, tx0:tx1] = True
+
+    def refresh_rect(self, x, y, w, h):
+        """原始数据修改后刷新区域，尚未解码的瓦片留到绘制时再转换"""
+        rect = self.clip_rect(x - self.halo, y - self.halo, w + 2 * self.halo, h + 2 * self.halo)
+        if rect is None:
+            return
+        x0, y0, x1, y1 = rect
+        ts = self.tile_size
+        if self.valid_tiles[y0 // ts:(y1 - 1) // ts + 1, x0 // ts:(x1 - 1) // ts + 1].any():
+            self.convert_region(x0, y0, x1, y1)
+
+    def refresh_mask(self, x, y, mask):
+        """
+        原始数据在掩码覆盖的像素上被修改后刷新显示，只重新转换这些像素。
+
+        mask 为左上角位于 (x, y) 的 bool 数组。去马赛克时邻域像素也会变化，按外接矩形刷新。
+        """
+        if self.demosaic:
+            self.refresh_rect(x, y, mask.shape[1], mask.shape[0])
+            return
+        rect = self.clip_rect(x, y, mask.shape[1], mask.shape[0])
+        if rect is None or self.is_zero_copy():
+            return
+        x0, y0, x1, y1 = rect
+        ts = self.tile_size
+        if not self.valid_tiles[y0 // ts:(y1 - 1) // ts + 1, x0 // ts:(x1 - 1) // ts + 1].any():
+            return
+        mask = mask[y0 - y:y1 - y, x0 - x:x1 - x]
+        raw = self.raw_array[y0:y1, x0:x1]
+        display = self.display_array[y0:y1, x0:x1]
+        luts = get_display_luts(self.bit_depth, self.params)
+        for dy, dx, channel in cfa_phases(self.pattern, x0, y0):
+            phase_mask = mask[dy::2, dx::2]
+            values = apply_lut(luts[channel], raw[dy::2, dx::2][phase_mask])
+            if self.mode == "GRAY":
+                display[dy::2, dx::2][phase_mask] = values
+            else:
+                # 拜耳马赛克中每个像素只有所在通道非零，其余通道保持为 0
+                display[dy::2, dx::2, channel][phase_mask] = values
+
+    def refresh_points(self, xs, ys):
+        """
+        原始数据在一组离散像素上被修改后刷新显示。
+
+        不去马赛克时按像素查表写入；去马赛克时邻域也会变化，把这些像素周围 halo 内相交的瓦片标记为失效。
+        """
+        if self.is_zero_copy():
+            return
+        ts = self.tile_size
+        if self.demosaic:
+            tiles_y, tiles_x = self.valid_tiles.shape
+            for offset in (-self.halo, self.halo):
+                ty = np.clip((ys + offset) // ts, 0, tiles_y - 1)
+                for offset_x in (-self.halo, self.halo):
+                    self.valid_tiles[ty, np.clip((xs + offset_x) // ts, 0, tiles_x - 1)] = False
+            return
+        luts = np.stack(get_display_luts(self.bit_depth, self.params))
+        channels = np.array(cfa_channel_table[self.pattern])[ys % 2, xs % 2]
+        values = luts[channels, np.minimum(self.raw_array[ys, xs], luts.shape[1] - 1)]
+        if self.mode == "GRAY":
+            self.display_array[ys, xs] = values
+        else:
+            self.display_array[ys, xs, channels] = values
+
+    def invalidate_rect(self, x, y, w, h):
+        """区域内的原始数据已修改但当前不显示，相交瓦片标记为失效，下次绘制时再转换"""
+        rect = self.clip_rect(x - self.halo, y - self.halo, w + 2 * self.halo, h + 2 * self.halo)
+        if rect is None or self.is_zero_copy():
+            return
+        x0, y0, x1, y1 = rect
+        ts = self.tile_size
+        self.valid_tiles[y0 // ts:(y1 - 1) // ts + 1, x0 // ts:(x1 - 1) // ts + 1] = False
+
+    def invalidate(self):
+        """整帧失效，下次绘制时重新解码"""
+        if not self.is_zero_copy():
+            self.valid_tiles[...] = False
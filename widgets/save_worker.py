@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from .load_cache import file_key
+from .raw_core import save_raw, patch_raw
+from . import perf
+
+
+def save_image(file_path, q_img):
+    """原子地保存普通图片：先写同目录下的临时文件，成功后再替换目标文件"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    image_format = os.path.splitext(file_path)[1][1:].upper() or "PNG"
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(file_path) + ".", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        if not q_img.save(tmp_path, image_format):
+            raise IOError("图片编码失败")
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class SaveSignals(QObject):
+    finished = pyqtSignal(str, str)  # (保存路径, 错误信息)，成功时错误信息为空
+
+
+class SaveWorker(QRunnable):
+    """
+    在线程池中保存图片，raw图按行带转换写出。
+
+    给出 spans 时为增量保存，只写修改过的行：先克隆 source_path (可以就是 file_path) 再写入并原子替换。
+    source_path 的 (大小, 修改时间) 与读取时的 source_key 不同 (在程序外被改写) 时，
+    修改的行与文件其余部分对不上，退回完整保存，此时 spans 置为 None。
+    """
+
+    def __init__(self, file_path, raw_info=None, q_img=None, spans=None, source_path=None, source_key=None):
+        super().__init__()
+        self.file_path = file_path
+        self.raw_info = raw_info
+        self.q_img = q_img
+        self.spans = spans
+        self.source_path = source_path
+        self.source_key = source_key
+        self.written_bytes = 0
+        self.signals = SaveSignals()
+
+    def run(self):
+        error = ""
+        try:
+            if self.spans is not None and (self.source_key is None
+                                           or file_key(self.source_path) != self.source_key):
+                self.spans = None
+            if self.raw_info is not None and self.spans is not None:
+                start = time.perf_counter()
+                self.written_bytes = patch_raw(self.file_path, self.raw_info["raw_data"],
+                                               self.raw_info["origin_type"], self.spans,
+                                               self.raw_info["row_stride"], self.source_path)
+                perf.record("save", (time.perf_counter() - start) * 1000, self.written_bytes, patch=True)
+            elif self.raw_info is not None:
+                self.written_bytes = self.raw_info["raw_data"].shape[0] * self.raw_info["row_stride"]
+                with perf.timer("save", self.written_bytes):
+                    save_raw(self.file_path, self.raw_info["raw_data"], self.raw_info["origin_type"],
+                             self.raw_info["row_stride"])
+            else:
+                with perf.timer("save", self.q_img.sizeInBytes()):
+                    save_image(self.file_path, self.q_img)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        self.signals.finished.emit(self.file_path, error)
@@ -0,0 +1,213 @@
+"""
+形状与填充工具。
+
+矩形、椭圆、多边形和容差填充都光栅化为外接矩形范围内的 bool 掩码 (x0, y0, mask)，
+再由 apply_mask_on_raw (raw 图) 或 fill_mask (普通图片) 一次向量化写入。
+所有掩码都已裁剪到图像范围内，完全在图像外时返回 None。
+"""
+import numpy as np
+
+from .raw_core import stroke_mask
+from .raw_stats import cfa_stats_channels, stats_channel_names
+
+
+def clip_box(x0, y0, x1, y1, shape):
+    """把 [x0, x1) x [y0, y1) 裁剪到图像范围内，为空时返回 None"""
+    x0, y0 = max(int(x0), 0), max(int(y0), 0)
+    x1, y1 = min(int(x1), shape[1]), min(int(y1), shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+
+def corner_box(p0, p1):
+    """两个对角点 (含) 围成的区域 [x0, x1) x [y0, y1)"""
+    x0, x1 = sorted((int(p0[0]), int(p1[0])))
+    y0, y1 = sorted((int(p0[1]), int(p1[1])))
+    return x0, y0, x1 + 1, y1 + 1
+
+
+def rect_mask(p0, p1, shape):
+    box = clip_box(*corner_box(p0, p1), shape)
+    if box is None:
+        return None
+    x0, y0, x1, y1 = box
+    return x0, y0, np.ones((y1 - y0, x1 - x0), dtype=bool)
+
+
+def ellipse_mask(p0, p1, shape):
+    """内切于两个对角点围成的矩形的椭圆"""
+    bx0, by0, bx1, by1 = corner_box(p0, p1)
+    box = clip_box(bx0, by0, bx1, by1, shape)
+    if box is None:
+        return None
+    x0, y0, x1, y1 = box
+    cx, cy = (bx0 + bx1) / 2, (by0 + by1) / 2
+    rx, ry = (bx1 - bx0) / 2, (by1 - by0) / 2
+    # 按像素中心判断
+    dx = ((np.arange(x0, x1) + 0.5 - cx) / rx) ** 2
+    dy = ((np.arange(y0, y1) + 0.5 - cy) / ry) ** 2
+    return x0, y0, dy[:, None] + dx[None, :] <= 1.0
+
+
+def polygon_mask(points, shape):
+    """
+    多边形 (自动闭合) 的掩码，内部按奇偶规则判断，边界上的像素也包含在内。
+
+    每行与各条边的交点一次求出，排序后两两配对得到该行的覆盖区间。
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 3:
+        return None
+    box = clip_box(pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max() + 1, pts[:, 1].max() + 1, shape)
+    if box is None:
+        return None
+    x0, y0, x1, y1 = box
+    xa, ya = pts[:, 0], pts[:, 1]
+    xb, yb = np.roll(xa, -1), np.roll(ya, -1)
+    rows = np.arange(y0, y1, dtype=np.float64)[:, None]
+    crossing = (ya <= rows) != (yb <= rows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xs = np.where(crossing, xa + (rows - ya) * (xb - xa) / (yb - ya), np.inf)
+    xs.sort(axis=1)
+    cols = np.arange(x0, x1)
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    for i in range(0, xs.shape[1] - 1, 2):
+        left, right = xs[:, i:i + 1], xs[:, i + 1:i + 2]
+        mask |= (cols >= np.ceil(left)) & (cols <= np.floor(right))
+    outline = stroke_mask(np.vstack([pts, pts[:1]]).astype(np.int64), 1, shape)
+    if outline is not None:
+        ox, oy, omask = outline
+        mask[oy - y0:oy - y0 + omask.shape[0], ox - x0:ox - x0 + omask.shape[1]] |= omask
+    return x0, y0, mask
+
+
+def run_labels(starts, ends, rows, width):
+    """
+    行程 (每行中连续的一段候选像素) 的 4 连通分量标号。
+
+    相邻两行中有重叠的行程相连，按全部连接关系做并查集：每轮把标号较大的根挂到较小的根上，
+    再做指针跳跃直到每个行程都直接指向根，所有步骤都是整体的数组运算。
+    """
+    stride = width + 1
+    start_keys = rows * stride + starts
+    end_keys = rows * stride + ends
+    # 第 i 个行程与下一行中 [lo, hi) 范围内的行程重叠
+    lo = np.searchsorted(end_keys, (rows + 1) * stride + starts, side="right")
+    hi = np.searchsorted(start_keys, (rows + 1) * stride + ends, side="left")
+    counts = np.maximum(hi - lo, 0)
+    a = np.repeat(np.arange(len(starts)), counts)
+    b = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    labels = np.arange(len(starts))
+    while len(a):
+        la, lb = labels[a], labels[b]
+        differ = la != lb
+        a, b, la, lb = a[differ], b[differ], la[differ], lb[differ]
+        if not len(a):
+            break
+        np.minimum.at(labels, np.maximum(la, lb), np.minimum(la, lb))
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+    return labels
+
+
+def component_mask(values, x, y, tolerance, band_rows=512):
+    """values 中与种子 (x, y) 相差不超过 tolerance 且 4 连通的像素，返回 (x0, y0, mask)"""
+    height, width = values.shape
+    seed = int(values[y, x])
+    low, high = seed - int(tolerance), seed + int(tolerance)
+    # 行首尾补 False 后相邻像素不同的位置即行程的起点和终点，按行带计算避免整帧的临时数组
+    edges = []
+    for by in range(0, height, band_rows):
+        band = values[by:by + band_rows]
+        candidate = np.zeros((band.shape[0], width + 2), dtype=bool)
+        candidate[:, 1:-1] = (band >= max(low, 0)) & (band <= high)
+        edges.append(np.flatnonzero(candidate[:, 1:] != candidate[:, :-1]) + by * (width + 1))
+    edges = np.concatenate(edges)
+    rows, cols = np.divmod(edges, width + 1)
+    rows, starts, ends = rows[0::2], cols[0::2], cols[1::2]
+    labels = run_labels(starts, ends, rows, width)
+    seed_run = np.searchsorted(rows * (width + 1) + starts, y * (width + 1) + x, side="right") - 1
+    selected = labels == labels[seed_run]
+    rows, starts, ends = rows[selected], starts[selected], ends[selected]
+    x0, y0 = int(starts.min()), int(rows.min())
+    x1, y1 = int(ends.max()), int(rows.max()) + 1
+    # 在行程起点 +1、终点 -1，按行累加即得到掩码
+    marks = np.zeros((y1 - y0, x1 - x0 + 1), dtype=np.int32)
+    np.add.at(marks, (rows - y0, starts - x0), 1)
+    np.add.at(marks, (rows - y0, ends - x0), -1)
+    return x0, y0, np.cumsum(marks, axis=1)[:, :-1] > 0
+
+
+def flood_fill_mask(values, x, y, tolerance, radius=128):
+    """
+    从 (x, y) 开始的容差填充：与种子值相差不超过 tolerance 且 4 连通的像素。
+
+    values 为二维数组，返回的掩码坐标与 values 一致。先在种子周围的窗口内求连通区域，
+    区域碰到窗口边缘 (不是图像边缘) 时把窗口放大 4 倍重新计算，小区域不必处理整帧。
+    """
+    height, width = values.shape
+    if not (0 <= x < width and 0 <= y < height):
+        return None
+    while True:
+        wx0, wy0 = max(x - radius, 0), max(y - radius, 0)
+        wx1, wy1 = min(x + radius + 1, width), min(y + radius + 1, height)
+        x0, y0, mask = component_mask(values[wy0:wy1, wx0:wx1], x - wx0, y - wy0, tolerance)
+        touches = ((wx0 > 0 and x0 == 0) or (wy0 > 0 and y0 == 0) or
+                   (wx1 < width and x0 + mask.shape[1] == wx1 - wx0) or
+                   (wy1 < height and y0 + mask.shape[0] == wy1 - wy0))
+        if not touches:
+            return wx0 + x0, wy0 + y0, mask
+        radius *= 4
+
+
+def channel_phase_mask(pattern, channel):
+    """2x2 拜耳单元中属于通道 channel (R/Gr/Gb/B/G) 的位置"""
+    channels = np.array(cfa_stats_channels(pattern))
+    if channel == "G":
+        return (channels == 1) | (channels == 2)
+    return channels == stats_channel_names.index(channel)
+
+
+def restrict_to_channel(x0, y0, mask, pattern, channel):
+    """只保留掩码中属于拜耳通道 channel 的像素，channel 为 None 时原样返回"""
+    if channel is None or mask is None:
+        return mask
+    phases = channel_phase_mask(pattern, channel)
+    rows = np.arange(y0, y0 + mask.shape[0]) % 2
+    cols = np.arange(x0, x0 + mask.shape[1]) % 2
+    return mask & phases[rows[:, None], cols[None, :]]
+
+
+def bayer_flood_fill_mask(raw_array, pattern, x, y, tolerance, channel=None):
+    """
+    raw 图上的容差填充。
+
+    不同通道的数值不可比较，因此只在一个通道的子平面上比较和连通：不限制通道时用种子像素所在通道，
+    填充整个 2x2 拜耳单元；限制通道时用种子所在单元中该通道的像素，只填充该通道。
+    """
+    height, width = raw_array.shape
+    if not (0 <= x < width and 0 <= y < height):
+        return None
+    dy, dx = y % 2, x % 2
+    if channel is not None:
+        phases = channel_phase_mask(pattern, channel)
+        if not phases[dy, dx]:
+            dy, dx = (int(v) for v in np.argwhere(phases)[0])
+    plane = raw_array[dy::2, dx::2]
+    if x // 2 >= plane.shape[1] or y // 2 >= plane.shape[0]:
+        return None
+    px0, py0, plane_mask = flood_fill_mask(plane, x // 2, y // 2, tolerance)
+    x0, y0 = px0 * 2, py0 * 2
+    mask = np.repeat(np.repeat(plane_mask, 2, axis=0), 2, axis=1)
+    mask = mask[:height - y0, :width - x0]
+    return x0, y0, restrict_to_channel(x0, y0, mask, pattern, channel)
+
+
+def fill_mask(array, x0, y0, mask, value):
+    """把 value (标量或每像素的通道值) 写入 array 中掩码覆盖的像素，mask 需已在数组范围内"""
+    target = array[y0:y0 + mask.shape[0], x0:x0 + mask.shape[1]]
+    target[mask] = value
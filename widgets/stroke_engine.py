@@ -0,0 +1,61 @@
+import time
+
+from PyQt6.QtCore import QObject, QTimer
+
+from . import perf
+
+
+class StrokeEngine(QObject):
+    """
+    笔画引擎。
+
+    鼠标移动时只缓存采样点，由定时器每帧 (默认 16ms) 把这段时间内的采样点连同上一帧的最后一个点
+    一起交给 draw_func 绘制成连续的线段，快速移动时不会出现断点，也不会堆积绘制事件。
+    """
+
+    def __init__(self, draw_func, interval=16, parent=None):
+        super().__init__(parent)
+        self.m_draw_func = draw_func  # draw_func(points)，points 为 [(x, y), ...] 图像坐标
+        self.m_pending = []
+        self.m_pending_time = None  # 当前缓存中最早采样点的时间，用于统计输入到显示的延迟
+        self.m_last_point = None
+        self.m_timer = QTimer(self)
+        self.m_timer.setInterval(interval)
+        self.m_timer.timeout.connect(self.flush)
+
+    def isActive(self):
+        return self.m_timer.isActive()
+
+    def begin(self, point=None):
+        """开始一笔"""
+        self.m_pending = []
+        self.m_last_point = None
+        self.m_timer.start()
+        self.addPoint(point)
+
+    def addPoint(self, point):
+        if point is None or not self.m_timer.isActive():
+            return
+        point = (int(point.x()), int(point.y()))
+        last = self.m_pending[-1] if self.m_pending else self.m_last_point
+        if point != last:
+            if not self.m_pending:
+                self.m_pending_time = time.perf_counter()
+            self.m_pending.append(point)
+
+    def end(self):
+        """结束一笔，绘制剩余的采样点"""
+        if not self.m_timer.isActive():
+            return
+        self.flush()
+        self.m_timer.stop()
+        self.m_last_point = None
+
+    def flush(self):
+        if not self.m_pending:
+            return
+        points = self.m_pending if self.m_last_point is None else [self.m_last_point] + self.m_pending
+        self.m_pending = []
+        self.m_last_point = points[-1]
+        self.m_draw_func(points)
+        perf.mark_input(self.m_pending_time)
@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+from .load_cache import file_key
+
+index_env = "RAW_EDIT_INDEX"
+schema_version = 1
+
+
+def default_index_path():
+    """索引数据库默认放在用户缓存目录，可用环境变量 RAW_EDIT_INDEX 指定"""
+    path = os.environ.get(index_env)
+    if path:
+        return path
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "raw_edit", "thumb_index.sqlite")
+
+
+class ThumbEntry:
+    """索引中的一条记录：文件名解析出的信息和缩略图"""
+    __slots__ = ("path", "size", "mtime_ns", "width", "height", "raw_type", "pattern",
+                 "thumb_width", "thumb_height", "thumb")
+
+    def __init__(self, path, size, mtime_ns, width=None, height=None, raw_type=None, pattern=None,
+                 thumb_width=0, thumb_height=0, thumb=None):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.width = width
+        self.height = height
+        self.raw_type = raw_type
+        self.pattern = pattern
+        self.thumb_width = thumb_width
+        self.thumb_height = thumb_height
+        self.thumb = thumb  # zlib 压缩的 RGB888 数据，未读取或没有缩略图时为 None
+
+    def has_thumb(self):
+        return self.thumb_width > 0
+
+    def thumb_array(self):
+        """缩略图 (高, 宽, 3) uint8 数组，没有缩略图时返回 None"""
+        if not self.thumb:
+            return None
+        data = np.frombuffer(zlib.decompress(self.thumb), dtype=np.uint8)
+        return data.reshape(self.thumb_height, self.thumb_width, 3)
+
+    def info_text(self):
+        if self.raw_type:
+            return f"{self.width}x{self.height} {self.raw_type} {self.pattern}"
+        if self.width:
+            return f"{self.width}x{self.height}"
+        return ""
+
+
+def make_entry(file_path, key, info=None, thumb=None):
+    """由文件名解析结果和缩略图数组生成记录"""
+    info = info or {}
+    entry = ThumbEntry(file_path, key[0], key[1], info.get("width"), info.get("height"),
+                       info.get("raw_type"), info.get("pattern"))
+    if thumb is not None:
+        entry.thumb_height, entry.thumb_width = thumb.shape[:2]
+        entry.thumb = zlib.compress(np.ascontiguousarray(thumb).tobytes(), 6)
+    return entry
+
+
+class ThumbIndex:
+    """
+    持久化的图片信息与缩略图索引，保存在 SQLite 数据库中。
+
+    以路径为键，同时记录文件大小和修改时间，两者任一变化即视为过期，需要重新生成。
+    每个线程使用各自的连接；写入集中在界面线程，按批在一个事务中提交。
+    查询文件列表时不读取缩略图数据，显示到的行再按需用 load_thumbs 读取。
+    """
+    query_chunk = 500
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_index_path()
+        self.local = threading.local()
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.connection().executescript(f"""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                raw_type TEXT,
+                pattern TEXT,
+                thumb_width INTEGER NOT NULL DEFAULT 0,
+                thumb_height INTEGER NOT NULL DEFAULT 0,
+                thumb BLOB
+            );
+            PRAGMA user_version = {schema_version};
+        """)
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def query(self, columns, file_paths):
+        """按路径分批查询，逐行返回"""
+        conn = self.connection()
+        file_paths = list(file_paths)
+        for start in range(0, len(file_paths), self.query_chunk):
+            chunk = file_paths[start:start + self.query_chunk]
+            yield from conn.execute(f"SELECT {columns} FROM files WHERE path IN ({','.join('?' * len(chunk))})",
+                                    chunk)
+
+    def lookup(self, file_paths, keys=None):
+        """
+        查询文件的有效记录 (不含缩略图数据)，返回 {路径: ThumbEntry}，没有记录或已过期的文件不在结果中。
+
+        keys 为 {路径: (大小, 修改时间)}，未给出时逐个 stat。
+        """
+        if keys is None:
+            keys = {file_path: file_key(file_path) for file_path in file_paths}
+        result = {}
+        for row in self.query("path, size, mtime_ns, width, height, raw_type, pattern, thumb_width, thumb_height",
+                              file_paths):
+            if keys.get(row[0]) == (row[1], row[2]):
+                result[row[0]] = ThumbEntry(*row)
+        return result
+
+    def load_thumbs(self, entries):
+        """为 lookup 得到的记录读取缩略图数据"""
+        entries = {entry.path: entry for entry in entries if entry.has_thumb() and entry.thumb is None}
+        for path, mtime_ns, thumb in self.query("path, mtime_ns, thumb", entries):
+            if entries[path].mtime_ns == mtime_ns:
+                entries[path].thumb = thumb
+
+    def store(self, entries):
+        """写入或替换一批记录"""
+        conn = self.connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(e.path, e.size, e.mtime_ns, e.width, e.height, e.raw_type, e.pattern,
+                               e.thumb_width, e.thumb_height, e.thumb) for e in entries])
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
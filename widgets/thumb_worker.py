@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+from PyQt6.QtCore import QObject, QRunnable, Qt, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from .raw_core import parse_image_info, read_raw_thumbnail
+from .raw_process_util import qimage_to_numpy_view
+from .thumb_index import file_key, make_entry
+
+
+def make_thumb_entry(file_path, max_size=96):
+    """解析文件名并生成缩略图，返回 ThumbEntry，文件不存在时返回 None"""
+    key = file_key(file_path)
+    if key is None:
+        return None
+    if os.path.splitext(file_path)[1].lower() != ".raw":
+        img = QImage(file_path)
+        if img.isNull():
+            return make_entry(file_path, key)
+        info = {"width": img.width(), "height": img.height()}
+        img = img.scaled(max_size, max_size, Qt.AspectRatioMode.KeepAspectRatio,
+                         Qt.TransformationMode.SmoothTransformation).convertToFormat(QImage.Format.Format_RGB888)
+        return make_entry(file_path, key, info, np.array(qimage_to_numpy_view(img)))
+    parsed = parse_image_info(os.path.basename(file_path))
+    info = {"width": parsed["width"], "height": parsed["height"], "raw_type": parsed["image_type"],
+            "pattern": parsed["bayer_pattern"].upper() if parsed["bayer_pattern"] else None}
+    # 无法解码的文件也记录下来 (thumb 为 None)，文件不变时不再重复尝试
+    thumb = read_raw_thumbnail(file_path, max_size)
+    return make_entry(file_path, key, info, thumb)
+
+
+class ThumbSignals(QObject):
+    finished = pyqtSignal(object)  # 一批 ThumbEntry 的列表
+
+
+class ThumbWorker(QRunnable):
+    """在线程池中为一批文件生成缩略图，cancel_event 被设置后跳过剩余文件"""
+
+    def __init__(self, file_paths, cancel_event, max_size=96):
+        super().__init__()
+        self.file_paths = file_paths
+        self.cancel_event = cancel_event
+        self.max_size = max_size
+        self.signals = ThumbSignals()
+
+    def run(self):
+        entries = []
+        for file_path in self.file_paths:
+            if self.cancel_event.is_set():
+                break
+            try:
+                entry = make_thumb_entry(file_path, self.max_size)
+            except Exception:
+                entry = None
+            if entry is not None:
+                entries.append(entry)
+        self.signals.finished.emit(entries)
@@ -0,0 +1,241 @@
+import math
+from collections import OrderedDict
+
+from PyQt6.QtCore import QRect, Qt
+from PyQt6.QtGui import QImage, QPainter, QPixmap
+
+
+class TilePyramid:
+    """
+    图像的多分辨率瓦片金字塔。
+
+    第 0 层为原图，第 n 层为原图缩小 2^n 倍，每层切分为 tile_size 大小的瓦片并缓存为 QPixmap。
+    高层瓦片由下一层的 4 个子瓦片合成后缩小得到，整个金字塔的生成代价约为原图的 4/3。
+    缓存按 LRU 淘汰；图像修改后原地刷新已缓存瓦片中被修改的区域，未缓存的瓦片下次绘制时再生成。
+    给出 sample_level(level, x, y, w, h) 时，子瓦片未全部缓存的高层瓦片改由它直接从源数据取样生成，
+    缩小显示时只需生成可见的这一层，不必先生成第 0 层。
+    """
+    tile_size = 256
+
+    def __init__(self, image, prepare_rect=None, cache_bytes=256 * 1024 * 1024, sample_level=None):
+        self.image = image
+        self.prepare_rect = prepare_rect
+        self.sample_level = sample_level
+        self.cache_bytes = cache_bytes
+        self.width = image.width()
+        self.height = image.height()
+        self.max_level = self.top_level(self.width, self.height)
+        self.pixmaps = OrderedDict()  # (level, tx, ty) -> QPixmap
+        self.used_bytes = 0
+
+    def set_image(self, image):
+        """同样大小的图像内容整体改变 (如显示变换参数变化) 后调用，丢弃所有瓦片，之后按需重新生成"""
+        self.image = image
+        self.invalidate()
+
+    @classmethod
+    def top_level(cls, width, height):
+        """width x height 的图像金字塔的最高层，该层缩小到一个瓦片以内"""
+        return max(0, math.ceil(math.log2(max(width, height, 1) / cls.tile_size)))
+
+    @classmethod
+    def scale_level(cls, width, height, scale):
+        """缩放倍数 scale 下显示 width x height 的图像所用的层，选取不小于显示分辨率的最近一层"""
+        if scale >= 1:
+            return 0
+        return min(cls.top_level(width, height), int(math.floor(math.log2(1 / scale))))
+
+    def level_for_scale(self, scale):
+        return self.scale_level(self.width, self.height, scale)
+
+    def level_size(self, level):
+        factor = 1 << level
+        return (self.width + factor - 1) // factor, (self.height + factor - 1) // factor
+
+    def tile_rect(self, level, tx, ty):
+        """瓦片在所在层坐标系下的矩形"""
+        level_width, level_height = self.level_size(level)
+        x, y = tx * self.tile_size, ty * self.tile_size
+        return QRect(x, y, min(self.tile_size, level_width - x), min(self.tile_size, level_height - y))
+
+    def tile_range(self, level, rect):
+        """返回与图像坐标区域 rect 相交的瓦片范围 (tx0, ty0, tx1, ty1)，右下为开区间"""
+        span = self.tile_size << level
+        level_width, level_height = self.level_size(level)
+        tx0 = max(rect.left() // span, 0)
+        ty0 = max(rect.top() // span, 0)
+        tx1 = min(rect.right() // span + 1, (level_width + self.tile_size - 1) // self.tile_size)
+        ty1 = min(rect.bottom() // span + 1, (level_height + self.tile_size - 1) // self.tile_size)
+        return tx0, ty0, tx1, ty1
+
+    def tile(self, level, tx, ty):
+        """获取瓦片，未缓存时生成"""
+        key = (level, tx, ty)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            return pixmap
+        pixmap = self.build_tile(level, tx, ty)
+        self.add_pixmap(key, pixmap)
+        return pixmap
+
+    def add_pixmap(self, key, pixmap):
+        """缓存瓦片，超出缓存大小时淘汰最久未使用的瓦片"""
+        self.pixmaps[key] = pixmap
+        self.used_bytes += self.pixmap_bytes(pixmap)
+        while self.used_bytes > self.cache_bytes and len(self.pixmaps) > 1:
+            _, old = self.pixmaps.popitem(last=False)
+            self.used_bytes -= self.pixmap_bytes(old)
+
+    def build_tile(self, level, tx, ty):
+        rect = self.tile_rect(level, tx, ty)
+        if level == 0:
+            if self.prepare_rect is not None:
+                self.prepare_rect(rect.x(), rect.y(), rect.width(), rect.height())
+            return QPixmap.fromImage(self.image.copy(rect))
+
+        child_width, child_height = self.level_size(level - 1)
+        children = [(2 * tx + i, 2 * ty + j) for j in range(2) for i in range(2)
+                    if (2 * tx + i) * self.tile_size < child_width and (2 * ty + j) * self.tile_size < child_height]
+        if self.sample_level is not None and any((level - 1, cx, cy) not in self.pixmaps for cx, cy in children):
+            return QPixmap.fromImage(self.sample_level(level, rect.x(), rect.y(), rect.width(), rect.height()))
+
+        # 由下一层的 2x2 个子瓦片合成后缩小一半
+        composite_width = min(2 * rect.width(), child_width - 2 * rect.x())
+        composite_height = min(2 * rect.height(), child_height - 2 * rect.y())
+        composite = QImage(composite_width, composite_height, QImage.Format.Format_RGB32)
+        painter = QPainter(composite)
+        for cx, cy in children:
+            painter.drawPixmap((cx - 2 * tx) * self.tile_size, (cy - 2 * ty) * self.tile_size,
+                               self.tile(level - 1, cx, cy))
+        painter.end()
+        scaled = composite.scaled(rect.width(), rect.height(), Qt.AspectRatioMode.IgnoreAspectRatio,
+                                  Qt.TransformationMode.SmoothTransformation)
+        return QPixmap.fromImage(scaled)
+
+    def put_level(self, level, image):
+        """把预先生成的整层图像 (大小为 level_size(level)) 切分为瓦片放入缓存，已缓存的瓦片保留"""
+        level_width, level_height = self.level_size(level)
+        for ty in range((level_height + self.tile_size - 1) // self.tile_size):
+            for tx in range((level_width + self.tile_size - 1) // self.tile_size):
+                key = (level, tx, ty)
+                if key in self.pixmaps:
+                    continue
+                self.add_pixmap(key, QPixmap.fromImage(image.copy(self.tile_rect(level, tx, ty))))
+
+    def level_tile_range(self, level, level_rect):
+        """返回与某层坐标区域 level_rect 相交的瓦片范围 (tx0, ty0, tx1, ty1)，右下为开区间"""
+        level_width, level_height = self.level_size(level)
+        tx0 = max(level_rect.left() // self.tile_size, 0)
+        ty0 = max(level_rect.top() // self.tile_size, 0)
+        tx1 = min(level_rect.right() // self.tile_size + 1, (level_width + self.tile_size - 1) // self.tile_size)
+        ty1 = min(level_rect.bottom() // self.tile_size + 1, (level_height + self.tile_size - 1) // self.tile_size)
+        return tx0, ty0, tx1, ty1
+
+    def region_image(self, level, level_rect):
+        """从已缓存的瓦片拼出某层的一块区域，有瓦片未缓存时返回 None"""
+        region = QImage(level_rect.width(), level_rect.height(), QImage.Format.Format_RGB32)
+        painter = QPainter(region)
+        tx0, ty0, tx1, ty1 = self.level_tile_range(level, level_rect)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                pixmap = self.pixmaps.get((level, tx, ty))
+                if pixmap is None:
+                    painter.end()
+                    return None
+                painter.drawPixmap(tx * self.tile_size - level_rect.x(), ty * self.tile_size - level_rect.y(), pixmap)
+        painter.end()
+        return region
+
+    def patch_tiles(self, level, level_rect, patch):
+        """把 patch 写入与 level_rect 相交的已缓存瓦片，未缓存的瓦片之后按需生成"""
+        tx0, ty0, tx1, ty1 = self.level_tile_range(level, level_rect)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                pixmap = self.pixmaps.get((level, tx, ty))
+                if pixmap is None:
+                    continue
+                painter = QPainter(pixmap)
+                painter.drawImage(level_rect.x() - tx * self.tile_size, level_rect.y() - ty * self.tile_size, patch)
+                painter.end()
+
+    def update_rect(self, rect):
+        """
+        图像在 rect 内被修改后原地刷新已缓存的瓦片，代价与修改区域的大小成正比。
+
+        第 0 层直接从图像取修改后的像素，更高层由下一层对应区域缩小一半得到，
+        与瓦片合成时的缩小方式一致。下一层所需瓦片已被淘汰时，该层及以上相交的瓦片改为失效。
+        """
+        rect = rect.intersected(QRect(0, 0, self.width, self.height))
+        if rect.isEmpty():
+            return
+        if self.prepare_rect is not None:
+            self.prepare_rect(rect.x(), rect.y(), rect.width(), rect.height())
+        level_rect = rect
+        patch = self.image.copy(rect)
+        for level in range(self.max_level + 1):
+            if level > 0:
+                # 对齐到偶数边界，保证缩小一半时与瓦片合成的采样位置一致
+                prev_width, prev_height = self.level_size(level - 1)
+                x0, y0 = level_rect.left() & ~1, level_rect.top() & ~1
+                x1 = min((level_rect.right() + 2) & ~1, prev_width)
+                y1 = min((level_rect.bottom() + 2) & ~1, prev_height)
+                source = self.region_image(level - 1, QRect(x0, y0, x1 - x0, y1 - y0))
+                level_rect = QRect(x0 // 2, y0 // 2, (x1 - x0 + 1) // 2, (y1 - y0 + 1) // 2)
+                if source is None:
+                    self.invalidate(rect, first_level=level)
+                    return
+                patch = source.scaled(level_rect.width(), level_rect.height(),
+                                      Qt.AspectRatioMode.IgnoreAspectRatio,
+                                      Qt.TransformationMode.SmoothTransformation)
+            self.patch_tiles(level, level_rect, patch)
+
+    def invalidate(self, rect=None, first_level=0):
+        """丢弃与图像坐标区域 rect 相交的 first_level 及以上各层瓦片，rect 为空时清空全部"""
+        if rect is None:
+            self.pixmaps.clear()
+            self.used_bytes = 0
+            return
+        for level in range(first_level, self.max_level + 1):
+            tx0, ty0, tx1, ty1 = self.tile_range(level, rect)
+            for ty in range(ty0, ty1):
+                for tx in range(tx0, tx1):
+                    pixmap = self.pixmaps.pop((level, tx, ty), None)
+                    if pixmap is not None:
+                        self.used_bytes -= self.pixmap_bytes(pixmap)
+
+    @staticmethod
+    def pixmap_bytes(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def draw(self, painter, view_rect, offset, scale):
+        """
+        只绘制与可见区域相交的瓦片。
+
+        参数:
+            painter (QPainter): 未做缩放变换的控件画笔
+            view_rect (QRect): 可见的图像坐标区域
+            offset (QPoint): 图像左上角在控件中的位置
+            scale (float): 缩放倍数
+        """
+        view_rect = view_rect.intersected(QRect(0, 0, self.width, self.height))
+        if view_rect.isEmpty():
+            return
+        level = self.level_for_scale(scale)
+        span = self.tile_size << level
+        factor = 1 << level
+        tx0, ty0, tx1, ty1 = self.tile_range(level, view_rect)
+        if self.prepare_rect is not None and (level == 0 or self.sample_level is None) and any(
+                (level, tx, ty) not in self.pixmaps
+                                                 for ty in range(ty0, ty1) for tx in range(tx0, tx1)):
+            # 有瓦片需要生成时一次性准备整个可见区域，源数据可以批量并行转换
+            self.prepare_rect(tx0 * span, ty0 * span, (tx1 - tx0) * span, (ty1 - ty0) * span)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                pixmap = self.tile(level, tx, ty)
+                # 瓦片边界取整到设备像素，避免相邻瓦片之间出现缝隙
+                x0 = offset.x() + round(tx * span * scale)
+                y0 = offset.y() + round(ty * span * scale)
+                x1 = offset.x() + round(min(tx * span + pixmap.width() * factor, self.width) * scale)
+                y1 = offset.y() + round(min(ty * span + pixmap.height() * factor, self.height) * scale)
+                painter.drawPixmap(QRect(x0, y0, x1 - x0, y1 - y0), pixmap)